@@ -0,0 +1,279 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from utils2b import IdentityActivation, NeuralNetwork, integer_one_hot_encode, softmax
+
+N_FEATURES = 784
+N_CLASSES = 10
+
+
+class _ReLU:
+    """
+    ReLU with `out` arguments, so the benchmarks measure the workspace path of `train()`.
+    """
+
+    def __call__(self, x_data, out=None):
+        return np.maximum(x_data, 0, out=out)
+
+    def diff(self, x_data, out=None):
+        if out is None:
+            return (x_data > 0).astype(x_data.dtype)
+        np.greater(x_data, 0, out=out, casting="unsafe")
+        return out
+
+
+@contextlib.contextmanager
+def _limit_blas_threads(n_threads):
+    """
+    Limits the BLAS threads inside the context. `None` keeps the default. Needs the optional `threadpoolctl` package
+    for other values.
+    """
+    if n_threads is None:
+        yield
+        return
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        raise RuntimeError("Limiting the BLAS threads needs the `threadpoolctl` package. ") from None
+    with threadpool_limits(limits=n_threads):
+        yield
+
+
+def _time_calls(function, repeats, warmup):
+    """
+    Calls `function` `warmup` times untimed, then `repeats` times.
+
+    Returns:
+        np.array: [repeats]-shaped array of the seconds of each call.
+    """
+    for _ in range(warmup):
+        function()
+    times = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        times[i] = time.perf_counter() - start
+    return times
+
+
+def _make_cases(batch_size, width, depth, dtype, rng):
+    """
+    Makes the functions to time for one shape and dtype.
+
+    Returns:
+        dict: Dict from benchmark names to functions without arguments.
+    """
+    layer_sizes = [N_FEATURES] + [width] * depth + [N_CLASSES]
+    network = NeuralNetwork(
+        layer_sizes=layer_sizes,
+        activation_functions=[_ReLU() for _ in range(depth)] + [IdentityActivation()],
+        seed=57,
+        dtype=dtype,
+    )
+    network.allocate_workspace(batch_size)  # As in `train()`
+    x_data = rng.random((batch_size, N_FEATURES)).astype(dtype)
+    targets = rng.integers(0, N_CLASSES, size=batch_size)
+    logits = rng.normal(size=(batch_size, N_CLASSES)).astype(dtype)
+
+    preds = network.forward(x_data)
+    deltas = [delta.copy() for delta in network._backprop(preds, targets)]
+
+    return {
+        "forward": lambda: network.forward(x_data),
+        "_backprop": lambda: network._backprop(preds, targets),
+        "_sgd": lambda: network._sgd(deltas, eta=1e-6, n_data=batch_size),
+        "softmax": lambda: softmax(logits),
+        "integer_one_hot_encode": lambda: integer_one_hot_encode(targets, max_int=N_CLASSES - 1),
+    }
+
+
+def run_benchmarks(
+    batch_sizes=(64, 256, 1024),
+    widths=(32, 128, 512),
+    depths=(1, 2),
+    dtypes=("float32", "float64"),
+    blas_threads=(None,),
+    repeats=50,
+    warmup=5,
+    seed=57,
+):
+    """
+    Times `forward()`, `_backprop()` and `_sgd()` of `NeuralNetwork`, `softmax()` and `integer_one_hot_encode()` for
+    every combination of the arguments. The networks have 784 inputs, `depth` hidden ReLU layers of `width` nodes
+    and 10 outputs, and use a workspace as in `train()`. The data is random, drawn from `seed`.
+
+    `softmax()` and `integer_one_hot_encode()` only depend on the batch size and dtype, so they are only timed for
+    the first width and depth.
+
+    Arguments:
+        batch_sizes (iterable of int): The amounts of datapoints per call.
+        widths (iterable of int): The amounts of nodes in each hidden layer.
+        depths (iterable of int): The amounts of hidden layers.
+        dtypes (iterable of str): The dtypes of the networks and data.
+        blas_threads (iterable of int or None): The amounts of BLAS threads, None for the default. Other values
+            need the optional `threadpoolctl` package.
+        repeats (int): The amount of timed calls of each benchmark.
+        warmup (int): The amount of untimed calls before the timed calls.
+        seed (int): Random seed of the data.
+
+    Returns:
+        dict: "metadata" about the machine, and "results", a list with one dict per benchmark with the arguments,
+            "median_seconds", "p95_seconds" and "samples_per_second" (from the median).
+    """
+    results = []
+    widths = list(widths)
+    depths = list(depths)
+    for n_threads, dtype, batch_size, width, depth in itertools.product(
+        blas_threads, dtypes, batch_sizes, widths, depths
+    ):
+        rng = np.random.default_rng(seed=seed)
+        cases = _make_cases(batch_size, width, depth, np.dtype(dtype), rng)
+        if width != widths[0] or depth != depths[0]:
+            cases = {name: function for name, function in cases.items() if name in ["forward", "_backprop", "_sgd"]}
+
+        with _limit_blas_threads(n_threads):
+            for name, function in cases.items():
+                times = _time_calls(function, repeats=repeats, warmup=warmup)
+                median = float(np.median(times))
+                results.append(
+                    {
+                        "name": name,
+                        "batch_size": batch_size,
+                        "width": width,
+                        "depth": depth,
+                        "dtype": dtype,
+                        "blas_threads": n_threads,
+                        "median_seconds": median,
+                        "p95_seconds": float(np.percentile(times, 95)),
+                        "samples_per_second": batch_size / median if median > 0 else float("inf"),
+                    }
+                )
+
+    metadata = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "repeats": repeats,
+        "warmup": warmup,
+        "seed": seed,
+    }
+    return {"metadata": metadata, "results": results}
+
+
+def _result_key(result):
+    return tuple(result[name] for name in ["name", "batch_size", "width", "depth", "dtype", "blas_threads"])
+
+
+def compare_benchmarks(baseline, candidate, threshold=0.1):
+    """
+    Compares two outputs of `run_benchmarks()` by the median time of the benchmarks that are in both.
+
+    Arguments:
+        baseline (dict): The results to compare against.
+        candidate (dict): The new results.
+        threshold (float): A benchmark is a regression if its median is more than `1 + threshold` times the
+            baseline, and an improvement if it is less than `1 / (1 + threshold)` times the baseline.
+
+    Returns:
+        list of dict: One dict per benchmark, with the key fields, "baseline_seconds", "candidate_seconds", "ratio"
+            (candidate / baseline) and "status", which is "regression", "improvement" or "same".
+    """
+    baseline_results = {_result_key(result): result for result in baseline["results"]}
+    comparisons = []
+    for result in candidate["results"]:
+        key = _result_key(result)
+        if key not in baseline_results:
+            continue
+        baseline_seconds = baseline_results[key]["median_seconds"]
+        ratio = result["median_seconds"] / baseline_seconds if baseline_seconds > 0 else float("inf")
+        status = "same"
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        comparison = {name: result[name] for name in ["name", "batch_size", "width", "depth", "dtype", "blas_threads"]}
+        comparison.update(
+            baseline_seconds=baseline_seconds, candidate_seconds=result["median_seconds"], ratio=ratio, status=status
+        )
+        comparisons.append(comparison)
+    return comparisons
+
+
+def _print_results(results):
+    print(f"{'benchmark':>24s} {'batch':>6s} {'width':>6s} {'depth':>5s} {'dtype':>8s} {'threads':>7s} ", end="")
+    print(f"{'median ms':>10s} {'p95 ms':>10s} {'samples/s':>12s}")
+    for result in results:
+        threads = "default" if result["blas_threads"] is None else str(result["blas_threads"])
+        print(f"{result['name']:>24s} {result['batch_size']:6d} {result['width']:6d} {result['depth']:5d} ", end="")
+        print(f"{result['dtype']:>8s} {threads:>7s} {result['median_seconds'] * 1e3:10.4f} ", end="")
+        print(f"{result['p95_seconds'] * 1e3:10.4f} {result['samples_per_second']:12.1f}")
+
+
+def _print_comparisons(comparisons):
+    for comparison in comparisons:
+        if comparison["status"] == "same":
+            continue
+        print(f"{comparison['status'].upper():>11s}: {comparison['name']}, batch {comparison['batch_size']}, ", end="")
+        print(f"width {comparison['width']}, depth {comparison['depth']}, {comparison['dtype']}, ", end="")
+        print(f"threads {comparison['blas_threads']}: {comparison['ratio']:.2f}x the baseline time")
+    n_regressions = sum(comparison["status"] == "regression" for comparison in comparisons)
+    print(f"{n_regressions} regressions in {len(comparisons)} compared benchmarks")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for `NeuralNetwork` in utils2b.py.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and save the results as JSON.")
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[64, 256, 1024])
+    run_parser.add_argument("--widths", type=int, nargs="+", default=[32, 128, 512])
+    run_parser.add_argument("--depths", type=int, nargs="+", default=[1, 2])
+    run_parser.add_argument("--dtypes", nargs="+", default=["float32", "float64"])
+    run_parser.add_argument("--blas-threads", type=int, nargs="+", default=None)
+    run_parser.add_argument("--repeats", type=int, default=50)
+    run_parser.add_argument("--warmup", type=int, default=5)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files, exits with 1 on regressions.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        output = run_benchmarks(
+            batch_sizes=args.batch_sizes,
+            widths=args.widths,
+            depths=args.depths,
+            dtypes=args.dtypes,
+            blas_threads=[None] if args.blas_threads is None else args.blas_threads,
+            repeats=args.repeats,
+            warmup=args.warmup,
+        )
+        _print_results(output["results"])
+        with open(args.output, "w") as outfile:
+            json.dump(output, outfile, indent=2)
+        return 0
+
+    with open(args.baseline) as infile:
+        baseline = json.load(infile)
+    with open(args.candidate) as infile:
+        candidate = json.load(infile)
+    comparisons = compare_benchmarks(baseline, candidate, threshold=args.threshold)
+    _print_comparisons(comparisons)
+    return int(any(comparison["status"] == "regression" for comparison in comparisons))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
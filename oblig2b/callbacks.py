@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class Callback:
+    """
+    Base class for callbacks given to `NeuralNetwork.train(..., callbacks=[...])`. Override the methods to use.
+
+    `train()` is silent by default. Use `ConsoleLogger` to print the progress, and read the metrics from
+    `NeuralNetwork.history` after (or during) training.
+    """
+
+    def on_train_begin(self, network, n_epochs):
+        """
+        Called before the first epoch.
+
+        Arguments:
+            network (NeuralNetwork): The network being trained.
+            n_epochs (int): The largest amount of epochs that will be run.
+        """
+
+    def on_batch_end(self, network, n_batch, n_data):
+        """
+        Called after the parameters are updated for each minibatch. Called in the innermost training loop, so it
+        should be cheap.
+
+        Arguments:
+            network (NeuralNetwork): The network being trained.
+            n_batch (int): The index of the minibatch in the epoch.
+            n_data (int): The amount of datapoints in the minibatch.
+        """
+
+    def on_epoch_end(self, network, n_epoch, record):
+        """
+        Called after each epoch, after evaluation. Set `network.stop_training` to True to stop training after this
+        epoch, which sets `network.stop_reason` to "callback".
+
+        Arguments:
+            network (NeuralNetwork): The network being trained.
+            n_epoch (int): The epoch that was run.
+            record (np.void): The row of `network.history` of the epoch. The losses and accuracies are NaN if the
+                epoch was not evaluated.
+        """
+
+    def on_train_end(self, network):
+        """
+        Called when training ends, also when stopped early. `network.stop_reason` tells why it stopped.
+
+        Arguments:
+            network (NeuralNetwork): The network that was trained.
+        """
+
+
+class ConsoleLogger(Callback):
+    """
+    Prints the epoch number and the losses and accuracies, like `train()` used to do.
+
+    Args:
+        print_every (int): Prints every `print_every` epochs, and the last epoch.
+    """
+
+    def __init__(self, print_every=1):
+        self.print_every = print_every
+
+    def on_train_begin(self, network, n_epochs):
+        self.n_epochs = n_epochs
+
+    def on_epoch_end(self, network, n_epoch, record):
+        if (n_epoch + 1) % self.print_every != 0 and n_epoch != self.n_epochs - 1:
+            return
+        print(f"Epoch number [{n_epoch + 1} / {self.n_epochs}]")
+        if not np.isnan(record["val_loss"]):  # The epoch was evaluated with an eval set
+            print(f"Train-loss: {record['train_loss']:.5f}, ", end="")
+            print(f"Validation-loss: {record['val_loss']:.5f}. ", end="")
+            print(f"Train-accuracy: {record['train_accuracy']:.5f}, ", end="")
+            print(f"Validation-accuracy: {record['val_accuracy']:.5f}")
+
+    def on_train_end(self, network):
+        if network.stop_reason == "patience":
+            print(f"Early stopping, best epoch was {network.best_epoch + 1}")
+        elif network.stop_reason == "callback":
+            print(f"Stopped by a callback after epoch {network.n_epochs_run}")
+        elif network.stop_reason == "time":
+            print("Stopping, the time budget is used")
@@ -0,0 +1,254 @@
+import math
+
+import numpy as np
+
+
+class Optimizer:
+    """
+    Base class for optimizers that update the parameters of `NeuralNetwork`.
+
+    An optimizer is given the list of parameter arrays once in `initialize()`, where it allocates its state
+    (velocities, moment estimates) with the same shapes and dtypes. `step()` then updates the parameters in place
+    from the gradients, using the preallocated state and a scratch buffer per parameter, so no arrays are allocated
+    during training. The state is kept between calls to `NeuralNetwork.train()`. Call `reset()` to forget it.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the state, so the next call to `initialize()` allocates it again.
+        """
+        self.shapes = None
+        self.n_steps = 0
+
+    def initialize(self, parameters):
+        """
+        Allocates the optimizer state for `parameters`. Does nothing if the state is already allocated for parameters
+        of the same shapes.
+
+        Arguments:
+            parameters (list of np.array): The parameters that will be updated. `NeuralNetwork` passes one array,
+                `[self.parameters]`, so each update is one vectorised operation over all weights and biases.
+        """
+        shapes = [parameter.shape for parameter in parameters]
+        if shapes == self.shapes:
+            return
+        self.shapes = shapes
+        self.n_steps = 0
+        self.scratch = [np.empty_like(parameter) for parameter in parameters]
+        self._initialize_state(parameters)
+
+    def _initialize_state(self, parameters):
+        pass
+
+    def step(self, parameters, gradients, eta):
+        """
+        Updates `parameters` in place.
+
+        Arguments:
+            parameters (list of np.array): The parameters given to `initialize()`.
+            gradients (list of np.array): Gradients of the loss with respect to each parameter, averaged over the
+                minibatch. Must have the same shapes as `parameters`.
+            eta (float): Learning rate.
+        """
+        self.n_steps += 1
+        for i, (parameter, gradient) in enumerate(zip(parameters, gradients)):
+            self._update(i, parameter, gradient, eta)
+
+    def _update(self, i, parameter, gradient, eta):
+        raise NotImplementedError
+
+
+class SGD(Optimizer):
+    """
+    Vanilla stochastic gradient descent, p = p - eta * g.
+    """
+
+    def _update(self, i, parameter, gradient, eta):
+        update = np.multiply(gradient, eta, out=self.scratch[i])
+        parameter -= update
+
+
+class Momentum(Optimizer):
+    """
+    SGD with momentum. Keeps a velocity v that accumulates the gradients:
+    v = momentum * v + g
+    p = p - eta * v
+
+    Args:
+        momentum (float): How much of the velocity to keep from the last step. Defaults to 0.9.
+    """
+
+    def __init__(self, momentum=0.9):
+        self.momentum = momentum
+        super().__init__()
+
+    def _initialize_state(self, parameters):
+        self.velocities = [np.zeros_like(parameter) for parameter in parameters]
+
+    def _update(self, i, parameter, gradient, eta):
+        velocity = self.velocities[i]
+        velocity *= self.momentum
+        velocity += gradient
+        update = np.multiply(velocity, eta, out=self.scratch[i])
+        parameter -= update
+
+
+class Nesterov(Momentum):
+    """
+    SGD with Nesterov momentum. Looks ahead along the velocity, without needing the gradient at a second point:
+    v = momentum * v + g
+    p = p - eta * (g + momentum * v)
+
+    Args:
+        momentum (float): How much of the velocity to keep from the last step. Defaults to 0.9.
+    """
+
+    def _update(self, i, parameter, gradient, eta):
+        velocity = self.velocities[i]
+        velocity *= self.momentum
+        velocity += gradient
+        update = np.multiply(velocity, self.momentum, out=self.scratch[i])
+        update += gradient
+        update *= eta
+        parameter -= update
+
+
+class RMSProp(Optimizer):
+    """
+    RMSProp. Divides the gradient by a running average of its squared size:
+    s = rho * s + (1 - rho) * g^2
+    p = p - eta * g / (sqrt(s) + eps)
+
+    Args:
+        rho (float): Decay rate of the running average. Defaults to 0.9.
+        eps (float): Small number to avoid division by zero. Defaults to 1e-8.
+    """
+
+    def __init__(self, rho=0.9, eps=1e-8):
+        self.rho = rho
+        self.eps = eps
+        super().__init__()
+
+    def _initialize_state(self, parameters):
+        self.squares = [np.zeros_like(parameter) for parameter in parameters]
+
+    def _update(self, i, parameter, gradient, eta):
+        square = self.squares[i]
+        scratch = self.scratch[i]
+        np.multiply(gradient, gradient, out=scratch)
+        scratch *= 1 - self.rho
+        square *= self.rho
+        square += scratch
+
+        np.sqrt(square, out=scratch)
+        scratch += self.eps
+        np.divide(gradient, scratch, out=scratch)
+        scratch *= eta
+        parameter -= scratch
+
+
+class Adam(Optimizer):
+    """
+    Adam, https://arxiv.org/abs/1412.6980. Keeps running averages of the gradients (m) and squared gradients (v),
+    and corrects them for being initialized at zero:
+    m = beta1 * m + (1 - beta1) * g
+    v = beta2 * v + (1 - beta2) * g^2
+    p = p - eta * m_hat / (sqrt(v_hat) + eps)
+
+    Args:
+        beta1 (float): Decay rate of the gradient average. Defaults to 0.9.
+        beta2 (float): Decay rate of the squared gradient average. Defaults to 0.999.
+        eps (float): Small number to avoid division by zero. Defaults to 1e-8.
+    """
+
+    def __init__(self, beta1=0.9, beta2=0.999, eps=1e-8):
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+        super().__init__()
+
+    def _initialize_state(self, parameters):
+        self.first_moments = [np.zeros_like(parameter) for parameter in parameters]
+        self.second_moments = [np.zeros_like(parameter) for parameter in parameters]
+
+    def _update(self, i, parameter, gradient, eta):
+        first_moment = self.first_moments[i]
+        second_moment = self.second_moments[i]
+        scratch = self.scratch[i]
+
+        np.multiply(gradient, 1 - self.beta1, out=scratch)
+        first_moment *= self.beta1
+        first_moment += scratch
+
+        np.multiply(gradient, gradient, out=scratch)
+        scratch *= 1 - self.beta2
+        second_moment *= self.beta2
+        second_moment += scratch
+
+        # The bias corrections are folded into the step size and eps, as in section 2 of the paper
+        correction = math.sqrt(1 - self.beta2**self.n_steps)
+        step_size = eta * correction / (1 - self.beta1**self.n_steps)
+        np.sqrt(second_moment, out=scratch)
+        scratch += self.eps * correction
+        np.divide(first_moment, scratch, out=scratch)
+        scratch *= step_size
+        parameter -= scratch
+
+
+class AdamW(Adam):
+    """
+    Adam with decoupled weight decay, https://arxiv.org/abs/1711.05101. Shrinks the parameters with
+    p = p - eta * weight_decay * p before the Adam update. The decay is applied to all parameters, including biases.
+
+    Args:
+        weight_decay (float): Weight decay rate. Defaults to 0.01.
+        beta1 (float): Decay rate of the gradient average. Defaults to 0.9.
+        beta2 (float): Decay rate of the squared gradient average. Defaults to 0.999.
+        eps (float): Small number to avoid division by zero. Defaults to 1e-8.
+    """
+
+    def __init__(self, weight_decay=0.01, beta1=0.9, beta2=0.999, eps=1e-8):
+        self.weight_decay = weight_decay
+        super().__init__(beta1=beta1, beta2=beta2, eps=eps)
+
+    def _update(self, i, parameter, gradient, eta):
+        parameter *= 1 - eta * self.weight_decay
+        super()._update(i, parameter, gradient, eta)
+
+
+OPTIMIZERS = {
+    "sgd": SGD,
+    "momentum": Momentum,
+    "nesterov": Nesterov,
+    "rmsprop": RMSProp,
+    "adam": Adam,
+    "adamw": AdamW,
+}
+
+
+def get_optimizer(optimizer):
+    """
+    Returns an optimizer instance from a name or an instance.
+
+    Arguments:
+        optimizer (str or Optimizer): Name of the optimizer (see `OPTIMIZERS`), which is made with default arguments,
+            or an `Optimizer` instance, which is returned as it is.
+
+    Raises:
+        ValueError: If `optimizer` is a string that is not in `OPTIMIZERS`.
+
+    Returns:
+        Optimizer: The optimizer.
+    """
+    if not isinstance(optimizer, str):
+        return optimizer
+
+    name = optimizer.lower().strip()
+    if name not in OPTIMIZERS:
+        message = f"Argument `optimizer` must be in {list(OPTIMIZERS)}. "
+        message += f"Was {optimizer}. "
+        raise ValueError(message)
+    return OPTIMIZERS[name]()
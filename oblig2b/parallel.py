@@ -0,0 +1,625 @@
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from optimizers import get_optimizer
+from utils2b import (
+    LOSS_GRADIENTS,
+    IndexedArray,
+    MinibatchIterator,
+    NeuralNetwork,
+    _check_integer_targets,
+    _is_positive_integer,
+    _is_sparse,
+    _split_parameters,
+)
+
+# Rows copied at a time into shared memory, so lazy arrays (see `ScaledArray`) are not materialised all at once
+_COPY_CHUNK_SIZE = 4096
+
+
+class _SharedArray:
+    """
+    NumPy array stored in a `multiprocessing.shared_memory` block, so processes can read and write it without copying.
+
+    Args:
+        shape (tuple): Shape of the array.
+        dtype (np.dtype): Dtype of the array.
+        name (str, optional): If None, creates a new block. Else, attaches to the existing block with this name.
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        self.shared_memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shared_memory.buf)
+
+    @property
+    def spec(self):
+        """
+        Picklable `(name, shape, dtype)` tuple, used to attach to the block in another process.
+        """
+        return self.shared_memory.name, self.array.shape, self.array.dtype.str
+
+    def close(self, unlink=False):
+        """
+        Detaches from the block, and frees it if `unlink` is True. Views of `self.array` must not be used afterwards.
+        """
+        del self.array
+        self.shared_memory.close()
+        if unlink:
+            self.shared_memory.unlink()
+
+
+def _copy_rows(destination, source):
+    for start in range(0, destination.shape[0], _COPY_CHUNK_SIZE):
+        stop = start + _COPY_CHUNK_SIZE
+        destination[start:stop] = source[start:stop]
+
+
+def _limit_blas_threads(n_threads):
+    """
+    Limits the threads BLAS uses in this process, so the workers do not oversubscribe the cores. Needs the optional
+    `threadpoolctl` package, and does nothing without it.
+    """
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(limits=n_threads)
+
+
+def _split_key(key, n_shards):
+    """
+    Splits the rows of a minibatch, given as a slice or an array of indices, into `n_shards` contiguous shards.
+    """
+    if isinstance(key, slice):
+        bounds = np.linspace(key.start, key.stop, n_shards + 1).astype(int)
+        return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+    return np.array_split(key, n_shards)
+
+
+# Set by `_initialize_worker()` in each worker process
+_worker_state = {}
+
+
+def _initialize_worker(
+    layer_sizes,
+    activation_functions,
+    dtype,
+    specs,
+    batch_size,
+    blas_threads,
+    optimizer=None,
+    loss_gradient="squared_error",
+    barrier=None,
+):
+    """
+    Attaches a worker process to the shared arrays, and makes a network whose parameters are the shared parameters.
+    If `optimizer` is not None, the network gets its own optimizer, whose state is kept by this process. `barrier` is
+    waited on at the start of every Hogwild epoch, see `_run_hogwild_epoch()`.
+    """
+    _limit_blas_threads(blas_threads)
+    shared = {key: _SharedArray(shape, dtype=dtype_str, name=name) for key, (name, shape, dtype_str) in specs.items()}
+
+    network = NeuralNetwork(layer_sizes, activation_functions, initialization_method="zeros", dtype=dtype)
+    network._set_parameters(shared["parameters"].array)
+    network.loss_gradient = loss_gradient
+    if batch_size is not None:
+        network.allocate_workspace(batch_size)
+    network.optimizer = None if optimizer is None else get_optimizer(optimizer)
+    if network.optimizer is not None:
+        network.optimizer.initialize([network.parameters])
+
+    _worker_state["shared"] = shared  # Keeps the blocks open
+    _worker_state["network"] = network
+    _worker_state["x_train"] = shared["x_train"].array
+    _worker_state["y_train"] = shared["y_train"].array
+    _worker_state["barrier"] = barrier
+    if "gradients" in shared:
+        _worker_state["gradient_views"] = [
+            (gradients, *_split_parameters(gradients, layer_sizes)) for gradients in shared["gradients"].array
+        ]
+
+
+def _compute_shard_gradients(task):
+    """
+    Computes the gradients of one shard of a minibatch into its row of the shared gradient array. The gradients are
+    divided by the size of the whole minibatch, so the sum over the shards is the average over the minibatch.
+    """
+    shard_index, key, n_data = task
+    network = _worker_state["network"]
+    network.gradients, network.d_weights, network.d_biases = _worker_state["gradient_views"][shard_index]
+
+    preds = network.forward(_worker_state["x_train"][key])
+    deltas = network._backprop(preds, _worker_state["y_train"][key])
+    network._compute_gradients(deltas, n_data)
+
+
+def _run_hogwild_epoch(task):
+    """
+    Runs one epoch over one shard of the training data, updating the shared parameters in place without locks.
+
+    Waits on the barrier first, which has one party per shard. A worker can therefore not take a second shard before
+    every shard has started in its own worker, so all the shards run at the same time.
+    """
+    shard, eta, minibatch_size, shuffle, seed = task
+    _worker_state["barrier"].wait()
+    batches = MinibatchIterator(
+        x_data=IndexedArray(_worker_state["x_train"], shard),
+        y_data=IndexedArray(_worker_state["y_train"], shard),
+        batch_size=minibatch_size,
+        shuffle=shuffle,
+        prefetch=False,
+        seed=seed,
+    )
+    _worker_state["network"]._run_single_epoch(batches=batches, eta=eta)
+
+
+class _SharedTraining:
+    """
+    Shared memory blocks and worker pool for training one network in several processes. Copies the training data
+    and the parameters into shared memory, and frees everything again when closed.
+    """
+
+    def __init__(
+        self,
+        network,
+        x_train,
+        y_train,
+        n_workers,
+        start_method,
+        blas_threads,
+        batch_size,
+        n_gradients=0,
+        optimizer=None,
+        use_barrier=False,
+    ):
+        _check_integer_targets(y_train, n_classes=network.layer_sizes[-1])
+        if _is_sparse(x_train):
+            raise ValueError("Sparse `x_train` is not supported, the data is copied into dense shared memory. ")
+        self.shared = {
+            "parameters": _SharedArray(network.parameters.shape, dtype=network.dtype),
+            "x_train": _SharedArray((x_train.shape[0], network.layer_sizes[0]), dtype=network.dtype),
+            "y_train": _SharedArray((len(y_train),), dtype=np.int64),
+        }
+        if n_gradients > 0:
+            self.shared["gradients"] = _SharedArray((n_gradients, network.parameters.size), dtype=network.dtype)
+
+        try:
+            self.parameters = self.shared["parameters"].array
+            self.parameters[...] = network.parameters
+            _copy_rows(self.shared["x_train"].array, x_train)
+            _copy_rows(self.shared["y_train"].array, y_train)
+            self.gradients = self.shared["gradients"].array if n_gradients > 0 else None
+
+            context = multiprocessing.get_context(start_method)
+            specs = {key: shared_array.spec for key, shared_array in self.shared.items()}
+            barrier = context.Barrier(n_workers) if use_barrier else None
+            initargs = (network.layer_sizes, network.activation_functions, network.dtype, specs, batch_size)
+            self.pool = context.Pool(
+                n_workers,
+                initializer=_initialize_worker,
+                initargs=(*initargs, blas_threads, optimizer, network.loss_gradient, barrier),
+            )
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        pool = getattr(self, "pool", None)
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        self.parameters = None
+        self.gradients = None
+        for shared_array in self.shared.values():
+            shared_array.close(unlink=True)
+        self.shared = {}
+
+
+class DataParallelTrainer:
+    """
+    Trains a `NeuralNetwork` with synchronous data parallelism over several processes.
+
+    Every minibatch is split into one shard per worker process. The workers forward and backpropagate their shard,
+    and write the gradients into their own row of a shared memory array. The parent process sums the rows in a fixed
+    order, updates the parameters with `self.network.optimizer` or vanilla SGD (see `NeuralNetwork._apply_gradients()`)
+    and copies them into the shared parameters that the workers read. The updates are the same as in
+    `NeuralNetwork.train()`, except for rounding, and the minibatch order is drawn from `network.seed`, so training is
+    deterministic for a given amount of workers.
+
+    The training data is copied once into shared memory, in the dtype of the network. With the "spawn" and
+    "forkserver" start methods, the activation functions are pickled, so their classes must be importable (not
+    defined in a notebook). Use large minibatches, each shard should have at least a few hundred rows to make up for
+    the time spent synchronising the processes.
+
+    Args:
+        network (NeuralNetwork): The network to train. Its parameters are updated in place.
+        n_workers (int, optional): The amount of worker processes. Defaults to `os.cpu_count()`.
+        start_method (str, optional): "fork", "spawn" or "forkserver", see `multiprocessing.get_context()`. Defaults
+            to the platform default.
+        blas_threads (int): The amount of BLAS threads in each worker, if the optional `threadpoolctl` package is
+            installed.
+    """
+
+    def __init__(self, network, n_workers=None, start_method=None, blas_threads=1):
+        self.network = network
+        self.n_workers = os.cpu_count() if n_workers is None else n_workers
+        if self.n_workers < 1:
+            raise ValueError(f"Argument `n_workers` must be a positive integer. Was {self.n_workers}. ")
+        self.start_method = start_method
+        self.blas_threads = blas_threads
+
+    def train(
+        self,
+        x_train,
+        y_train,
+        eta,
+        n_epochs,
+        loss_func=None,
+        accuracy_func=None,
+        minibatch_size=1024,
+        eval_set=None,
+        shuffle=True,
+        drop_last=False,
+        optimizer=None,
+        eval_every=1,
+        eval_batch_size=4096,
+        loss_gradient="squared_error",
+        callbacks=None,
+    ):
+        """
+        Trains `self.network`. The arguments are as in `NeuralNetwork.train()`, except that the network is only
+        evaluated if both `loss_func` and `accuracy_func` are given. `on_batch_end()` of the callbacks is called after
+        every minibatch.
+
+        Also sets `self.epoch_times`, the seconds spent training in each epoch (without evaluation), and
+        `self.samples_per_second`, the average training throughput.
+        """
+        network = self.network
+        if loss_gradient not in LOSS_GRADIENTS:
+            raise ValueError(f"Argument `loss_gradient` must be in {LOSS_GRADIENTS}. Was {loss_gradient}. ")
+        if not _is_positive_integer(eval_every):
+            raise ValueError(f"Argument `eval_every` must be a positive integer. Was {eval_every}. ")
+        network.loss_gradient = loss_gradient
+        network._allocate_history(n_epochs, use_val=eval_set is not None)
+        self.epoch_times = network.epoch_times
+        callbacks = [] if callbacks is None else list(callbacks)
+
+        network.optimizer = None if optimizer is None else get_optimizer(optimizer)
+        if network.optimizer is not None:
+            network.optimizer.initialize([network.parameters])
+
+        # Only the order of the minibatches is used, the workers gather their rows from shared memory
+        batches = MinibatchIterator(
+            x_data=x_train,
+            y_data=y_train,
+            batch_size=minibatch_size,
+            shuffle=shuffle,
+            drop_last=drop_last,
+            prefetch=False,
+            seed=network._shuffle_seed(),
+        )
+        shard_size = -(-minibatch_size // self.n_workers)
+        training = _SharedTraining(
+            network,
+            x_train,
+            y_train,
+            n_workers=self.n_workers,
+            start_method=self.start_method,
+            blas_threads=self.blas_threads,
+            batch_size=shard_size,
+            n_gradients=self.n_workers,
+        )
+
+        n_samples = 0
+        network.n_epochs_run = 0
+        network.stop_training = False
+        for callback in callbacks:
+            callback.on_train_begin(network, n_epochs)
+        try:
+            for n_epoch in range(n_epochs):
+                start_time = time.perf_counter()
+                for n_batch, key in enumerate(batches._batch_keys()):
+                    n_data = key.stop - key.start if isinstance(key, slice) else len(key)
+                    n_shards = min(self.n_workers, n_data)
+                    tasks = [(i, shard, n_data) for i, shard in enumerate(_split_key(key, n_shards))]
+                    training.pool.map(_compute_shard_gradients, tasks)
+
+                    np.sum(training.gradients[:n_shards], axis=0, out=network.gradients)
+                    network._apply_gradients(eta)
+                    training.parameters[...] = network.parameters
+                    n_samples += n_data
+                    for callback in callbacks:
+                        callback.on_batch_end(network, n_batch, n_data)
+                self.epoch_times[n_epoch] = time.perf_counter() - start_time
+                network.n_epochs_run = n_epoch + 1
+
+                evaluate = (n_epoch + 1) % eval_every == 0 or n_epoch == n_epochs - 1
+                if evaluate and loss_func is not None and accuracy_func is not None:
+                    network._perform_evaluation(
+                        x_train=x_train,
+                        y_train=y_train,
+                        loss_func=loss_func,
+                        accuracy_func=accuracy_func,
+                        n_epoch=n_epoch,
+                        eval_set=eval_set,
+                        eval_batch_size=eval_batch_size,
+                    )
+                for callback in callbacks:
+                    callback.on_epoch_end(network, n_epoch, network.history[n_epoch])
+                if network.stop_training:
+                    break
+        finally:
+            training.close()
+        network.n_epochs_trained += network.n_epochs_run
+        network.stop_reason = "callback" if network.stop_training else None
+        for callback in callbacks:
+            callback.on_train_end(network)
+        epoch_seconds = np.sum(self.epoch_times[: network.n_epochs_run])
+        self.samples_per_second = n_samples / epoch_seconds if n_samples > 0 else 0.0
+
+
+class HogwildTrainer:
+    """
+    Trains a `NeuralNetwork` with asynchronous, lock-free SGD over several processes, as in Hogwild!
+    (https://arxiv.org/abs/1106.5730).
+
+    The parameters are stored in shared memory. The training data is split into one disjoint shard per worker, and
+    every worker runs the same minibatch loop as `NeuralNetwork.train()` over its shard, reading and updating the
+    shared parameters without any locks or synchronisation between the minibatches. A worker can therefore compute
+    its gradient from parameters that another worker is updating at the same time, so the result is not
+    deterministic, but each update is cheap and the workers never wait for each other. The workers are only
+    synchronised after each epoch, when the network is evaluated.
+
+    The shards are drawn once from `network.seed`, and the order inside each shard is drawn again every epoch. Each
+    epoch runs every shard in its own worker process, at the same time. If an optimizer is given, every worker
+    process keeps its own optimizer state, and `network.optimizer` is neither used nor changed. See
+    `DataParallelTrainer` for the requirements on the activation functions.
+
+    Args:
+        network (NeuralNetwork): The network to train. Its parameters are updated in place.
+        n_workers (int, optional): The amount of worker processes. Defaults to `os.cpu_count()`.
+        start_method (str, optional): "fork", "spawn" or "forkserver", see `multiprocessing.get_context()`. Defaults
+            to the platform default.
+        blas_threads (int): The amount of BLAS threads in each worker, if the optional `threadpoolctl` package is
+            installed.
+    """
+
+    def __init__(self, network, n_workers=None, start_method=None, blas_threads=1):
+        self.network = network
+        self.n_workers = os.cpu_count() if n_workers is None else n_workers
+        if self.n_workers < 1:
+            raise ValueError(f"Argument `n_workers` must be a positive integer. Was {self.n_workers}. ")
+        self.start_method = start_method
+        self.blas_threads = blas_threads
+
+    def train(
+        self,
+        x_train,
+        y_train,
+        eta,
+        n_epochs,
+        loss_func=None,
+        accuracy_func=None,
+        minibatch_size=64,
+        eval_set=None,
+        shuffle=True,
+        optimizer=None,
+        eval_every=1,
+        eval_batch_size=4096,
+        loss_gradient="squared_error",
+        callbacks=None,
+    ):
+        """
+        Trains `self.network`. The arguments are as in `NeuralNetwork.train()`, except that the network is only
+        evaluated if both `loss_func` and `accuracy_func` are given, and `minibatch_size` is per worker. The
+        minibatches are run in the workers, so `on_batch_end()` of the callbacks is not called.
+
+        Also sets `self.epoch_times`, the seconds spent training in each epoch (without evaluation), and
+        `self.samples_per_second`, the average training throughput.
+        """
+        network = self.network
+        if loss_gradient not in LOSS_GRADIENTS:
+            raise ValueError(f"Argument `loss_gradient` must be in {LOSS_GRADIENTS}. Was {loss_gradient}. ")
+        if not _is_positive_integer(eval_every):
+            raise ValueError(f"Argument `eval_every` must be a positive integer. Was {eval_every}. ")
+        network.loss_gradient = loss_gradient
+        network._allocate_history(n_epochs, use_val=eval_set is not None)
+        self.epoch_times = network.epoch_times
+        callbacks = [] if callbacks is None else list(callbacks)
+
+        seed_sequence = np.random.SeedSequence(network._shuffle_seed())
+        order = np.random.default_rng(seed_sequence).permutation(len(y_train))
+        shards = [np.sort(shard) for shard in np.array_split(order, self.n_workers) if len(shard) > 0]
+        training = _SharedTraining(
+            network,
+            x_train,
+            y_train,
+            n_workers=len(shards),
+            start_method=self.start_method,
+            blas_threads=self.blas_threads,
+            batch_size=minibatch_size,
+            optimizer=optimizer,
+            use_barrier=True,
+        )
+
+        network.n_epochs_run = 0
+        network.stop_training = False
+        for callback in callbacks:
+            callback.on_train_begin(network, n_epochs)
+        try:
+            for n_epoch in range(n_epochs):
+                seeds = seed_sequence.spawn(len(shards))
+                tasks = [
+                    (shard, eta, minibatch_size, shuffle, int(seed.generate_state(1)[0]))
+                    for shard, seed in zip(shards, seeds)
+                ]
+                start_time = time.perf_counter()
+                results = [training.pool.apply_async(_run_hogwild_epoch, (task,)) for task in tasks]
+                for result in results:
+                    result.get()
+                self.epoch_times[n_epoch] = time.perf_counter() - start_time
+                network.n_epochs_run = n_epoch + 1
+                network.parameters[...] = training.parameters
+
+                evaluate = (n_epoch + 1) % eval_every == 0 or n_epoch == n_epochs - 1
+                if evaluate and loss_func is not None and accuracy_func is not None:
+                    network._perform_evaluation(
+                        x_train=x_train,
+                        y_train=y_train,
+                        loss_func=loss_func,
+                        accuracy_func=accuracy_func,
+                        n_epoch=n_epoch,
+                        eval_set=eval_set,
+                        eval_batch_size=eval_batch_size,
+                    )
+                for callback in callbacks:
+                    callback.on_epoch_end(network, n_epoch, network.history[n_epoch])
+                if network.stop_training:
+                    break
+        finally:
+            training.close()
+        network.n_epochs_trained += network.n_epochs_run
+        network.stop_reason = "callback" if network.stop_training else None
+        for callback in callbacks:
+            callback.on_train_end(network)
+        n_samples = len(y_train) * network.n_epochs_run
+        epoch_seconds = np.sum(self.epoch_times[: network.n_epochs_run])
+        self.samples_per_second = n_samples / epoch_seconds if n_samples > 0 else 0.0
+
+
+def _copy_network(network):
+    copy = NeuralNetwork(
+        network.layer_sizes,
+        network.activation_functions,
+        initialization_method="zeros",
+        seed=network.seed,
+        dtype=network.dtype,
+    )
+    copy.parameters[...] = network.parameters
+    return copy
+
+
+def benchmark_scaling(
+    network,
+    x_train,
+    y_train,
+    n_workers_list=(1, 2, 4, 8),
+    minibatch_size=1024,
+    eta=0.1,
+    n_epochs=1,
+    start_method=None,
+    verbose=False,
+):
+    """
+    Measures how the training throughput of `DataParallelTrainer` scales with the amount of workers. Every run
+    trains a copy of `network` from the same parameters, so `network` is not changed.
+
+    Arguments:
+        network (NeuralNetwork): The network to copy.
+        x_train (np.array): [n x p]-shaped input data of n inputs and p features.
+        y_train (np.array): [n]-shaped array of true targets as integers.
+        n_workers_list (iterable of int): The amounts of workers to measure.
+        minibatch_size (int): Size of the minibatches, which are split between the workers.
+        eta (float): Learning rate.
+        n_epochs (int): The amount of epochs to train each copy for.
+        start_method (str, optional): See `DataParallelTrainer`.
+        verbose (bool): If True, prints the results.
+
+    Returns:
+        list of dict: One dict per amount of workers, with "n_workers", "samples_per_second" and "speedup", which
+            is relative to the first amount of workers in `n_workers_list`.
+    """
+    results = []
+    for n_workers in n_workers_list:
+        trainer = DataParallelTrainer(_copy_network(network), n_workers=n_workers, start_method=start_method)
+        trainer.train(x_train, y_train, eta=eta, n_epochs=n_epochs, minibatch_size=minibatch_size)
+        results.append({"n_workers": n_workers, "samples_per_second": trainer.samples_per_second})
+
+    for result in results:
+        result["speedup"] = result["samples_per_second"] / results[0]["samples_per_second"]
+        if verbose:
+            print(f"Workers: {result['n_workers']:3d}, ", end="")
+            print(f"Samples per second: {result['samples_per_second']:10.1f}, ", end="")
+            print(f"Speedup: {result['speedup']:.2f}")
+    return results
+
+
+def compare_hogwild_with_serial(
+    network,
+    x_train,
+    y_train,
+    eta,
+    n_epochs,
+    loss_func,
+    accuracy_func,
+    n_workers_list=(2, 4, 8),
+    minibatch_size=64,
+    eval_set=None,
+    start_method=None,
+    verbose=False,
+):
+    """
+    Compares the convergence and throughput of `HogwildTrainer` with the single-process `NeuralNetwork.train()`.
+    Every run trains a copy of `network` from the same parameters, so `network` is not changed.
+
+    Arguments:
+        network (NeuralNetwork): The network to copy.
+        x_train (np.array): [n x p]-shaped input data of n inputs and p features.
+        y_train (np.array): [n]-shaped array of true targets as integers.
+        eta (float): Learning rate.
+        n_epochs (int): The amount of epochs to train each copy for.
+        loss_func (callable): Used for calculating loss.
+        accuracy_func (callable): Used for calculating accuracy.
+        n_workers_list (iterable of int): The amounts of Hogwild workers to measure.
+        minibatch_size (int): Size of the minibatches of each worker.
+        eval_set (tuple, optional): `(x_val, y_val)` to evaluate on after every epoch.
+        start_method (str, optional): See `HogwildTrainer`.
+        verbose (bool): If True, prints the throughput and the final loss of every run.
+
+    Returns:
+        list of dict: One dict for the serial run and one per amount of workers, with "mode", "n_workers",
+            "samples_per_second", "train_losses" and "train_accuracies" (one value per epoch), and "val_losses" and
+            "val_accuracies" if `eval_set` is given.
+    """
+
+    def result(mode, n_workers, copy, samples_per_second):
+        entry = {"mode": mode, "n_workers": n_workers, "samples_per_second": samples_per_second}
+        names = ["train_losses", "train_accuracies"]
+        if eval_set is not None:
+            names += ["val_losses", "val_accuracies"]
+        entry.update({name: getattr(copy, name) for name in names})
+        return entry
+
+    copy = _copy_network(network)
+    copy.train(
+        x_train, y_train, eta, n_epochs, loss_func, accuracy_func, minibatch_size=minibatch_size, eval_set=eval_set
+    )
+    results = [result("serial", 1, copy, len(y_train) * n_epochs / np.sum(copy.epoch_times))]
+
+    for n_workers in n_workers_list:
+        copy = _copy_network(network)
+        trainer = HogwildTrainer(copy, n_workers=n_workers, start_method=start_method)
+        trainer.train(
+            x_train,
+            y_train,
+            eta,
+            n_epochs,
+            loss_func,
+            accuracy_func,
+            minibatch_size=minibatch_size,
+            eval_set=eval_set,
+        )
+        results.append(result("hogwild", n_workers, copy, trainer.samples_per_second))
+
+    if verbose:
+        losses, label = ("val_losses", "Validation-loss") if eval_set is not None else ("train_losses", "Train-loss")
+        for entry in results:
+            print(f"{entry['mode']:>8s}, Workers: {entry['n_workers']:3d}, ", end="")
+            print(f"Samples per second: {entry['samples_per_second']:10.1f}, ", end="")
+            print(f"Final {label}: {entry[losses][-1]:.5f}")
+    return results
@@ -0,0 +1,231 @@
+import csv
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+PHASES = ["batch", "forward", "backprop", "update", "evaluation"]
+
+
+def estimate_layer_flops(layer_sizes):
+    """
+    Estimates the floating point operations per datapoint for each layer in one training step, counting a
+    multiply-add as two operations. The matrix multiplications dominate, the activation functions are not counted.
+
+    Per layer with n_in inputs and n_out outputs:
+        forward: 2 * n_in * n_out for the weights, n_out for the bias.
+        backprop: 2 * n_in * n_out + n_in for the delta of the layer before, not for the first layer.
+        gradients: 2 * n_in * n_out for the weights, n_out for the bias.
+
+    Arguments:
+        layer_sizes (list of int): List of the amount of nodes in each layer.
+
+    Returns:
+        np.array: [n_layers - 1]-shaped array of operations per datapoint.
+    """
+    flops = []
+    for index, (n_in, n_out) in enumerate(zip(layer_sizes[:-1], layer_sizes[1:])):
+        forward = 2 * n_in * n_out + n_out
+        backprop = 2 * n_in * n_out + n_in if index > 0 else 0
+        gradients = 2 * n_in * n_out + n_out
+        flops.append(forward + backprop + gradients)
+    return np.array(flops, dtype=np.float64)
+
+
+def estimate_activation_bytes(layer_sizes, batch_size, dtype, checkpoint_every=None):
+    """
+    Estimates the memory of the weighted sums and activations kept for backpropagation in one training step, not
+    counting the input data.
+
+    Without checkpointing, `forward()` keeps z(l) and a(l) of every layer. With `train(..., checkpoint_every=k)`, the
+    weighted sums of every k-th layer are kept as checkpoints, and one segment of k layers is recomputed at a time
+    (see `NeuralNetwork._checkpointed_gradients()`), so the peak is the checkpoints, the largest segment and the
+    logits. `_backprop()` also keeps the deltas of every layer, and checkpointing only one at a time, which is not
+    counted. Use `measure_peak_memory()` to measure the whole step.
+
+    Arguments:
+        layer_sizes (list of int): List of the amount of nodes in each layer.
+        batch_size (int): The amount of datapoints in a (micro-)batch.
+        dtype (np.dtype): Dtype of the network.
+        checkpoint_every (int, optional): The amount of layers per segment, or None for no checkpointing.
+
+    Returns:
+        int: The estimated amount of bytes.
+    """
+    bytes_per_value = np.dtype(dtype).itemsize * batch_size
+    if checkpoint_every is None:
+        return 2 * sum(layer_sizes[1:]) * bytes_per_value
+
+    n_weight_layers = len(layer_sizes) - 1
+    starts = list(range(0, n_weight_layers, checkpoint_every))
+    stops = starts[1:] + [n_weight_layers]
+    checkpoints = sum(layer_sizes[start] for start in starts[1:])
+    # A segment recomputes a(start), and z(l) and a(l) of the layers inside it
+    segments = [
+        (layer_sizes[start] if start > 0 else 0) + 2 * sum(layer_sizes[start + 1 : stop])
+        for start, stop in zip(starts, stops)
+    ]
+    return (checkpoints + max(segments) + layer_sizes[-1]) * bytes_per_value
+
+
+def measure_peak_memory(function):
+    """
+    Calls `function` and measures the peak memory allocated while it runs, with `tracemalloc`, which also traces
+    NumPy's array allocations. For example, to measure one training step:
+
+        measure_peak_memory(lambda: network.train(x_batch, y_batch, eta, 1, loss_func, accuracy_func, ...))
+
+    Arguments:
+        function (callable): Function without arguments.
+
+    Returns:
+        The return value of `function`.
+        int: The peak amount of bytes allocated above what was allocated before the call.
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return result, peak - before
+
+
+class TrainingProfiler:
+    """
+    Opt-in instrumentation of `NeuralNetwork.train()`. Pass an instance as `train(..., profiler=profiler)`.
+
+    Records the wall time of each phase of every epoch: "batch" (waiting for the next minibatch from the batch
+    iterator, which is slicing or gathering rows), "forward", "backprop", "update" (computing the gradients and
+    updating the parameters) and "evaluation". Also records the amount of datapoints, the samples per second and an
+    estimate of the floating point operations per layer (see `estimate_layer_flops()`).
+
+    The history is a structured NumPy array with one row per epoch, allocated when training starts. Epochs that are
+    not run stay zero. It can be saved as CSV with `save_csv()`, and as a trace for Chrome's trace viewer
+    (chrome://tracing, or https://ui.perfetto.dev) with `save_chrome_trace()`.
+
+    Without a profiler, `train()` runs the same loop as before, so there is no overhead unless profiling is on.
+
+    Args:
+        trace_batches (bool): If True, also records one trace event per phase of every minibatch, not only per
+            epoch. Gives a detailed trace, but stores four events per minibatch.
+    """
+
+    def __init__(self, trace_batches=False):
+        self.trace_batches = trace_batches
+        self.history = None
+        self.events = []
+
+    def start(self, network, n_epochs):
+        """
+        Allocates the history for a training run. Called by `train()`.
+
+        Arguments:
+            network (NeuralNetwork): The network being trained.
+            n_epochs (int): The amount of epochs to allocate for.
+        """
+        self.layer_flops_per_sample = estimate_layer_flops(network.layer_sizes)
+        self.update_flops_per_step = 2 * network.count_parameters()
+        fields = [("epoch", np.int64), ("n_samples", np.int64), ("n_steps", np.int64)]
+        fields += [(f"{phase}_seconds", np.float64) for phase in PHASES]
+        fields += [("train_seconds", np.float64), ("samples_per_second", np.float64)]
+        fields += [("flops", np.float64), ("gflops_per_second", np.float64)]
+        fields += [("layer_flops", np.float64, (len(self.layer_flops_per_sample),))]
+        self.history = np.zeros(n_epochs, dtype=fields)
+        self.history["epoch"] = np.arange(n_epochs)
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def start_epoch(self, n_epoch):
+        self.n_epoch = n_epoch
+        self.epoch_start = time.perf_counter()
+
+    def record(self, phase, start, stop):
+        """
+        Adds the time from `start` to `stop`, from `time.perf_counter()`, to `phase` in the current epoch.
+        """
+        self.history[f"{phase}_seconds"][self.n_epoch] += stop - start
+        if self.trace_batches or phase == "evaluation":
+            self._add_event(phase, start, stop)
+
+    def record_step(self, n_data):
+        """
+        Counts one minibatch of `n_data` datapoints in the current epoch.
+        """
+        row = self.history[self.n_epoch]
+        row["n_samples"] += n_data
+        row["n_steps"] += 1
+
+    def end_epoch(self):
+        """
+        Computes the throughput of the current epoch. Called by `train()` after the training part of an epoch, before
+        evaluation.
+        """
+        stop = time.perf_counter()
+        row = self.history[self.n_epoch]
+        row["train_seconds"] = stop - self.epoch_start
+        row["layer_flops"] = self.layer_flops_per_sample * row["n_samples"]
+        row["flops"] = row["layer_flops"].sum() + self.update_flops_per_step * row["n_steps"]
+        if row["train_seconds"] > 0:
+            row["samples_per_second"] = row["n_samples"] / row["train_seconds"]
+            row["gflops_per_second"] = row["flops"] / row["train_seconds"] / 1e9
+        self._add_event(f"Epoch {self.n_epoch + 1}", self.epoch_start, stop, args={"n_samples": int(row["n_samples"])})
+
+    def _add_event(self, name, start, stop, args=None):
+        event = {
+            "name": name,
+            "cat": "train",
+            "ph": "X",  # Complete event, with a start and a duration
+            "ts": (start - self.origin) * 1e6,
+            "dur": (stop - start) * 1e6,
+            "pid": 0,
+            "tid": 0,
+        }
+        if args is not None:
+            event["args"] = args
+        self.events.append(event)
+
+    def save_chrome_trace(self, path):
+        """
+        Saves the trace events as JSON in the Trace Event Format, which Chrome's trace viewer and Perfetto can open.
+
+        Arguments:
+            path (str): Path of the JSON file.
+        """
+        with open(path, "w") as outfile:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, outfile)
+
+    def save_csv(self, path):
+        """
+        Saves the history as CSV with one row per epoch. The per-layer FLOPs are saved as one column per layer.
+
+        Arguments:
+            path (str): Path of the CSV file.
+        """
+        names = [name for name in self.history.dtype.names if name != "layer_flops"]
+        n_layers = self.history["layer_flops"].shape[1]
+        with open(path, "w", newline="") as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(names + [f"layer_flops_{i}" for i in range(n_layers)])
+            for row in self.history:
+                writer.writerow([row[name].item() for name in names] + row["layer_flops"].tolist())
+
+    def print_summary(self):
+        """
+        Prints the total time of each phase and the average throughput.
+        """
+        total = sum(self.history[f"{phase}_seconds"].sum() for phase in PHASES)
+        for phase in PHASES:
+            seconds = self.history[f"{phase}_seconds"].sum()
+            share = seconds / total if total > 0 else 0.0
+            print(f"{phase:>10s}: {seconds:9.4f} s ({share:6.1%})")
+        train_seconds = self.history["train_seconds"].sum()
+        if train_seconds > 0:
+            print(f"Samples per second: {self.history['n_samples'].sum() / train_seconds:.1f}, ", end="")
+            print(f"GFLOP/s: {self.history['flops'].sum() / train_seconds / 1e9:.3f}")
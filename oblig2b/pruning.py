@@ -0,0 +1,315 @@
+import numpy as np
+
+try:
+    import scipy.sparse
+except ImportError:  # Only needed for the sparse layers of `SparseNetwork`
+    scipy = None
+
+from callbacks import Callback
+from parallel import _copy_network
+from quantization import _median_seconds
+from serving import FrozenNetwork, _read_only_copy
+from utils2b import NeuralNetwork, _is_sparse, _iter_row_chunks
+
+
+def _as_layer_list(value, n_layers, name):
+    """
+    Returns `value` as a list with one value per weight matrix, repeating a single value.
+    """
+    if np.ndim(value) == 0:
+        return [value] * n_layers
+    value = list(value)
+    if len(value) != n_layers:
+        message = f"Argument `{name}` must be one value, or one value per weight matrix ({n_layers}). "
+        message += f"Was {value}. "
+        raise ValueError(message)
+    return value
+
+
+def magnitude_masks(network, sparsity, masks=None):
+    """
+    Makes masks that prune the weights with the smallest magnitudes in each layer. The biases are not pruned.
+
+    Arguments:
+        network (NeuralNetwork): The network to make masks for.
+        sparsity (float or list of float): The share of the weights in each layer to prune, in [0, 1]. One value for
+            all the layers, or one value per weight matrix (for example a lower sparsity for the output layer).
+        masks (list of np.array, optional): Masks from an earlier pruning step. Weights that are already pruned stay
+            pruned, even if they have grown since (for example from the momentum of an optimizer).
+
+    Returns:
+        list of np.array: One boolean mask per weight matrix, of the same shape, True for the weights to keep.
+    """
+    sparsities = _as_layer_list(sparsity, len(network.weights), "sparsity")
+    new_masks = []
+    for i, (weights, layer_sparsity) in enumerate(zip(network.weights, sparsities)):
+        if not 0 <= layer_sparsity <= 1:
+            raise ValueError(f"Argument `sparsity` must be in [0, 1]. Was {layer_sparsity}. ")
+        magnitudes = np.abs(weights)
+        if masks is not None:
+            magnitudes = np.where(masks[i], magnitudes, -1)  # Sorted first, so they are pruned first
+        n_prune = int(round(layer_sparsity * weights.size))
+        if masks is not None:
+            n_prune = max(n_prune, weights.size - int(np.count_nonzero(masks[i])))
+        mask = np.ones(weights.shape, dtype=bool)
+        if n_prune > 0:
+            pruned = np.argpartition(magnitudes, n_prune - 1, axis=None)[:n_prune]
+            mask.flat[pruned] = False
+        new_masks.append(mask)
+    return new_masks
+
+
+def apply_masks(network, masks):
+    """
+    Sets the pruned weights to zero, in place in `network.weights`.
+
+    Arguments:
+        network (NeuralNetwork): The network to prune.
+        masks (list of np.array): Masks from `magnitude_masks()`.
+    """
+    for weights, mask in zip(network.weights, masks):
+        np.multiply(weights, mask, out=weights)
+
+
+def weight_density(network):
+    """
+    Returns the share of nonzero weights in each weight matrix, as a list of floats.
+    """
+    return [np.count_nonzero(weights) / weights.size for weights in network.weights]
+
+
+class MagnitudePruning(Callback):
+    """
+    Callback for `NeuralNetwork.train()` that prunes the network gradually while training (iterative magnitude
+    pruning). After every `frequency` epochs from `start_epoch` to `end_epoch`, the smallest weights of each layer
+    are pruned up to the sparsity of the schedule
+
+        sparsity(t) = final_sparsity * (1 - (1 - t)^3),  t = (epoch - start_epoch + 1) / (end_epoch - start_epoch + 1)
+
+    from https://arxiv.org/abs/1710.01878, which prunes fast at first, while there are many redundant weights, and
+    slowly at the end. The rest of the epochs fine-tune the pruned network.
+
+    The masks are applied after every parameter update, so the pruned weights stay zero, and again when training
+    ends, since `restore_best` may restore parameters from before a pruning step.
+
+    Args:
+        final_sparsity (float or list of float): The share of the weights in each layer to prune in the end, see
+            `magnitude_masks()`.
+        start_epoch (int): The first epoch to prune after.
+        end_epoch (int, optional): The last epoch to prune after. Defaults to the last epoch.
+        frequency (int): Prunes every `frequency` epochs.
+        masks (list of np.array, optional): Masks to start from, for example from an earlier training run.
+    """
+
+    def __init__(self, final_sparsity, start_epoch=0, end_epoch=None, frequency=1, masks=None):
+        self.final_sparsity = final_sparsity
+        self.start_epoch = start_epoch
+        self.end_epoch = end_epoch
+        self.frequency = frequency
+        self.masks = masks
+
+    def sparsity_at(self, n_epoch):
+        """
+        Returns the factor of `final_sparsity` to prune to after epoch `n_epoch`.
+        """
+        if n_epoch < self.start_epoch:
+            return 0.0
+        progress = min((n_epoch - self.start_epoch + 1) / (self._end_epoch - self.start_epoch + 1), 1.0)
+        return 1 - (1 - progress) ** 3
+
+    def on_train_begin(self, network, n_epochs):
+        self._end_epoch = n_epochs - 1 if self.end_epoch is None else self.end_epoch
+        if self.masks is not None:
+            apply_masks(network, self.masks)
+
+    def on_batch_end(self, network, n_batch, n_data):
+        if self.masks is not None:
+            apply_masks(network, self.masks)
+
+    def on_epoch_end(self, network, n_epoch, record):
+        if n_epoch < self.start_epoch or n_epoch > self._end_epoch:
+            return
+        if (n_epoch - self.start_epoch) % self.frequency != 0 and n_epoch != self._end_epoch:
+            return  # The last epoch is always pruned, to reach the final sparsity
+        factor = self.sparsity_at(n_epoch)
+        final_sparsities = _as_layer_list(self.final_sparsity, len(network.weights), "final_sparsity")
+        sparsity = [factor * layer_sparsity for layer_sparsity in final_sparsities]
+        self.masks = magnitude_masks(network, sparsity, masks=self.masks)
+        apply_masks(network, self.masks)
+
+    def on_train_end(self, network):
+        if self.masks is not None:
+            apply_masks(network, self.masks)
+
+
+def prune(network, sparsity, n_steps=1, fine_tune_epochs=0, masks=None, **train_kwargs):
+    """
+    Prunes a trained network in place, in `n_steps` steps of increasing sparsity (linear up to `sparsity`). After
+    each step the network is fine-tuned for `fine_tune_epochs` epochs with `train(**train_kwargs)`, with the masks
+    applied after every update. Without fine-tuning, more steps give the same result as one step.
+
+    Arguments:
+        network (NeuralNetwork): The trained network to prune.
+        sparsity (float or list of float): The share of the weights in each layer to prune, see `magnitude_masks()`.
+        n_steps (int): The amount of pruning steps.
+        fine_tune_epochs (int): The amount of epochs to train after each step.
+        masks (list of np.array, optional): Masks from an earlier pruning to start from.
+        train_kwargs: The arguments of `train()` except `n_epochs`, like `x_train`, `y_train`, `eta`, `loss_func`
+            and `accuracy_func`. Only used if `fine_tune_epochs` is positive.
+
+    Returns:
+        list of np.array: The masks, True for the weights that are kept.
+    """
+    sparsities = _as_layer_list(sparsity, len(network.weights), "sparsity")
+    callbacks = list(train_kwargs.pop("callbacks", None) or [])
+    for step in range(1, n_steps + 1):
+        masks = magnitude_masks(network, [value * step / n_steps for value in sparsities], masks=masks)
+        apply_masks(network, masks)
+        if fine_tune_epochs > 0:
+            keep_masks = MagnitudePruning(0.0, masks=masks)  # Only applies the masks
+            network.train(n_epochs=fine_tune_epochs, callbacks=callbacks + [keep_masks], **train_kwargs)
+    return masks
+
+
+class SparseNetwork:
+    """
+    Read-only snapshot of a pruned network for inference, with the sparse layers stored as CSR matrices.
+
+    Layers with a weight density (share of nonzero weights) below `density_threshold` are stored as
+    `scipy.sparse.csr_array` and multiplied with sparse-dense matrix multiplication, the other layers are kept dense.
+    Sparse multiplication only pays off when almost all of the weights are zero, since it does not use BLAS and has
+    to read an index for every weight. For a 784 x 256 layer it was about as fast as dense at 5% density on one core,
+    and faster below, so that is the default. Measure with `pruning_report()` to choose the threshold.
+
+    Like `FrozenNetwork`, nothing is written to `self` when predicting, so one `SparseNetwork` can be used from many
+    threads at once. The sparse layers need the `scipy` package, which is only imported if it is installed.
+
+    Args:
+        network (NeuralNetwork or FrozenNetwork): The pruned network.
+        density_threshold (float): Layers with a lower density than this are stored as CSR.
+    """
+
+    def __init__(self, network, density_threshold=0.05):
+        self.layer_sizes = list(network.layer_sizes)
+        self.n_layers = network.n_layers
+        self.dtype = network.dtype
+        self.activation_functions = list(network.activation_functions)
+        self.density = weight_density(network)
+        self.weights = []
+        for weights, density in zip(network.weights, self.density):
+            if density < density_threshold:
+                if scipy is None:
+                    raise RuntimeError("Storing sparse layers needs the `scipy` package. ")
+                self.weights.append(scipy.sparse.csr_array(weights))
+            else:
+                self.weights.append(_read_only_copy(weights))
+        self.biases = [_read_only_copy(bias) for bias in network.biases]
+
+    def _forward_stateless(self, x_data):
+        """
+        Feeds one batch forward, without storing anything on `self`.
+
+        Arguments:
+            x_data (np.array): [b x m] data to forward.
+
+        Returns:
+            np.array: [b x c] array over logits outputs.
+        """
+        activations = np.asarray(x_data, dtype=self.dtype)
+        for i in range(self.n_layers - 1):
+            weights = self.weights[i]
+            if _is_sparse(weights):
+                weighted_sum = (weights @ activations.T).T  # CSR times dense columns
+            else:
+                weighted_sum = activations @ weights.T
+            weighted_sum += self.biases[i]
+            activations = self.activation_functions[i](weighted_sum)
+        return activations
+
+    def iter_logits(self, x_data, batch_size=1024):
+        """
+        Feeds the data forward in chunks of `batch_size` datapoints, and yields the logits of each chunk. See
+        `NeuralNetwork.iter_logits()`.
+        """
+        for batch in _iter_row_chunks(x_data, batch_size):
+            yield self._forward_stateless(batch)
+
+    def count_bytes(self):
+        """
+        Returns the size of the weights (the values and indices of the CSR matrices) and biases.
+        """
+        n_bytes = sum(bias.nbytes for bias in self.biases)
+        for weights in self.weights:
+            if _is_sparse(weights):
+                n_bytes += weights.data.nbytes + weights.indices.nbytes + weights.indptr.nbytes
+            else:
+                n_bytes += weights.nbytes
+        return int(n_bytes)
+
+    _collect_outputs = NeuralNetwork._collect_outputs
+    predict_logits = NeuralNetwork.predict_logits
+    predict_proba = NeuralNetwork.predict_proba
+    predict = NeuralNetwork.predict
+
+
+def pruning_report(
+    network,
+    x_data,
+    y_data,
+    sparsities=(0.0, 0.5, 0.8, 0.9, 0.95, 0.98),
+    density_threshold=0.05,
+    batch_size=1024,
+    repeats=5,
+    verbose=False,
+    **prune_kwargs,
+):
+    """
+    Prunes copies of `network` to each sparsity, and measures the accuracy and the prediction time of the dense and
+    the sparse inference paths. `network` is not changed.
+
+    Arguments:
+        network (NeuralNetwork): The trained network.
+        x_data (np.array): [n x m]-shaped data to evaluate on, for example the validation data.
+        y_data (np.array): [n]-shaped array of true targets as integers.
+        sparsities (iterable of float): The sparsities to prune to, see `magnitude_masks()`.
+        density_threshold (float): See `SparseNetwork`.
+        batch_size (int): The amount of datapoints to forward at once.
+        repeats (int): The amount of timed predictions of each network. The median is reported.
+        verbose (bool): If True, prints the report with `print_pruning_report()`.
+        prune_kwargs: Other arguments of `prune()`, for example `fine_tune_epochs` and the arguments of `train()`.
+
+    Returns:
+        list of dict: One dict per sparsity, with "sparsity", "density" (per layer), "accuracy", "dense_bytes",
+            "sparse_bytes", "dense_seconds" and "sparse_seconds" (median time to predict `x_data`).
+    """
+    y_data = np.asarray(y_data)
+    report = []
+    for sparsity in sparsities:
+        pruned = _copy_network(network)
+        prune(pruned, sparsity, **prune_kwargs)
+        dense = FrozenNetwork(pruned)
+        sparse = SparseNetwork(pruned, density_threshold=density_threshold)
+        report.append(
+            {
+                "sparsity": sparsity,
+                "density": sparse.density,
+                "accuracy": float(np.mean(sparse.predict(x_data, batch_size=batch_size) == y_data)),
+                "dense_bytes": int(dense.parameters.nbytes),
+                "sparse_bytes": sparse.count_bytes(),
+                "dense_seconds": _median_seconds(lambda: dense.predict(x_data, batch_size=batch_size), repeats),
+                "sparse_seconds": _median_seconds(lambda: sparse.predict(x_data, batch_size=batch_size), repeats),
+            }
+        )
+    if verbose:
+        print_pruning_report(report)
+    return report
+
+
+def print_pruning_report(report):
+    """
+    Prints the output of `pruning_report()` as a table.
+    """
+    print(f"{'sparsity':>8s} {'accuracy':>8s} {'dense kB':>9s} {'sparse kB':>9s} {'dense ms':>9s} {'sparse ms':>9s}")
+    for row in report:
+        print(f"{row['sparsity']:8.2f} {row['accuracy']:8.4f} {row['dense_bytes'] / 1e3:9.1f} ", end="")
+        print(f"{row['sparse_bytes'] / 1e3:9.1f} {row['dense_seconds'] * 1e3:9.3f} {row['sparse_seconds'] * 1e3:9.3f}")
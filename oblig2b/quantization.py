@@ -0,0 +1,252 @@
+import time
+
+import numpy as np
+
+from serving import FrozenNetwork, _read_only_copy
+from utils2b import NeuralNetwork, _iter_row_chunks
+
+INT8_MAX = 127
+
+
+def _quantize(x_data, scale, out=None):
+    """
+    Symmetric quantization to int8, `round(x / scale)` clipped to [-127, 127].
+
+    Arguments:
+        x_data (np.array): Array to quantize.
+        scale (float or np.array): Scale(s), broadcast against `x_data`.
+        out (np.array, optional): Float array of the same shape as `x_data` to compute in.
+
+    Returns:
+        np.array: int8 array of the same shape as `x_data`.
+    """
+    scaled = np.divide(x_data, scale, out=out)
+    np.rint(scaled, out=scaled)
+    np.clip(scaled, -INT8_MAX, INT8_MAX, out=scaled)
+    return scaled.astype(np.int8)
+
+
+def _scale_from_max(max_abs):
+    """
+    Scales that map `max_abs` to 127. Zeros (all-zero rows or activations) get the scale 1, so nothing is divided by
+    zero.
+    """
+    max_abs = np.asarray(max_abs, dtype=np.float64)
+    return np.where(max_abs > 0, max_abs / INT8_MAX, 1.0)
+
+
+def _accumulation_dtype(n_inputs):
+    """
+    The float dtype that sums `n_inputs` products of int8 values exactly. Every partial sum is an integer of at most
+    `n_inputs * 127 * 127`, which float32 represents exactly up to 2**24 (1040 inputs) and float64 up to 2**53.
+    """
+    if n_inputs * INT8_MAX * INT8_MAX <= 2**24:
+        return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+
+class QuantizedNetwork:
+    """
+    Read-only int8 snapshot of a trained `NeuralNetwork` for inference (post-training quantization).
+
+    The weights of each layer are stored as int8 with one float scale per row (output node), so each row uses the
+    full int8 range. The inputs to each layer are quantized to int8 with one scale per layer, calibrated as the
+    largest absolute value (or the `percentile` of the absolute values, the largest over the calibration batches) seen
+    when forwarding `x_calibration` through the float network. Each layer computes
+
+        z = (a_q @ w_q.T) * (input_scale * weight_scales) + b
+
+    where `a_q @ w_q.T` is accumulated exactly as integers, and the biases and activation functions stay float. The
+    biases and the weight scales are stored as float32.
+
+    A layer with m inputs and k outputs takes k * (m + 8) bytes: the int8 weights, and one float32 scale and one
+    float32 bias per output. That is 8 * (m + 1) / (m + 8) times smaller than float64 (half that against float32), so
+    the compression only comes close to 8x for wide layers: about 7.9x for 784 inputs, 6.6x for 32 and 4.9x for 10.
+
+    NumPy has no fast int8 matrix multiplication (integer `np.matmul` does not use BLAS, and is many times slower
+    than float), so by default the int8 values are multiplied as float32 with BLAS. Every partial sum is an integer
+    small enough to be exact in float32 (or float64 for layers with more than 1040 inputs, see
+    `_accumulation_dtype()`), so the result is the same as int32 accumulation. Pass `integer_matmul=True` to
+    accumulate with `np.matmul(..., dtype=np.int32)` instead.
+
+    Like `FrozenNetwork`, nothing is written to `self` when predicting, so one `QuantizedNetwork` can be used from
+    many threads at once, for example behind a `MicroBatcher`.
+
+    Args:
+        network (NeuralNetwork or FrozenNetwork): The trained network to quantize.
+        x_calibration (np.array): [k x m]-shaped data to calibrate the activation scales on, for example a slice of
+            the validation data.
+        percentile (float): Percentile of the absolute activations to use as the largest value of each layer. 100
+            uses the largest value, lower values clip outliers to get a finer scale for the rest.
+        integer_matmul (bool): If True, accumulates with NumPy's int32 matrix multiplication instead of exact float
+            BLAS. Gives the same result, slower.
+        batch_size (int): The amount of datapoints to forward at once when calibrating.
+    """
+
+    def __init__(self, network, x_calibration, percentile=100.0, integer_matmul=False, batch_size=1024):
+        self.layer_sizes = list(network.layer_sizes)
+        self.n_layers = network.n_layers
+        self.dtype = network.dtype
+        self.activation_functions = list(network.activation_functions)
+        self.integer_matmul = integer_matmul
+        self.report = None  # Set by `quantize_network()`
+
+        weight_scales = []
+        quantized_weights = []
+        for weights in network.weights:
+            scales = _scale_from_max(np.max(np.abs(weights), axis=1))
+            weight_scales.append(_read_only_copy(scales.astype(np.float32)))
+            quantized_weights.append(_read_only_copy(_quantize(weights, scales[:, None])))
+        self.weight_scales = weight_scales
+        self.quantized_weights = quantized_weights
+        self.biases = [_read_only_copy(bias.astype(np.float32)) for bias in network.biases]
+        self.input_scales = _read_only_copy(
+            self._calibrate(network, x_calibration, percentile=percentile, batch_size=batch_size)
+        )
+
+    def _calibrate(self, network, x_calibration, percentile, batch_size):
+        """
+        Forwards `x_calibration` through the float network, and returns the scale of the inputs to each layer.
+
+        Returns:
+            np.array: [n_layers - 1]-shaped array of the scales.
+        """
+        if x_calibration.shape[0] == 0:
+            raise ValueError("Argument `x_calibration` must contain at least one datapoint. ")
+        max_abs = np.zeros(self.n_layers - 1)
+        for start in range(0, x_calibration.shape[0], batch_size):
+            activations = np.asarray(x_calibration[start : start + batch_size], dtype=self.dtype)
+            for i in range(self.n_layers - 1):
+                max_abs[i] = max(max_abs[i], np.percentile(np.abs(activations), percentile))
+                weighted_sum = activations @ network.weights[i].T + network.biases[i]
+                activations = network.activation_functions[i](weighted_sum)
+        return _scale_from_max(max_abs)
+
+    def _matmul_weights(self):
+        """
+        Returns the weights to multiply with: the int8 weights, or float copies of them for exact BLAS accumulation
+        (see `_accumulation_dtype()`). The copies are made once per prediction, not stored.
+        """
+        if self.integer_matmul:
+            return self.quantized_weights
+        return [
+            weights.astype(_accumulation_dtype(n_inputs))
+            for weights, n_inputs in zip(self.quantized_weights, self.layer_sizes[:-1])
+        ]
+
+    def _forward_stateless(self, x_data, matmul_weights):
+        """
+        Feeds one batch forward through the quantized layers, without storing anything on `self`.
+
+        Arguments:
+            x_data (np.array): [b x m] data to forward.
+            matmul_weights (list of np.array): The weights from `_matmul_weights()`.
+
+        Returns:
+            np.array: [b x c] array over logits outputs.
+        """
+        activations = np.asarray(x_data, dtype=self.dtype)
+        for i in range(self.n_layers - 1):
+            quantized = _quantize(activations, self.input_scales[i])
+            if self.integer_matmul:
+                accumulated = np.matmul(quantized, matmul_weights[i].T, dtype=np.int32)
+            else:
+                accumulated = quantized.astype(matmul_weights[i].dtype) @ matmul_weights[i].T
+            output_scales = (self.input_scales[i] * self.weight_scales[i]).astype(self.dtype)
+            weighted_sum = np.multiply(accumulated, output_scales, dtype=self.dtype)
+            weighted_sum += self.biases[i]
+            activations = self.activation_functions[i](weighted_sum)
+        return activations
+
+    def iter_logits(self, x_data, batch_size=1024):
+        """
+        Feeds the data forward in chunks of `batch_size` datapoints, and yields the logits of each chunk. See
+        `NeuralNetwork.iter_logits()`.
+        """
+        matmul_weights = self._matmul_weights()
+        for batch in _iter_row_chunks(x_data, batch_size):
+            yield self._forward_stateless(batch, matmul_weights)
+
+    def count_bytes(self):
+        """
+        Returns the size of the quantized model: the int8 weights, the scales and the float32 biases.
+        """
+        arrays = self.quantized_weights + self.weight_scales + self.biases + [self.input_scales]
+        return int(sum(array.nbytes for array in arrays))
+
+    _collect_outputs = NeuralNetwork._collect_outputs
+    predict_logits = NeuralNetwork.predict_logits
+    predict_proba = NeuralNetwork.predict_proba
+    predict = NeuralNetwork.predict
+
+
+def _median_seconds(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def quantization_report(network, quantized, x_data, y_data, batch_size=1024, repeats=5):
+    """
+    Compares a quantized network with the float network it was made from.
+
+    Arguments:
+        network (NeuralNetwork or FrozenNetwork): The float network.
+        quantized (QuantizedNetwork): The quantized network.
+        x_data (np.array): [n x m]-shaped data to compare on, for example the validation data.
+        y_data (np.array): [n]-shaped array of true targets as integers.
+        batch_size (int): The amount of datapoints to forward at once.
+        repeats (int): The amount of timed predictions of each network. The median is reported.
+
+    Returns:
+        dict: "float_accuracy", "quantized_accuracy", "accuracy_delta" (quantized - float), "agreement" (the share of
+            datapoints where the predicted classes are the same), "float_bytes", "quantized_bytes", "compression"
+            (float / quantized bytes), "float_seconds" and "quantized_seconds" (median time to predict `x_data`).
+    """
+    y_data = np.asarray(y_data)
+    float_preds = network.predict(x_data, batch_size=batch_size)
+    quantized_preds = quantized.predict(x_data, batch_size=batch_size)
+    float_accuracy = float(np.mean(float_preds == y_data))
+    quantized_accuracy = float(np.mean(quantized_preds == y_data))
+    float_bytes = int(network.parameters.nbytes)
+    quantized_bytes = quantized.count_bytes()
+    return {
+        "float_accuracy": float_accuracy,
+        "quantized_accuracy": quantized_accuracy,
+        "accuracy_delta": quantized_accuracy - float_accuracy,
+        "agreement": float(np.mean(float_preds == quantized_preds)),
+        "float_bytes": float_bytes,
+        "quantized_bytes": quantized_bytes,
+        "compression": float_bytes / quantized_bytes,
+        "float_seconds": _median_seconds(lambda: network.predict(x_data, batch_size=batch_size), repeats),
+        "quantized_seconds": _median_seconds(lambda: quantized.predict(x_data, batch_size=batch_size), repeats),
+    }
+
+
+def quantize_network(network, x_val, y_val=None, n_calibration=1000, percentile=100.0, integer_matmul=False):
+    """
+    Quantizes a trained network to int8, calibrated on the first `n_calibration` datapoints of `x_val`. If `y_val` is
+    given, the quantized network is compared with the float network on all of `(x_val, y_val)`, and the result of
+    `quantization_report()` is stored as `quantized.report` (otherwise it is None).
+
+    Arguments:
+        network (NeuralNetwork or FrozenNetwork): The trained network to quantize. A `NeuralNetwork` is frozen first,
+            so training it further does not change the quantized network or the report.
+        x_val (np.array): [n x m]-shaped validation data.
+        y_val (np.array, optional): [n]-shaped array of true targets as integers.
+        n_calibration (int): The amount of datapoints to calibrate on.
+        percentile (float): See `QuantizedNetwork`.
+        integer_matmul (bool): See `QuantizedNetwork`.
+
+    Returns:
+        QuantizedNetwork: The quantized network.
+    """
+    if isinstance(network, NeuralNetwork):
+        network = FrozenNetwork(network)
+    quantized = QuantizedNetwork(network, x_val[:n_calibration], percentile=percentile, integer_matmul=integer_matmul)
+    if y_val is not None:
+        quantized.report = quantization_report(network, quantized, x_val, y_val)
+    return quantized
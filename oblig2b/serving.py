@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from utils2b import NeuralNetwork, _is_positive_integer, _split_parameters
+
+
+def _read_only_copy(array):
+    copy = np.array(array, copy=True)
+    copy.setflags(write=False)
+    return copy
+
+
+class FrozenNetwork:
+    """
+    Read-only snapshot of a trained `NeuralNetwork` for inference.
+
+    The flat parameter array is copied and marked read-only, so training the original network further does not
+    change the snapshot. The prediction methods only read the parameters and allocate their own buffers for every
+    call, so one `FrozenNetwork` can be used from many threads at once. The activation functions are shared with
+    the original network, and must not store any state when they are called.
+
+    Args:
+        network (NeuralNetwork): The trained network to freeze.
+    """
+
+    def __init__(self, network):
+        self.layer_sizes = list(network.layer_sizes)
+        self.n_layers = network.n_layers
+        self.dtype = network.dtype
+        self.activation_functions = list(network.activation_functions)
+        self.parameters = _read_only_copy(network.parameters)
+        self.weights, self.biases = _split_parameters(self.parameters, self.layer_sizes)
+
+    # These methods of NeuralNetwork only read the attributes set above, and nothing they write is stored on `self`
+    _forward_stateless = NeuralNetwork._forward_stateless
+    _collect_outputs = NeuralNetwork._collect_outputs
+    iter_logits = NeuralNetwork.iter_logits
+    predict_logits = NeuralNetwork.predict_logits
+    predict_proba = NeuralNetwork.predict_proba
+    predict = NeuralNetwork.predict
+
+
+class _Request:
+    def __init__(self, rows, single_row):
+        self.rows = rows
+        self.single_row = single_row
+        self.future = Future()
+        self.arrival_time = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Serves predictions for many concurrent callers by coalescing their requests into batches.
+
+    Callers `submit()` one row (or a few rows) and get a `Future`. Worker threads take the first waiting request,
+    keep collecting requests until `max_batch_size` rows are collected or `max_latency` seconds have passed since
+    that request was submitted, and run the collected rows through the model as one batch, so the matrix
+    multiplications are done on many rows at once instead of one by one.
+
+    Use as a context manager, or call `close()` when done:
+
+        with MicroBatcher(FrozenNetwork(neural_network)) as batcher:
+            probabilities = batcher.predict_proba(x_row)
+
+    Args:
+        model (FrozenNetwork): Model with a thread-safe `predict_proba()`.
+        max_batch_size (int): The largest amount of rows to forward at once.
+        max_latency (float): The longest time in seconds to wait for more requests after the first request of a
+            batch was submitted. A request that already waited in the queue that long is forwarded right away.
+        n_workers (int): The amount of worker threads forwarding batches. NumPy releases the GIL in the matrix
+            multiplications, so more than one worker can keep more cores busy.
+    """
+
+    def __init__(self, model, max_batch_size=256, max_latency=0.002, n_workers=1):
+        if not _is_positive_integer(max_batch_size):
+            raise ValueError(f"Argument `max_batch_size` must be a positive integer. Was {max_batch_size}. ")
+        if not _is_positive_integer(n_workers):
+            raise ValueError(f"Argument `n_workers` must be a positive integer. Was {n_workers}. ")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self._requests = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()  # Held while checking `_closed` and queueing, so no request is behind a stop
+        self._workers = [threading.Thread(target=self._serve, daemon=True) for _ in range(n_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, x_data):
+        """
+        Queues rows for prediction.
+
+        Arguments:
+            x_data (np.array): [m]-shaped single row or [k x m]-shaped rows to predict on.
+
+        Raises:
+            RuntimeError: If the batcher is closed.
+
+        Returns:
+            Future: Future of the [c] or [k x c]-shaped probabilities, matching the shape of `x_data`.
+        """
+        x_data = np.asarray(x_data)
+        request = _Request(rows=np.atleast_2d(x_data), single_row=x_data.ndim == 1)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed `MicroBatcher`. ")
+            self._requests.put(request)
+        return request.future
+
+    def predict_proba(self, x_data, timeout=None):
+        """
+        Submits rows and waits for the probabilities. See `submit()`.
+        """
+        return self.submit(x_data).result(timeout=timeout)
+
+    def predict(self, x_data, timeout=None):
+        """
+        Submits rows and waits for the predicted classes. See `submit()`.
+        """
+        return np.argmax(self.predict_proba(x_data, timeout=timeout), axis=-1)
+
+    def close(self):
+        """
+        Finishes the requests that are already submitted, and stops the worker threads.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for _ in self._workers:
+                self._requests.put(None)  # One stop signal per worker
+        for worker in self._workers:
+            worker.join()
+
+    def _serve(self):
+        """
+        Worker loop, collects requests into batches and forwards them until a stop signal is received.
+        """
+        stop = False
+        while not stop:
+            request = self._requests.get()
+            if request is None:
+                return
+
+            batch = [request]
+            n_rows = request.rows.shape[0]
+            deadline = request.arrival_time + self.max_latency
+            while n_rows < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:  # Forward what is collected first
+                    stop = True
+                    break
+                batch.append(request)
+                n_rows += request.rows.shape[0]
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        """
+        Forwards the rows of all the requests in `batch` at once, and sets the result of each request.
+        """
+        try:
+            probabilities = self.model.predict_proba(np.concatenate([request.rows for request in batch]))
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        start = 0
+        for request in batch:
+            stop = start + request.rows.shape[0]
+            result = probabilities[start:stop]
+            request.future.set_result(result[0] if request.single_row else result)
+            start = stop
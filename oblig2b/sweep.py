@@ -0,0 +1,409 @@
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from parallel import _limit_blas_threads
+from utils2b import IdentityActivation, NeuralNetwork
+
+# Config keys used to build the network. The other keys are passed to `train()` as keyword arguments
+_NETWORK_KEYS = ["layer_sizes", "activation", "seed", "dtype"]
+
+
+class Uniform:
+    """
+    Uniform distribution over [low, high), for `Sweep.random()`.
+    """
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng):
+        return float(rng.uniform(self.low, self.high))
+
+
+class LogUniform(Uniform):
+    """
+    Log-uniform distribution over [low, high), for `Sweep.random()`. Good for learning rates.
+    """
+
+    def sample(self, rng):
+        return float(np.exp(rng.uniform(np.log(self.low), np.log(self.high))))
+
+
+def _sample_config(space, rng):
+    config = {}
+    for name, values in space.items():
+        if hasattr(values, "sample"):
+            config[name] = values.sample(rng)
+        else:
+            config[name] = values[rng.integers(len(values))]
+    return config
+
+
+def _json_default(value):
+    """
+    Converts config values that `json` cannot write: NumPy scalars and arrays to Python values, and anything else,
+    like an optimizer instance, to its `repr()`.
+    """
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    return repr(value)
+
+
+def _trial_key(config, n_epochs, start_epochs=0):
+    payload = {"config": config, "n_epochs": n_epochs}
+    if start_epochs > 0:  # Continued from a trial of `start_epochs` epochs, see `Sweep.run()`
+        payload["start_epochs"] = start_epochs
+    payload = json.dumps(payload, sort_keys=True, default=_json_default)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def _network_path(checkpoint_dir, key):
+    return os.path.join(checkpoint_dir, f"{key}.bin")
+
+
+# Set by `_initialize_trial_worker()` in each worker process
+_trial_state = {}
+
+
+def _initialize_trial_worker(x_train, y_train, eval_set, loss_func, accuracy_func, activation_classes, blas_threads):
+    _limit_blas_threads(blas_threads)
+    _trial_state.update(
+        x_train=x_train,
+        y_train=y_train,
+        eval_set=eval_set,
+        loss_func=loss_func,
+        accuracy_func=accuracy_func,
+        activation_classes=activation_classes,
+    )
+
+
+def _run_trial(trial):
+    """
+    Trains one network for `trial["n_epochs"]` epochs, and returns the log record of the trial. If the trial has a
+    "previous" record, the network saved by that trial is loaded and trained for the remaining epochs, and the
+    histories are appended to the previous ones. Otherwise a new network is trained from scratch. If the trial has a
+    "checkpoint_dir", the trained network is saved there, so a later trial can continue from it.
+    """
+    config = trial["config"]
+    layer_sizes = config["layer_sizes"]
+    activation = _trial_state["activation_classes"][config.get("activation", "relu")]
+    activation_functions = [activation() for _ in layer_sizes[2:]] + [IdentityActivation()]
+    previous = trial.get("previous")
+    if previous is None:
+        network = NeuralNetwork(
+            layer_sizes=layer_sizes,
+            activation_functions=activation_functions,
+            seed=config.get("seed", 57),
+            dtype=np.dtype(config.get("dtype", "float64")),
+        )
+        start_epochs = 0
+    else:
+        path = _network_path(trial["checkpoint_dir"], previous["key"])
+        network = NeuralNetwork.load(path, activation_functions=activation_functions, mmap_mode=None)
+        start_epochs = previous["n_epochs"]
+    train_kwargs = {name: value for name, value in config.items() if name not in _NETWORK_KEYS}
+
+    start_time = time.perf_counter()
+    network.train(
+        x_train=_trial_state["x_train"],
+        y_train=_trial_state["y_train"],
+        n_epochs=trial["n_epochs"] - start_epochs,
+        loss_func=_trial_state["loss_func"],
+        accuracy_func=_trial_state["accuracy_func"],
+        eval_set=_trial_state["eval_set"],
+        **train_kwargs,
+    )
+    if trial.get("checkpoint_dir") is not None:
+        network.save(_network_path(trial["checkpoint_dir"], trial["key"]))
+
+    record = {
+        "key": trial["key"],
+        "config": config,
+        "n_epochs": trial["n_epochs"],
+        "train_losses": network.train_losses.tolist(),
+        "train_accuracies": network.train_accuracies.tolist(),
+        "val_losses": network.val_losses.tolist(),
+        "val_accuracies": network.val_accuracies.tolist(),
+        "seconds": time.perf_counter() - start_time,
+    }
+    if previous is not None:
+        record["previous_key"] = previous["key"]
+        for name in ["train_losses", "train_accuracies", "val_losses", "val_accuracies"]:
+            record[name] = previous[name] + record[name]
+        record["seconds"] += previous["seconds"]
+    val_losses = np.asarray(record["val_losses"], dtype=np.float64)
+    # A trial without any evaluated (or finite) validation loss ranks last
+    record["score"] = float(np.nanmin(val_losses)) if np.any(~np.isnan(val_losses)) else float("inf")
+    return record
+
+
+class Sweep:
+    """
+    Hyperparameter search over `NeuralNetwork.train()`, running the trials in a process pool.
+
+    A config is a dict with "layer_sizes", "activation" (a name in `activation_classes`, used for all hidden layers,
+    with `IdentityActivation` in the output layer) and the arguments of `train()`, like "eta", "minibatch_size" and
+    "optimizer". "seed" and "dtype" are passed to `NeuralNetwork`. A search space is a dict from the same names to
+    lists of values, or to a `Uniform` or `LogUniform` distribution for `random()`, `successive_halving()` and
+    `hyperband()`.
+
+    Each trial is scored by its lowest validation loss (`val_losses`, recorded by `_perform_evaluation()`), or
+    infinity if every validation loss is NaN, so it ranks last. Each finished trial is appended as one JSON line to
+    `log_path`, and trials that are already in the log are not run again, so an interrupted sweep can be resumed by
+    running it again. The configs of the random searches are drawn from `seed`, so they are the same when resumed.
+    NumPy values in the configs are logged as Python values, and other values that JSON cannot store, like optimizer
+    instances, as their `repr()`. Such values need a `repr()` that is the same in every run for their trials to be
+    found in the log.
+
+    `grid()` and `random()` train a new network for every trial. `successive_halving()` and `hyperband()` save the
+    networks of each rung in `checkpoint_dir` (with `NeuralNetwork.save()`), and continue training the configs that
+    are kept for only the extra epochs of the next rung. The optimizer state is not saved, so an optimizer like
+    "adam" starts over at each rung.
+
+    The data, the loss and accuracy functions and the activation classes are sent to every worker. With the "spawn"
+    and "forkserver" start methods they are pickled, so they must be importable (not defined in a notebook).
+
+    Args:
+        x_train (np.array): [n x p]-shaped input data of n inputs and p features.
+        y_train (np.array): [n]-shaped array of true targets as integers.
+        eval_set (tuple): `(x_val, y_val)`, used to score the trials.
+        loss_func (callable): Used for calculating loss.
+        accuracy_func (callable): Used for calculating accuracy.
+        activation_classes (dict): Dict from the activation names used in the configs to activation classes, for
+            example `{"relu": ReLU, "sigmoid": Sigmoid}`.
+        log_path (str): Path to the JSON lines log of the trials.
+        checkpoint_dir (str, optional): Directory for the networks saved by `successive_halving()` and `hyperband()`.
+            Defaults to `log_path` without its extension, followed by "_networks".
+        n_workers (int, optional): The amount of trials to run at once. Defaults to `os.cpu_count()`.
+        start_method (str, optional): "fork", "spawn" or "forkserver", see `multiprocessing.get_context()`. Defaults
+            to the platform default.
+        blas_threads (int): The amount of BLAS threads in each worker, if the optional `threadpoolctl` package is
+            installed. One thread per trial avoids oversubscribing the cores when many trials run at once.
+        seed (int): Random seed for drawing configs.
+        verbose (bool): If True, prints every finished trial, and the rungs and brackets of `successive_halving()`
+            and `hyperband()`.
+    """
+
+    def __init__(
+        self,
+        x_train,
+        y_train,
+        eval_set,
+        loss_func,
+        accuracy_func,
+        activation_classes,
+        log_path,
+        checkpoint_dir=None,
+        n_workers=None,
+        start_method=None,
+        blas_threads=1,
+        seed=57,
+        verbose=False,
+    ):
+        self.x_train = x_train
+        self.y_train = y_train
+        self.eval_set = eval_set
+        self.loss_func = loss_func
+        self.accuracy_func = accuracy_func
+        self.activation_classes = activation_classes
+        self.log_path = log_path
+        self.checkpoint_dir = os.path.splitext(log_path)[0] + "_networks" if checkpoint_dir is None else checkpoint_dir
+        self.n_workers = os.cpu_count() if n_workers is None else n_workers
+        self.start_method = start_method
+        self.blas_threads = blas_threads
+        self.rng = np.random.default_rng(seed=seed)
+        self.verbose = verbose
+
+    def read_log(self):
+        """
+        Reads the finished trials from the log.
+
+        Returns:
+            dict: Dict from trial keys to the log records.
+        """
+        records = {}
+        if not os.path.exists(self.log_path):
+            return records
+        with open(self.log_path) as infile:
+            for line in infile:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # A line cut off when the sweep was interrupted
+                    continue
+                records[record["key"]] = record
+        return records
+
+    def run(self, configs, n_epochs, previous=None, save_networks=False):
+        """
+        Trains every config for `n_epochs` epochs, skipping trials that are already in the log.
+
+        Arguments:
+            configs (list of dict): The configs to train.
+            n_epochs (int): The amount of epochs to train each config for, in total.
+            previous (list of dict, optional): One log record per config, of trials run with `save_networks=True`.
+                Each config continues from the network saved by its previous trial, for the remaining epochs. If the
+                saved network is missing, the config is trained from scratch.
+            save_networks (bool): If True, saves the trained networks in `self.checkpoint_dir`.
+
+        Returns:
+            list of dict: The log records of the trials, in the same order as `configs`.
+        """
+        previous = [None] * len(configs) if previous is None else previous
+        checkpoint_dir = self.checkpoint_dir if save_networks else None
+        if save_networks:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+        keys = []
+        records = self.read_log()
+        trials = {}
+        for config, previous_record in zip(configs, previous):
+            if previous_record is not None and not os.path.exists(
+                _network_path(self.checkpoint_dir, previous_record["key"])
+            ):
+                previous_record = None
+            start_epochs = 0 if previous_record is None else previous_record["n_epochs"]
+            key = _trial_key(config, n_epochs, start_epochs=start_epochs)
+            keys.append(key)
+            if key not in records:
+                trials[key] = {
+                    "key": key,
+                    "config": config,
+                    "n_epochs": n_epochs,
+                    "previous": previous_record,
+                    "checkpoint_dir": checkpoint_dir,
+                }
+
+        if len(trials) > 0:
+            context = multiprocessing.get_context(self.start_method)
+            initargs = (
+                self.x_train,
+                self.y_train,
+                self.eval_set,
+                self.loss_func,
+                self.accuracy_func,
+                self.activation_classes,
+                self.blas_threads,
+            )
+            n_workers = min(self.n_workers, len(trials))
+            with context.Pool(n_workers, initializer=_initialize_trial_worker, initargs=initargs) as pool:
+                with open(self.log_path, "a") as outfile:
+                    for record in pool.imap_unordered(_run_trial, trials.values()):
+                        outfile.write(json.dumps(record, default=_json_default) + "\n")
+                        outfile.flush()
+                        records[record["key"]] = record
+                        if self.verbose:
+                            print(f"Trial {record['key']}: Score {record['score']:.5f}, {record['config']}")
+
+        return [records[key] for key in keys]
+
+    def grid(self, space, n_epochs):
+        """
+        Trains every combination of the values in `space`.
+
+        Arguments:
+            space (dict): Dict from config names to lists of values.
+            n_epochs (int): The amount of epochs to train each config for.
+
+        Returns:
+            list of dict: The log records of the trials, best score first.
+        """
+        names = list(space)
+        configs = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+        return sorted(self.run(configs, n_epochs), key=lambda record: record["score"])
+
+    def random(self, space, n_trials, n_epochs):
+        """
+        Trains `n_trials` configs drawn from `space`.
+
+        Arguments:
+            space (dict): Dict from config names to lists of values or distributions.
+            n_trials (int): The amount of configs to draw.
+            n_epochs (int): The amount of epochs to train each config for.
+
+        Returns:
+            list of dict: The log records of the trials, best score first.
+        """
+        configs = [_sample_config(space, self.rng) for _ in range(n_trials)]
+        return sorted(self.run(configs, n_epochs), key=lambda record: record["score"])
+
+    def successive_halving(self, space, n_trials, min_epochs, max_epochs, reduction_factor=3, configs=None):
+        """
+        Successive halving, https://arxiv.org/abs/1502.07943. Trains `n_trials` configs drawn from `space` for
+        `min_epochs` epochs, keeps the best `1 / reduction_factor` of them, trains those for `reduction_factor` times
+        as many epochs, and so on until `max_epochs`. Most of the bad configs are stopped after only a few epochs.
+
+        The networks of every rung are saved, and the configs that are kept continue training from them for only
+        the extra epochs, so each kept config costs `max_epochs` epochs in total. Each rung is logged on its own, so an
+        interrupted search continues from the last finished trials.
+
+        Arguments:
+            space (dict): Dict from config names to lists of values or distributions.
+            n_trials (int): The amount of configs in the first rung.
+            min_epochs (int): The amount of epochs in the first rung.
+            max_epochs (int): The largest amount of epochs to train a config for.
+            reduction_factor (int): How many times fewer configs each rung has than the one before.
+            configs (list of dict, optional): If not None, used instead of drawing `n_trials` configs.
+
+        Returns:
+            list of dict: The log records of the last rung, best score first.
+        """
+        if reduction_factor < 2:
+            raise ValueError(f"Argument `reduction_factor` must be at least 2. Was {reduction_factor}. ")
+        if configs is None:
+            configs = [_sample_config(space, self.rng) for _ in range(n_trials)]
+
+        n_epochs = min_epochs
+        previous = None
+        while True:
+            if self.verbose:
+                print(f"Rung: {len(configs)} configs, {n_epochs} epochs")
+            records = self.run(configs, n_epochs, previous=previous, save_networks=True)
+            records = sorted(records, key=lambda record: record["score"])
+            n_keep = len(configs) // reduction_factor
+            if n_epochs >= max_epochs or n_keep < 1:
+                return records
+            previous = records[:n_keep]
+            configs = [record["config"] for record in previous]
+            n_epochs = min(n_epochs * reduction_factor, max_epochs)
+
+    def hyperband(self, space, min_epochs, max_epochs, reduction_factor=3):
+        """
+        Hyperband, https://arxiv.org/abs/1603.06560. Runs `successive_halving()` several times (brackets), from
+        many configs with a small first budget to few configs trained for `max_epochs` from the start, so it does not
+        depend on how early the bad configs can be recognised.
+
+        Arguments:
+            space (dict): Dict from config names to lists of values or distributions.
+            min_epochs (int): The smallest amount of epochs in a first rung.
+            max_epochs (int): The largest amount of epochs to train a config for.
+            reduction_factor (int): How many times fewer configs each rung has than the one before.
+
+        Returns:
+            list of dict: The log records of the last rung of every bracket, best score first.
+        """
+        s_max = int(math.floor(math.log(max_epochs / min_epochs, reduction_factor) + 1e-9))
+        results = []
+        for s in range(s_max, -1, -1):
+            n_trials = int(math.ceil((s_max + 1) / (s + 1) * reduction_factor**s))
+            first_epochs = max(min_epochs, int(round(max_epochs / reduction_factor**s)))
+            if self.verbose:
+                print(f"Bracket {s_max - s + 1} / {s_max + 1}")
+            results += self.successive_halving(
+                space,
+                n_trials=n_trials,
+                min_epochs=first_epochs,
+                max_epochs=max_epochs,
+                reduction_factor=reduction_factor,
+            )
+        return sorted(results, key=lambda record: record["score"])
@@ -1,4 +1,10 @@
 import numbers
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
 
 import numpy as np
 
@@ -367,6 +373,74 @@ def test_predict(input_class, relu_class, message_on_pass=False):
         print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
 
 
+def test_streaming_predict(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests `predict_logits()`, `predict_proba()` and `predict()` on a generator of chunks, with and without
+    `batch_size`, against the results on the whole array at once. Also tests empty input, as an empty array and as
+    an empty generator.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_streaming_predict`"
+    rng = np.random.default_rng(seed=57)
+    n_inputs, n_classes = 6, 4
+    layer_sizes = [n_inputs] + [8] * (len(activation_classes) - 1) + [n_classes]
+
+    def iter_chunks(x_data, chunk_sizes):
+        starts = np.cumsum([0] + chunk_sizes)
+        for start, stop in zip(starts[:-1], starts[1:]):
+            yield x_data[start:stop]
+
+    # Each test case: (chunk_sizes, batch_size, dtype). The chunks are fed from a generator, empty chunks are skipped
+    test_cases = [
+        ([7, 1, 12], 5, np.float64),
+        ([7, 1, 12], None, np.float64),
+        ([20], 3, np.float32),
+        ([4, 0, 9, 3], 1024, np.float32),
+        ([], 5, np.float64),
+        ([0], None, np.float32),
+    ]
+
+    for i, (chunk_sizes, batch_size, dtype) in enumerate(test_cases, start=1):
+        try:
+            neural_network = input_class(
+                layer_sizes=layer_sizes,
+                activation_functions=[activation_class() for activation_class in activation_classes],
+                seed=57,
+                dtype=dtype,
+            )
+            x_data = rng.normal(size=(sum(chunk_sizes), n_inputs))
+            methods = [neural_network.predict_logits, neural_network.predict_proba, neural_network.predict]
+            expected_shapes = [(len(x_data), n_classes), (len(x_data), n_classes), (len(x_data),)]
+
+            for method, expected_shape in zip(methods, expected_shapes):
+                expected = method(x_data, batch_size=None)
+                result = method(iter_chunks(x_data, chunk_sizes), batch_size=batch_size)
+                if not isinstance(expected, np.ndarray) or expected.shape != expected_shape:
+                    print(f"Failed: {message_infix}. Test `{i}` got `{method.__name__}()` of shape ", end="")
+                    print(f"`{np.shape(expected)}` on the whole array. Expected `{expected_shape}`.")
+                    return
+                if not isinstance(result, np.ndarray) or result.shape != expected_shape:
+                    print(f"Failed: {message_infix}. Test `{i}` got `{method.__name__}()` of shape ", end="")
+                    print(f"`{np.shape(result)}` on a generator. Expected `{expected_shape}`.")
+                    return
+                if result.dtype != expected.dtype or not np.allclose(result, expected, rtol=1e-5, atol=1e-6):
+                    print(f"Failed: {message_infix}. Test `{i}` got `{method.__name__}()` on a generator ", end="")
+                    print("that differs from the result on the whole array.")
+                    return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
 def _run_loss_function_tests(input_function, message_infix, test_cases, message_on_pass=False):
     """
     Internal helper function that loops over test cases for a scalar loss function.
@@ -473,3 +547,1146 @@ def test_calculate_accuracy(input_function, message_on_pass=False):
     ]
 
     _run_loss_function_tests(input_function, message_infix, test_cases, message_on_pass)
+
+
+def test_float32_training(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests that a NeuralNetwork made with `dtype=np.float32` stays in float32 through a training step.
+    Checks the weights, biases, weighted sums, activations and deltas after `forward()`, `_backprop()` and `_sgd()`,
+    with float64 and uint8 inputs, so that no array is silently promoted to float64.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, for
+            example `[ReLU, Sigmoid, IdentityActivation]`.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_float32_training`"
+    rng = np.random.default_rng(seed=57)
+
+    # Each test case: (x_data, targets)
+    test_cases = [
+        (rng.normal(size=(8, 6)), np.eye(3, dtype=np.float32)[rng.integers(0, 3, size=8)]),
+        (rng.integers(0, 2, size=(5, 6)).astype(np.uint8), np.eye(3, dtype=np.uint8)[rng.integers(0, 3, size=5)]),
+    ]
+
+    for i, (x_data, targets) in enumerate(test_cases, start=1):
+        try:
+            layer_sizes = [6] + [4] * (len(activation_classes) - 1) + [3]
+            activation_functions = [activation_class() for activation_class in activation_classes]
+            neural_network = input_class(
+                layer_sizes=layer_sizes, activation_functions=activation_functions, dtype=np.float32
+            )
+
+            preds = neural_network.forward(x_data)
+            deltas = neural_network._backprop(preds, targets)
+            neural_network._sgd(deltas, eta=0.1, n_data=x_data.shape[0])
+
+            arrays = {
+                "weights": neural_network.weights,
+                "biases": neural_network.biases,
+                "weighted_sums": neural_network.weighted_sums,
+                "activations": neural_network.activations,
+                "deltas": deltas,
+            }
+            for name, array_list in arrays.items():
+                for j, array in enumerate(array_list):
+                    if array.dtype != np.float32:
+                        print(
+                            f"Failed: {message_infix}. Test `{i}` got `{name}[{j}]` with dtype `{array.dtype}`. "
+                            f"Expected `float32`."
+                        )
+                        return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_minibatch_iterator(input_class, message_on_pass=False):
+    """
+    Tests `MinibatchIterator` on 10 numbered datapoints. Verifies the batch sizes with and without `drop_last`, that
+    the x and y rows of a batch belong together and every epoch has every row once, that the order is new every epoch
+    but the same for the same seed, that `shuffle=False` keeps the order, and that prefetching gives the same batches
+    and stops its thread when an epoch is left early.
+
+    Args:
+        input_class (class): The MinibatchIterator class to test.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_minibatch_iterator`"
+    x_data = np.arange(10, dtype=np.float64)[:, None] * np.ones((1, 3))
+    y_data = np.arange(10)
+
+    def epochs(n_epochs=2, **kwargs):
+        kwargs = {"batch_size": 4, "seed": 57, **kwargs}
+        batches = input_class(x_data, y_data, **kwargs)
+        return [[y_batch.tolist() for _, y_batch in batches] for _ in range(n_epochs)]
+
+    def batch_sizes():
+        return [len(batch) for batch in epochs(1)[0]] == [4, 4, 2]
+
+    def drop_last():
+        batches = input_class(x_data, y_data, batch_size=4, drop_last=True)
+        return [len(y_batch) for _, y_batch in batches] == [4, 4] and len(batches) == 2
+
+    def rows_match_and_cover():
+        for x_batch, y_batch in input_class(x_data, y_data, batch_size=4):
+            if not np.array_equal(x_batch[:, 0], y_batch):
+                return False
+        return all(sorted(sum(epoch, [])) == list(range(10)) for epoch in epochs(3))
+
+    def new_order_every_epoch():
+        first, second = epochs(2)
+        return first != second
+
+    def same_order_for_same_seed():
+        return epochs(3, seed=1) == epochs(3, seed=1) and epochs(3, seed=1) != epochs(3, seed=2)
+
+    def no_shuffle():
+        return epochs(2, shuffle=False) == [[[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]] * 2
+
+    def prefetch():
+        if epochs(3, prefetch=True) != epochs(3, prefetch=False):
+            return False
+        n_threads = threading.active_count()
+        iterator = iter(input_class(x_data, y_data, batch_size=2, prefetch=True))
+        next(iterator)
+        iterator.close()  # Leaving the epoch early must stop the prefetching thread
+        return threading.active_count() == n_threads
+
+    # Each test case: (description, function that returns True if the test passes)
+    test_cases = [
+        ("batch sizes [4, 4, 2]", batch_sizes),
+        ("batch sizes [4, 4] with `drop_last`", drop_last),
+        ("rows match and every row is used", rows_match_and_cover),
+        ("new order every epoch", new_order_every_epoch),
+        ("same order for the same seed", same_order_for_same_seed),
+        ("no shuffle", no_shuffle),
+        ("prefetch", prefetch),
+    ]
+
+    for i, (description, function) in enumerate(test_cases, start=1):
+        try:
+            if not function():
+                print(f"Failed: {message_infix}. Test `{i}` ({description}) failed.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_save_and_load(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests that `NeuralNetwork.save()` and `NeuralNetwork.load()` give back the same network.
+    Verifies the layer sizes, dtype, seed, activation function classes and parameters, and that the loaded network
+    predicts the same logits, for every `mmap_mode` and for a NumPy integer seed.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, for
+            example `[ReLU, Sigmoid, IdentityActivation]`.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_save_and_load`"
+    x_data = np.random.default_rng(seed=57).normal(size=(7, 5))
+    class_dict = {activation_class.__name__: activation_class for activation_class in activation_classes}
+
+    # Each test case: (dtype, mmap_mode, seed)
+    test_cases = [(np.float64, "c", 57), (np.float32, "r", 57), (np.float32, None, 57), (np.float64, "c", np.int64(3))]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, (dtype, mmap_mode, seed) in enumerate(test_cases, start=1):
+            try:
+                layer_sizes = [5] + [4] * (len(activation_classes) - 1) + [3]
+                neural_network = input_class(
+                    layer_sizes=layer_sizes,
+                    activation_functions=[activation_class() for activation_class in activation_classes],
+                    seed=seed,
+                    dtype=dtype,
+                )
+                path = os.path.join(tmp_dir, f"network_{i}.bin")
+                neural_network.save(path)
+                loaded = input_class.load(path, activation_classes=class_dict, mmap_mode=mmap_mode)
+
+                if list(loaded.layer_sizes) != layer_sizes or loaded.dtype != np.dtype(dtype):
+                    print(
+                        f"Failed: {message_infix}. Test `{i}` loaded layer sizes `{loaded.layer_sizes}` and dtype "
+                        f"`{loaded.dtype}`. Expected `{layer_sizes}` and `{np.dtype(dtype)}`."
+                    )
+                    return
+                if loaded.seed != seed:
+                    print(f"Failed: {message_infix}. Test `{i}` loaded seed `{loaded.seed}`. Expected `{seed}`.")
+                    return
+                loaded_classes = [type(function) for function in loaded.activation_functions]
+                if loaded_classes != list(activation_classes):
+                    print(
+                        f"Failed: {message_infix}. Test `{i}` loaded activation functions `{loaded_classes}`. "
+                        f"Expected `{activation_classes}`."
+                    )
+                    return
+                for name in ["weights", "biases"]:
+                    for j, (expected, actual) in enumerate(zip(getattr(neural_network, name), getattr(loaded, name))):
+                        if actual.dtype != expected.dtype or not np.array_equal(actual, expected):
+                            print(f"Failed: {message_infix}. Test `{i}` loaded different `{name}[{j}]`.")
+                            return
+                if not np.array_equal(loaded.predict_logits(x_data), neural_network.predict_logits(x_data)):
+                    print(f"Failed: {message_infix}. Test `{i}` loaded network predicts different logits.")
+                    return
+
+            except Exception as e:
+                print(f"Failed: {message_infix}. Test `{i}` got unexpected error: `{e}`.")
+                return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_load_mnist_cache(input_function, message_on_pass=False):
+    """
+    Tests the on-disk cache of `load_mnist_data()`, with the download replaced by a small synthetic dataset. Verifies
+    that the first call downloads and later calls with the same split are cache hits, that a new seed is a cache miss,
+    that cached and uncached data are equal, and that plain (not lazy) calls return in-memory ndarrays with the
+    x-data scaled to float32 by 255.
+
+    Args:
+        input_function (callable): The `load_mnist_data` function to test.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_load_mnist_cache`"
+    module = sys.modules[input_function.__module__]
+    n_downloads = [0]
+
+    def fake_download(dataset_id, n_val, seed):
+        n_downloads[0] += 1
+        rng = np.random.default_rng(seed=seed)
+        x_data = rng.integers(0, 256, size=(30, 8)).astype(np.uint8)
+        y_data = rng.integers(0, 10, size=30).astype(np.int64)
+        return {
+            "x_train": x_data[: 20 - n_val],
+            "x_val": x_data[20 - n_val : 20],
+            "x_test": x_data[20:],
+            "y_train": y_data[: 20 - n_val],
+            "y_val": y_data[20 - n_val : 20],
+            "y_test": y_data[20:],
+        }
+
+    # Each test case: (keyword arguments, expected downloads, expected data as keyword arguments of `fake_download`)
+    test_cases = [
+        ({"seed": 1}, 1, {"seed": 1}),  # Cache miss
+        ({"seed": 1}, 0, {"seed": 1}),  # Cache hit
+        ({"seed": 1, "scale_x_data": False}, 0, {"seed": 1}),
+        ({"seed": 2}, 1, {"seed": 2}),  # New seed, cache miss
+        ({"seed": 1, "use_cache": False}, 1, {"seed": 1}),  # Uncached, equal to the cached data
+        ({"seed": 1, "lazy": True}, 0, {"seed": 1}),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp_dir, mock.patch.object(module, "_download_mnist_splits", fake_download):
+        for i, (kwargs, expected_downloads, expected_kwargs) in enumerate(test_cases, start=1):
+            try:
+                n_downloads[0] = 0
+                data = input_function(n_val=5, cache_dir=tmp_dir, **kwargs)
+                expected = fake_download(dataset_id=None, n_val=5, **expected_kwargs)
+                n_downloads[0] -= 1  # Not counting the download of `expected`
+                if n_downloads[0] != expected_downloads:
+                    print(f"Failed: {message_infix}. Test `{i}` downloaded `{n_downloads[0]}` times. ", end="")
+                    print(f"Expected `{expected_downloads}`.")
+                    return
+
+                scale = kwargs.get("scale_x_data", True)
+                lazy = kwargs.get("lazy", False)
+                for name, expected_array in expected.items():
+                    if name.startswith("x_") and scale:
+                        expected_array = expected_array.astype(np.float32) / 255
+                    array = data[name]
+                    if not lazy and (type(array) is not np.ndarray or not array.flags.writeable):
+                        print(f"Failed: {message_infix}. Test `{i}` returned `{type(array)}` for `{name}`. ", end="")
+                        print("Expected a writeable `np.ndarray`.")
+                        return
+                    array = np.asarray(array)
+                    if array.dtype != expected_array.dtype or not np.array_equal(array, expected_array):
+                        print(f"Failed: {message_infix}. Test `{i}` returned wrong data for `{name}`.")
+                        return
+
+            except Exception as e:
+                print(f"Failed: {message_infix}. Test `{i}` got unexpected error: `{e}`.")
+                return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_micro_batcher(input_class, frozen_class, batcher_class, activation_classes, message_on_pass=False):
+    """
+    Tests `MicroBatcher`. Verifies that single rows submitted from many threads at once, and several rows submitted
+    together, get the same probabilities as `predict_proba()` on all the rows, that `close()` finishes the submitted
+    requests and makes `submit()` raise `RuntimeError`, that invalid arguments raise `ValueError`, and that a request
+    that waited in the queue for `max_latency` is forwarded without waiting again.
+
+    Args:
+        input_class (class): The NeuralNetwork class to serve.
+        frozen_class (class): The FrozenNetwork class.
+        batcher_class (class): The MicroBatcher class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_micro_batcher`"
+    x_data = np.random.default_rng(seed=57).normal(size=(40, 5))
+    layer_sizes = [5] + [4] * (len(activation_classes) - 1) + [3]
+    neural_network = input_class(
+        layer_sizes=layer_sizes,
+        activation_functions=[activation_class() for activation_class in activation_classes],
+    )
+    model = frozen_class(neural_network)
+    expected = model.predict_proba(x_data)
+
+    class SlowFirstBatch:
+        def __init__(self):
+            self.n_calls = 0
+
+        def predict_proba(self, rows):
+            self.n_calls += 1
+            if self.n_calls == 1:
+                time.sleep(1.0)
+            return model.predict_proba(rows)
+
+    def concurrent_single_rows():
+        results = [None] * len(x_data)
+        with batcher_class(model, max_batch_size=8, max_latency=0.01, n_workers=2) as batcher:
+
+            def submit_rows(start):
+                for j in range(start, len(x_data), 4):
+                    results[j] = batcher.predict_proba(x_data[j], timeout=10)
+
+            threads = [threading.Thread(target=submit_rows, args=(start,)) for start in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return np.array(results)
+
+    def several_rows():
+        with batcher_class(model) as batcher:
+            return batcher.submit(x_data[:7]).result(timeout=10)
+
+    def close_finishes_requests():
+        batcher = batcher_class(model, max_batch_size=4, max_latency=1.0)
+        futures = [batcher.submit(row) for row in x_data]
+        batcher.close()  # Must finish every request submitted before
+        if not all(future.done() for future in futures):
+            return None
+        try:
+            batcher.submit(x_data[0])
+        except RuntimeError:
+            return np.array([future.result() for future in futures])
+        return None
+
+    def invalid_arguments():
+        n_raised = 0
+        for kwargs in [{"n_workers": 0}, {"max_batch_size": 0}, {"n_workers": 1.5}]:
+            try:
+                batcher_class(model, **kwargs).close()
+            except ValueError:
+                n_raised += 1
+        return n_raised == 3
+
+    def deadline_from_arrival():
+        # The first batch is full and takes one second, so the next request has waited longer than `max_latency`
+        # when a worker takes it. It should then be forwarded right away, not after another `max_latency`.
+        with batcher_class(SlowFirstBatch(), max_batch_size=2, max_latency=0.5) as batcher:
+            batcher.submit(x_data[:2])
+            start_time = time.monotonic()
+            batcher.submit(x_data[2]).result(timeout=10)
+            return time.monotonic() - start_time < 1.3
+
+    # Each test case: (description, function, expected result, or None if the function checks and returns a bool)
+    test_cases = [
+        ("concurrent single rows", concurrent_single_rows, expected),
+        ("several rows in one request", several_rows, expected[:7]),
+        ("close", close_finishes_requests, expected),
+        ("invalid arguments", invalid_arguments, None),
+        ("latency measured from submit", deadline_from_arrival, None),
+    ]
+
+    for i, (description, function, expected_result) in enumerate(test_cases, start=1):
+        try:
+            result = function()
+            if expected_result is None:
+                passed = result is True
+            else:
+                passed = result is not None and result.shape == expected_result.shape
+                passed = passed and np.allclose(result, expected_result)
+            if not passed:
+                print(f"Failed: {message_infix}. Test `{i}` ({description}) got the wrong result.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_softmax_cross_entropy(input_function, softmax_function, message_on_pass=False):
+    """
+    Tests the fused `softmax_cross_entropy(logits, targets, return_grad=False, out=None)`.
+    Verifies the loss against precomputed values, that the gradient is `softmax(logits) - one-hot(targets)`, that the
+    gradient can be computed in place in `out`, and that very large logits give a finite loss.
+
+    Args:
+        input_function (callable): The fused loss function to test.
+        softmax_function (callable): A softmax function, used for the expected gradients.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_softmax_cross_entropy`"
+
+    # Each test case: (y_true, logits, expected_loss)
+    test_cases = [
+        (np.array([0, 1]), np.array([[4.0, 0.0, 0.0], [0.0, 4.0, 0.0]]), 0.0359762955725428),
+        (np.array([0, 2, 2]), np.array([[0.0, 4.0, 0.0], [0.0, 0.0, 4.0], [4.0, 0.0, 0.0]]), 2.702643041017243),
+        (np.array([0, 1, 2]), np.zeros((3, 3)), 1.0986122886681098),
+        (np.array([1, 0]), np.array([[1000.0, 0.0], [1000.0, -1000.0]]), 500.0),
+    ]
+
+    for i, (y_true, logits, expected_loss) in enumerate(test_cases, start=1):
+        try:
+            loss = input_function(logits, y_true)
+            if not np.isclose(loss, expected_loss):
+                print(f"Failed: {message_infix}. Test `{i}` got loss `{loss}`. Expected `{expected_loss}`.")
+                return
+
+            expected_grad = softmax_function(logits) - np.eye(logits.shape[1])[y_true]
+            out = logits.copy()
+            loss, grad = input_function(out, y_true, return_grad=True, out=out)
+            if grad is not out:
+                print(f"Failed: {message_infix}. Test `{i}` did not return the gradient in `out`.")
+                return
+            if not np.isclose(loss, expected_loss) or not np.allclose(grad, expected_grad):
+                print(f"Failed: {message_infix}. Test `{i}` got gradient `{grad}`. Expected `{expected_grad}`.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def _adam_reference(parameters, gradients, eta, weight_decay=0.0, beta1=0.9, beta2=0.999, eps=1e-8):
+    """
+    Adam (and AdamW if `weight_decay` > 0) as written in the papers, with explicitly bias-corrected moments.
+    Returns the parameters after one step per gradient.
+    """
+    parameters = parameters.copy()
+    first_moment = np.zeros_like(parameters)
+    second_moment = np.zeros_like(parameters)
+    for n_step, gradient in enumerate(gradients, start=1):
+        parameters = parameters - eta * weight_decay * parameters
+        first_moment = beta1 * first_moment + (1 - beta1) * gradient
+        second_moment = beta2 * second_moment + (1 - beta2) * gradient**2
+        first_moment_hat = first_moment / (1 - beta1**n_step)
+        second_moment_hat = second_moment / (1 - beta2**n_step)
+        parameters = parameters - eta * first_moment_hat / (np.sqrt(second_moment_hat) + eps)
+    return parameters
+
+
+def test_optimizers(input_function, message_on_pass=False):
+    """
+    Tests the update rules of the optimizers. Takes one and two steps with each optimizer (made with its default
+    arguments), and compares the parameters with the update written out in closed form. Adam is compared with the
+    explicitly bias-corrected moments, and AdamW with the weights decayed by `eta * weight_decay` before the Adam step.
+
+    Args:
+        input_function (callable): The `get_optimizer` function, from a name to an optimizer instance.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_optimizers`"
+    eta = 0.1
+    p0 = np.array([1.0, -2.0, 0.5, 0.0, 3.0])
+    g1 = np.array([0.5, -1.0, 2.0, 0.0, 1e-3])
+    g2 = np.array([0.1, 0.3, -0.2, 1.0, 1e-3])
+
+    def rmsprop(rho=0.9, eps=1e-8):
+        s1 = (1 - rho) * g1**2
+        p1 = p0 - eta * g1 / (np.sqrt(s1) + eps)
+        s2 = rho * s1 + (1 - rho) * g2**2
+        return p1, p1 - eta * g2 / (np.sqrt(s2) + eps)
+
+    # Each test case: (name, expected parameters after one step, expected parameters after two steps)
+    test_cases = [
+        ("sgd", p0 - eta * g1, p0 - eta * g1 - eta * g2),
+        ("momentum", p0 - eta * g1, p0 - eta * g1 - eta * (0.9 * g1 + g2)),
+        ("nesterov", p0 - eta * 1.9 * g1, p0 - eta * 1.9 * g1 - eta * (g2 + 0.9 * (0.9 * g1 + g2))),
+        ("rmsprop", *rmsprop()),
+        # The first bias-corrected Adam step is eta * g / (|g| + eps), so every parameter moves by about eta
+        ("adam", p0 - eta * g1 / (np.abs(g1) + 1e-8), _adam_reference(p0, [g1, g2], eta)),
+        (
+            "adamw",
+            p0 * (1 - eta * 0.01) - eta * g1 / (np.abs(g1) + 1e-8),
+            _adam_reference(p0, [g1, g2], eta, weight_decay=0.01),
+        ),
+    ]
+
+    for i, (name, expected_1, expected_2) in enumerate(test_cases, start=1):
+        try:
+            optimizer = input_function(name)
+            parameters = p0.copy()
+            optimizer.initialize([parameters])
+            optimizer.step([parameters], [g1], eta)
+            if not np.allclose(parameters, expected_1, rtol=1e-10, atol=1e-12):
+                print(f"Failed: {message_infix}. Test `{i}` ({name}) got `{parameters}` after one step. ", end="")
+                print(f"Expected `{expected_1}`.")
+                return
+            optimizer.step([parameters], [g2], eta)
+            if not np.allclose(parameters, expected_2, rtol=1e-10, atol=1e-12):
+                print(f"Failed: {message_infix}. Test `{i}` ({name}) got `{parameters}` after two steps. ", end="")
+                print(f"Expected `{expected_2}`.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_integer_targets(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests that `_backprop()` gives the same deltas for integer targets as for one-hot-encoded targets, for both
+    values of `loss_gradient`, with and without a workspace.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_integer_targets`"
+    rng = np.random.default_rng(seed=57)
+    x_data = rng.normal(size=(9, 6))
+    targets = rng.integers(0, 4, size=9)
+    one_hot = np.eye(4)[targets]
+
+    # Each test case: (loss_gradient, use_workspace)
+    test_cases = [("squared_error", False), ("squared_error", True), ("cross_entropy", False), ("cross_entropy", True)]
+
+    for i, (loss_gradient, use_workspace) in enumerate(test_cases, start=1):
+        try:
+            layer_sizes = [6] + [5] * (len(activation_classes) - 1) + [4]
+            neural_network = input_class(
+                layer_sizes=layer_sizes,
+                activation_functions=[activation_class() for activation_class in activation_classes],
+            )
+            neural_network.loss_gradient = loss_gradient
+            if use_workspace:
+                neural_network.allocate_workspace(len(targets))
+
+            preds = neural_network.forward(x_data)
+            expected = [delta.copy() for delta in neural_network._backprop(preds, one_hot)]
+            actual = neural_network._backprop(preds, targets)
+            for j, (expected_delta, actual_delta) in enumerate(zip(expected, actual)):
+                if not np.allclose(actual_delta, expected_delta):
+                    print(f"Failed: {message_infix}. Test `{i}` got different `deltas[{j}]` for integer targets.")
+                    return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_quantization(input_class, quantized_class, activation_classes, message_on_pass=False):
+    """
+    Tests that a quantized network accumulates exactly as int32 (the same logits with `integer_matmul` True and
+    False), and that its logits are close to the logits of the float network, for layers with few and with many
+    inputs.
+
+    Args:
+        input_class (class): The NeuralNetwork class to quantize.
+        quantized_class (class): The QuantizedNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_quantization`"
+    rng = np.random.default_rng(seed=57)
+
+    # Each test case: (n_inputs, dtype). More than 1040 inputs is accumulated in float64
+    test_cases = [(20, np.float64), (20, np.float32), (1200, np.float32)]
+
+    for i, (n_inputs, dtype) in enumerate(test_cases, start=1):
+        try:
+            layer_sizes = [n_inputs] + [16] * (len(activation_classes) - 1) + [4]
+            neural_network = input_class(
+                layer_sizes=layer_sizes,
+                activation_functions=[activation_class() for activation_class in activation_classes],
+                dtype=dtype,
+            )
+            x_data = rng.normal(size=(50, n_inputs)).astype(dtype)
+            quantized = quantized_class(neural_network, x_data)
+            logits = quantized.predict_logits(x_data)
+            integer_logits = quantized_class(neural_network, x_data, integer_matmul=True).predict_logits(x_data)
+            if not np.array_equal(logits, integer_logits):
+                print(f"Failed: {message_infix}. Test `{i}` got different logits with `integer_matmul=True`.")
+                return
+
+            expected = neural_network.predict_logits(x_data)
+            error = np.max(np.abs(logits - expected)) / np.max(np.abs(expected))
+            if error > 0.05:
+                print(f"Failed: {message_infix}. Test `{i}` got a relative logits error of `{error}` (above 0.05).")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_magnitude_pruning(
+    input_class, pruning_callback_class, sparse_class, activation_classes, message_on_pass=False
+):
+    """
+    Tests that training with a pruning callback reaches the final sparsity, that the pruned weights stay zero after
+    training further with the masks, and that the sparse network gives the same logits as the pruned dense network.
+
+    Args:
+        input_class (class): The NeuralNetwork class to prune.
+        pruning_callback_class (class): The MagnitudePruning callback class to test.
+        sparse_class (class): The SparseNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_magnitude_pruning`"
+    rng = np.random.default_rng(seed=57)
+    x_data = rng.normal(size=(64, 30))
+    y_data = rng.integers(0, 4, size=64)
+
+    def loss_func(targets, logits):
+        return 0.0
+
+    def accuracy_func(targets, classes):
+        return 0.0
+
+    # Each test case: final sparsity
+    test_cases = [0.5, 0.9, 0.99]
+
+    for i, final_sparsity in enumerate(test_cases, start=1):
+        try:
+            layer_sizes = [30] + [20] * (len(activation_classes) - 1) + [4]
+            neural_network = input_class(
+                layer_sizes=layer_sizes,
+                activation_functions=[activation_class() for activation_class in activation_classes],
+            )
+            train_kwargs = dict(
+                x_train=x_data, y_train=y_data, eta=0.01, loss_func=loss_func, accuracy_func=accuracy_func
+            )
+            pruning = pruning_callback_class(final_sparsity)
+            neural_network.train(n_epochs=3, callbacks=[pruning], **train_kwargs)
+            for j, weights in enumerate(neural_network.weights):
+                expected = weights.size - int(round(final_sparsity * weights.size))
+                if np.count_nonzero(weights) > expected:
+                    print(f"Failed: {message_infix}. Test `{i}` has more than {expected} nonzero `weights[{j}]`.")
+                    return
+
+            masks = pruning.masks
+            neural_network.train(n_epochs=2, callbacks=[pruning_callback_class(0.0, masks=masks)], **train_kwargs)
+            for j, (weights, mask) in enumerate(zip(neural_network.weights, masks)):
+                if np.any(weights[~mask] != 0):
+                    print(f"Failed: {message_infix}. Test `{i}` has pruned `weights[{j}]` that are not zero.")
+                    return
+
+            sparse_network = sparse_class(neural_network, density_threshold=1.0)
+            if not np.allclose(sparse_network.predict_logits(x_data), neural_network.predict_logits(x_data)):
+                print(f"Failed: {message_infix}. Test `{i}` got different logits from the sparse network.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_data_parallel(input_class, trainer_class, activation_classes, message_on_pass=False):
+    """
+    Tests that `DataParallelTrainer` makes the same updates as `NeuralNetwork.train()`. With one worker the parameters
+    must be exactly the same, and with more workers the same up to rounding, since the shard gradients are summed in
+    another order.
+
+    Args:
+        input_class (class): The NeuralNetwork class to train.
+        trainer_class (class): The DataParallelTrainer class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_data_parallel`"
+    rng = np.random.default_rng(seed=57)
+    x_data = rng.normal(size=(60, 6))
+    y_data = rng.integers(0, 3, size=60)
+
+    def loss_func(targets, logits):
+        return 0.0
+
+    def accuracy_func(targets, classes):
+        return 0.0
+
+    # Each test case: (n_workers, shuffle, optimizer, exact)
+    test_cases = [
+        (1, False, None, True),
+        (1, True, "adam", True),
+        (2, True, None, False),
+        (3, False, "momentum", False),
+    ]
+
+    for i, (n_workers, shuffle, optimizer, exact) in enumerate(test_cases, start=1):
+        try:
+            networks = []
+            for _ in range(2):
+                layer_sizes = [6] + [8] * (len(activation_classes) - 1) + [3]
+                networks.append(
+                    input_class(
+                        layer_sizes=layer_sizes,
+                        activation_functions=[activation_class() for activation_class in activation_classes],
+                        seed=57,
+                    )
+                )
+            serial, parallel = networks
+            kwargs = {"eta": 0.05, "n_epochs": 3, "minibatch_size": 20, "shuffle": shuffle, "optimizer": optimizer}
+            kwargs["loss_gradient"] = "cross_entropy"
+            serial.train(x_data, y_data, loss_func=loss_func, accuracy_func=accuracy_func, **kwargs)
+            trainer_class(parallel, n_workers=n_workers).train(x_data, y_data, **kwargs)
+
+            if exact:
+                passed = np.array_equal(parallel.parameters, serial.parameters)
+            else:
+                passed = np.allclose(parallel.parameters, serial.parameters, rtol=1e-7, atol=1e-9)
+            if not passed:
+                difference = np.max(np.abs(parallel.parameters - serial.parameters))
+                print(f"Failed: {message_infix}. Test `{i}` with `{n_workers}` workers got parameters that ", end="")
+                print(f"differ by up to `{difference}` from serial training.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_early_stopping(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests `patience` and `restore_best` of `train()` on a validation set that gets worse during training: the same
+    inputs as the train set, with other targets. Checks that training stops `patience` evaluations after the best
+    validation loss, and that `restore_best` restores the parameters from the best epoch.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    from callbacks import Callback
+
+    class ParameterSnapshots(Callback):
+        def on_train_begin(self, network, n_epochs):
+            self.parameters = []
+
+        def on_epoch_end(self, network, n_epoch, record):
+            self.parameters.append(network.parameters.copy())
+
+    def loss_func(targets, logits):
+        shifted = logits - np.max(logits, axis=1, keepdims=True)
+        log_probs = shifted - np.log(np.sum(np.exp(shifted), axis=1, keepdims=True))
+        return float(-np.mean(log_probs[np.arange(len(targets)), targets]))
+
+    def accuracy_func(targets, predictions):
+        return float(np.mean(predictions == targets))
+
+    message_infix = "`test_early_stopping`"
+    rng = np.random.default_rng(seed=57)
+    x_data = rng.normal(size=(60, 6))
+    y_data = rng.integers(0, 3, size=60)
+    eval_set = (x_data, (y_data + 1) % 3)  # Gets worse the better the train set is fitted
+    n_epochs = 30
+
+    # Each test case: (patience, restore_best)
+    test_cases = [(2, True), (4, True), (None, True), (3, False)]
+
+    for i, (patience, restore_best) in enumerate(test_cases, start=1):
+        try:
+            layer_sizes = [6] + [8] * (len(activation_classes) - 1) + [3]
+            neural_network = input_class(
+                layer_sizes=layer_sizes,
+                activation_functions=[activation_class() for activation_class in activation_classes],
+                seed=57,
+            )
+            snapshots = ParameterSnapshots()
+            neural_network.train(
+                x_data,
+                y_data,
+                eta=0.05,
+                n_epochs=n_epochs,
+                loss_func=loss_func,
+                accuracy_func=accuracy_func,
+                minibatch_size=10,
+                eval_set=eval_set,
+                patience=patience,
+                restore_best=restore_best,
+                loss_gradient="cross_entropy",
+                callbacks=[snapshots],
+            )
+
+            val_losses = neural_network.val_losses[: neural_network.n_epochs_run]
+            best_epoch = int(np.argmin(val_losses))
+            expected_n_epochs = n_epochs if patience is None else best_epoch + patience + 1
+            if neural_network.best_epoch != best_epoch:
+                print(f"Failed: {message_infix}. Test `{i}` got best epoch `{neural_network.best_epoch}`. ", end="")
+                print(f"Expected `{best_epoch}`.")
+                return
+            if expected_n_epochs >= n_epochs and patience is not None:
+                print(f"Failed: {message_infix}. Test `{i}` did not get worse for `{patience}` epochs.")
+                return
+            if neural_network.n_epochs_run != expected_n_epochs:
+                print(f"Failed: {message_infix}. Test `{i}` ran `{neural_network.n_epochs_run}` epochs. ", end="")
+                print(f"Expected `{expected_n_epochs}`.")
+                return
+            expected_stop_reason = None if patience is None else "patience"
+            if neural_network.stop_reason != expected_stop_reason:
+                print(f"Failed: {message_infix}. Test `{i}` got stop reason `{neural_network.stop_reason}`. ", end="")
+                print(f"Expected `{expected_stop_reason}`.")
+                return
+
+            expected_parameters = snapshots.parameters[best_epoch if restore_best else -1]
+            if not np.array_equal(neural_network.parameters, expected_parameters):
+                print(f"Failed: {message_infix}. Test `{i}` did not end with the parameters of the expected epoch.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_callbacks(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests the callbacks and `history` of `train()`. Checks that the callback methods are called in order, once per
+    minibatch and epoch, that `history` has a `HISTORY_DTYPE` row per epoch where the epochs not run stay NaN, that
+    `restore_best` restores the best epoch of the epochs run, and that a callback setting `network.stop_training`
+    stops training after that epoch.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    from callbacks import Callback
+
+    class EventRecorder(Callback):
+        def __init__(self, stop_epoch):
+            self.stop_epoch = stop_epoch
+            self.events = []
+            self.parameters = []
+
+        def on_train_begin(self, network, n_epochs):
+            self.events.append(("begin", n_epochs))
+
+        def on_batch_end(self, network, n_batch, n_data):
+            self.events.append(("batch", n_batch, n_data))
+
+        def on_epoch_end(self, network, n_epoch, record):
+            self.events.append(("epoch", n_epoch, record.copy()))
+            self.parameters.append(network.parameters.copy())
+            if n_epoch == self.stop_epoch:
+                network.stop_training = True
+
+        def on_train_end(self, network):
+            self.events.append(("end", network.stop_reason))
+
+    def loss_func(targets, logits):
+        shifted = logits - np.max(logits, axis=1, keepdims=True)
+        log_probs = shifted - np.log(np.sum(np.exp(shifted), axis=1, keepdims=True))
+        return float(-np.mean(log_probs[np.arange(len(targets)), targets]))
+
+    def accuracy_func(targets, predictions):
+        return float(np.mean(predictions == targets))
+
+    message_infix = "`test_callbacks`"
+    history_dtype = sys.modules[input_class.__module__].HISTORY_DTYPE
+    rng = np.random.default_rng(seed=57)
+    x_data = rng.normal(size=(60, 6))
+    y_data = rng.integers(0, 3, size=60)
+    eval_set = (x_data, (y_data + 1) % 3)  # Gets worse the better the train set is fitted, see `test_early_stopping`
+    n_epochs = 30
+    minibatch_size = 25  # The last minibatch has 10 datapoints
+
+    # Each test case: (patience, restore_best, stop_epoch)
+    test_cases = [(None, False, None), (2, True, None), (None, False, 3), (None, True, 5), (2, False, 0)]
+
+    for i, (patience, restore_best, stop_epoch) in enumerate(test_cases, start=1):
+        try:
+            layer_sizes = [6] + [8] * (len(activation_classes) - 1) + [3]
+            neural_network = input_class(
+                layer_sizes=layer_sizes,
+                activation_functions=[activation_class() for activation_class in activation_classes],
+                seed=57,
+            )
+            recorder = EventRecorder(stop_epoch)
+            neural_network.train(
+                x_data,
+                y_data,
+                eta=0.05,
+                n_epochs=n_epochs,
+                loss_func=loss_func,
+                accuracy_func=accuracy_func,
+                minibatch_size=minibatch_size,
+                eval_set=eval_set,
+                patience=patience,
+                restore_best=restore_best,
+                loss_gradient="cross_entropy",
+                callbacks=[recorder],
+            )
+
+            n_epochs_run = neural_network.n_epochs_run
+            if stop_epoch is not None:
+                expected_n_epochs, expected_stop_reason = stop_epoch + 1, "callback"
+            elif patience is not None:
+                expected_n_epochs = int(np.argmin(neural_network.val_losses[:n_epochs_run])) + patience + 1
+                expected_stop_reason = "patience"
+            else:
+                expected_n_epochs, expected_stop_reason = n_epochs, None
+            if n_epochs_run != expected_n_epochs or neural_network.stop_reason != expected_stop_reason:
+                print(f"Failed: {message_infix}. Test `{i}` ran `{n_epochs_run}` epochs with stop reason ", end="")
+                print(f"`{neural_network.stop_reason}`. Expected `{expected_n_epochs}` and `{expected_stop_reason}`.")
+                return
+
+            expected_events = [("begin", n_epochs)]
+            for n_epoch in range(expected_n_epochs):
+                expected_events += [("batch", 0, 25), ("batch", 1, 25), ("batch", 2, 10)]
+                expected_events.append(("epoch", n_epoch))
+            expected_events.append(("end", expected_stop_reason))
+            events = [event[:2] if event[0] == "epoch" else event for event in recorder.events]
+            if events != expected_events:
+                print(f"Failed: {message_infix}. Test `{i}` got the callback calls `{events}`. ", end="")
+                print(f"Expected `{expected_events}`.")
+                return
+
+            history = neural_network.history
+            if history.dtype != history_dtype or len(history) != n_epochs:
+                print(f"Failed: {message_infix}. Test `{i}` got a history with dtype `{history.dtype}` ", end="")
+                print(f"and length `{len(history)}`. Expected `{history_dtype}` and `{n_epochs}`.")
+                return
+            if not np.array_equal(history["epoch"], np.arange(n_epochs)):
+                print(f"Failed: {message_infix}. Test `{i}` got the epoch numbers `{history['epoch']}`.")
+                return
+            for name in history_dtype.names[1:]:
+                run, not_run = history[name][:n_epochs_run], history[name][n_epochs_run:]
+                if np.any(np.isnan(run)) or not np.all(np.isnan(not_run)):
+                    print(f"Failed: {message_infix}. Test `{i}` got `{name}` `{history[name]}`. ", end="")
+                    print(f"Expected it to be recorded for the `{n_epochs_run}` epochs run and NaN after.")
+                    return
+            epoch_records = [event[2] for event in recorder.events if event[0] == "epoch"]
+            if not all(record == history[n_epoch] for n_epoch, record in enumerate(epoch_records)):
+                print(f"Failed: {message_infix}. Test `{i}` got records in `on_epoch_end()` that are not in `history`.")
+                return
+
+            best_epoch = int(np.argmin(neural_network.val_losses[:n_epochs_run]))
+            expected_best_epoch = best_epoch if restore_best or patience is not None else None
+            if neural_network.best_epoch != expected_best_epoch:
+                print(f"Failed: {message_infix}. Test `{i}` got best epoch `{neural_network.best_epoch}`. ", end="")
+                print(f"Expected `{expected_best_epoch}`.")
+                return
+            expected_parameters = recorder.parameters[best_epoch if restore_best else -1]
+            if not np.array_equal(neural_network.parameters, expected_parameters):
+                print(f"Failed: {message_infix}. Test `{i}` did not end with the parameters of the expected epoch.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_sparse_inputs(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests that `forward()`, `_backprop()`, `_compute_gradients()` and chunked `predict_logits()` give the same results
+    for a `scipy.sparse` batch (CSR or COO) as for the same batch as a dense array, with and without a workspace.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    import scipy.sparse
+
+    message_infix = "`test_sparse_inputs`"
+    rng = np.random.default_rng(seed=57)
+    x_dense = rng.normal(size=(9, 40)) * (rng.random(size=(9, 40)) < 0.1)
+    targets = rng.integers(0, 4, size=9)
+
+    # Each test case: (sparse format, use_workspace)
+    test_cases = [("csr", False), ("csr", True), ("coo", False)]
+
+    for i, (sparse_format, use_workspace) in enumerate(test_cases, start=1):
+        try:
+            layer_sizes = [40] + [5] * (len(activation_classes) - 1) + [4]
+            neural_network = input_class(
+                layer_sizes=layer_sizes,
+                activation_functions=[activation_class() for activation_class in activation_classes],
+            )
+            if use_workspace:
+                neural_network.allocate_workspace(len(targets))
+
+            preds = neural_network.forward(x_dense).copy()
+            neural_network._compute_gradients(neural_network._backprop(preds, targets), len(targets))
+            expected = neural_network.gradients.copy()
+
+            x_sparse = scipy.sparse.csr_matrix(x_dense).asformat(sparse_format)
+            sparse_preds = neural_network.forward(x_sparse)
+            if not np.allclose(sparse_preds, preds):
+                print(f"Failed: {message_infix}. Test `{i}` got different logits for sparse inputs.")
+                return
+            neural_network._compute_gradients(neural_network._backprop(sparse_preds, targets), len(targets))
+            if not np.allclose(neural_network.gradients, expected):
+                print(f"Failed: {message_infix}. Test `{i}` got different gradients for sparse inputs.")
+                return
+            if not np.allclose(neural_network.predict_logits(x_sparse, batch_size=4), preds):
+                print(f"Failed: {message_infix}. Test `{i}` got different predicted logits for sparse inputs.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_gradient_accumulation(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests that training with `micro_batch_size` (gradient accumulation) gives the same parameters as training with
+    whole minibatches, for micro-batches that do and do not divide the minibatch size.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_gradient_accumulation`"
+    rng = np.random.default_rng(seed=57)
+    x_data = rng.normal(size=(50, 6))
+    y_data = rng.integers(0, 4, size=50)
+
+    def loss_func(targets, logits):
+        return 0.0
+
+    def accuracy_func(targets, classes):
+        return 0.0
+
+    def train(**kwargs):
+        layer_sizes = [6] + [5] * (len(activation_classes) - 1) + [4]
+        neural_network = input_class(
+            layer_sizes=layer_sizes,
+            activation_functions=[activation_class() for activation_class in activation_classes],
+        )
+        neural_network.train(
+            x_data,
+            y_data,
+            eta=0.1,
+            n_epochs=2,
+            loss_func=loss_func,
+            accuracy_func=accuracy_func,
+            minibatch_size=20,
+            **kwargs,
+        )
+        return neural_network.parameters
+
+    # Each test case: (micro_batch_size, loss_gradient)
+    test_cases = [(5, "squared_error"), (7, "cross_entropy"), (1, "cross_entropy"), (20, "squared_error")]
+
+    for i, (micro_batch_size, loss_gradient) in enumerate(test_cases, start=1):
+        try:
+            expected = train(loss_gradient=loss_gradient)
+            parameters = train(loss_gradient=loss_gradient, micro_batch_size=micro_batch_size)
+            if not np.allclose(parameters, expected):
+                print(f"Failed: {message_infix}. Test `{i}` got different parameters with `micro_batch_size`.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
+
+
+def test_gradient_checkpointing(input_class, activation_classes, message_on_pass=False):
+    """
+    Tests that `_checkpointed_gradients()` (gradient checkpointing) gives the same gradients as `forward()`,
+    `_backprop()` and `_compute_gradients()`, for segments of one layer, several layers and all the layers.
+
+    Args:
+        input_class (class): The NeuralNetwork class to test.
+        activation_classes (list of class): Activation function classes for each layer after the input layer, with
+            `IdentityActivation` last.
+        message_on_pass (bool, optional): If `True`, prints a message when all tests pass. Defaults to False.
+    """
+    message_infix = "`test_gradient_checkpointing`"
+    rng = np.random.default_rng(seed=57)
+    x_data = rng.normal(size=(9, 6))
+    targets = rng.integers(0, 4, size=9)
+    layer_classes = activation_classes[:-1] * 3 + activation_classes[-1:]  # Deeper, so there are several segments
+    layer_sizes = [6] + [5] * (len(layer_classes) - 1) + [4]
+
+    # Each test case: (checkpoint_every, loss_gradient)
+    test_cases = [(1, "squared_error"), (2, "cross_entropy"), (3, "squared_error"), (len(layer_sizes), "cross_entropy")]
+
+    for i, (checkpoint_every, loss_gradient) in enumerate(test_cases, start=1):
+        try:
+            neural_network = input_class(
+                layer_sizes=layer_sizes,
+                activation_functions=[activation_class() for activation_class in layer_classes],
+            )
+            neural_network.loss_gradient = loss_gradient
+            preds = neural_network.forward(x_data)
+            neural_network._compute_gradients(neural_network._backprop(preds, targets), len(targets))
+            expected = neural_network.gradients.copy()
+
+            neural_network.checkpoint_every = checkpoint_every
+            neural_network.gradients.fill(0)
+            neural_network._checkpointed_gradients(x_data, targets, len(targets))
+            if not np.allclose(neural_network.gradients, expected):
+                print(f"Failed: {message_infix}. Test `{i}` got different gradients with checkpointing.")
+                return
+
+        except Exception as e:
+            print(f"Failed: {message_infix}. Test number `{i}` got unexpected error: `{e}`.")
+            return
+
+    if message_on_pass:
+        print(f"Passed: {message_infix}. All [{len(test_cases)}/{len(test_cases)}] tests passed.")
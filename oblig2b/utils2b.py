@@ -1,8 +1,170 @@
+import hashlib
+import inspect
+import json
+import numbers
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from openml.datasets import get_dataset
 
+try:
+    import scipy.sparse
+except ImportError:  # Only needed for sparse input data
+    scipy = None
+
+from optimizers import get_optimizer
+
+MNIST_DATASET_ID = 554
+LOSS_GRADIENTS = ["squared_error", "cross_entropy"]
+# One row per epoch in `NeuralNetwork.history`
+HISTORY_DTYPE = np.dtype(
+    [
+        ("epoch", np.int64),
+        ("train_loss", np.float64),
+        ("train_accuracy", np.float64),
+        ("val_loss", np.float64),
+        ("val_accuracy", np.float64),
+        ("seconds", np.float64),
+    ]
+)
+_MNIST_CACHE_VERSION = 1
+
+_NETWORK_FILE_MAGIC = b"IN1160NN"
+_NETWORK_FILE_VERSION = 1
+_NETWORK_FILE_ALIGNMENT = 64  # The parameters start at a multiple of this many bytes, so memmaps of them are aligned
+
+
+class IndexedArray:
+    """
+    Read-only view of the rows `indices` of `data`, without copying them.
+    Rows are only gathered from `data` when the view is indexed, so a minibatch `view[i * b : (i + 1) * b]` only
+    copies `b` rows. `data` can be a memmap, so splits can be made of datasets that do not fit in memory.
+    Use `np.asarray()` to gather all the rows at once.
+
+    Args:
+        data (np.array): [n x p]-shaped array (or memmap) to take rows from.
+        indices (np.array): [k]-shaped integer array of the rows of `data` in the view.
+    """
+
+    def __init__(self, data, indices):
+        self.data = data
+        self.indices = np.asarray(indices)
+
+    @property
+    def shape(self):
+        return (self.indices.shape[0],) + tuple(self.data.shape[1:])
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            return self.data[self.indices[key]]
+
+        # Only the row index goes through `indices`, the rest of the key indexes the gathered rows
+        row_indices = self.indices[key[0]]
+        rows = self.data[row_indices]
+        if np.ndim(row_indices) == 0:
+            return rows[key[1:]]
+        return rows[(slice(None),) + key[1:]]
+
+    def __array__(self, dtype=None, copy=None):
+        rows = np.asarray(self.data[self.indices])
+        if dtype is not None:
+            rows = rows.astype(dtype, copy=False)
+        return rows
+
+
+def _subsample_rows(x_data, y_data, n_samples, rng):
+    """
+    Draws a random subsample of rows, without replacement. The x-rows are not copied, see `IndexedArray`.
+
+    Args:
+        x_data (np.array): [n x p] Two dimensional array of the input data.
+        y_data (np.array): [n] Array of the targets corresponding to `x_data`.
+        n_samples (int): The amount of rows to draw. If None, or at least n, the data is returned as it is.
+        rng (np.random.Generator): Random number generator to draw the rows with.
+
+    Returns:
+        tuple: The subsampled `(x_data, y_data)`.
+    """
+    n = x_data.shape[0]
+    if n_samples is None or n_samples >= n:
+        return x_data, y_data
+    indices = np.sort(rng.choice(n, size=n_samples, replace=False))  # Sorted for better locality when gathering
+    return IndexedArray(x_data, indices), y_data[indices]
+
 
-def _split_data_in_train_val(x_data, y_data, n_val=10000, seed=57):
+def _iter_row_chunks(x_data, batch_size):
+    """
+    Yields chunks of at most `batch_size` rows from an array, or from every batch of an iterable of arrays.
+
+    Args:
+        x_data (np.array or iterable): Anything with `shape` and row slicing, like an array, a memmap or an
+            `IndexedArray`. SciPy sparse data is converted to CSR once, since formats like COO cannot be sliced.
+            Anything else is treated as an iterable of arrays.
+        batch_size (int): The largest amount of rows in a chunk. If None, the rows are not chunked further.
+
+    Yields:
+        np.array: Chunks of rows.
+    """
+    batches = [x_data] if hasattr(x_data, "shape") else x_data
+    for batch in batches:
+        if _is_sparse(batch):
+            batch = batch.tocsr()  # No copy if it already is CSR
+        n_rows = batch.shape[0]
+        chunk_size = n_rows if batch_size is None else batch_size
+        for start in range(0, n_rows, max(chunk_size, 1)):
+            yield batch[start : start + chunk_size]
+
+
+def _is_positive_integer(value):
+    """
+    Checks if `value` is an integer of at least 1, like `3` or `np.int64(3)`. Booleans are not counted as integers.
+    """
+    return isinstance(value, numbers.Integral) and not isinstance(value, bool) and bool(value >= 1)
+
+
+def _is_sparse(x_data):
+    """
+    Checks if `x_data` is a SciPy sparse matrix or array.
+    """
+    return scipy is not None and scipy.sparse.issparse(x_data)
+
+
+def _as_input(x_data, dtype):
+    """
+    Converts a batch of input data to an array of `dtype`. Sparse data is converted to CSR instead of to a dense
+    array, so it uses memory proportional to the amount of nonzero values.
+    """
+    if _is_sparse(x_data):
+        x_data = x_data.tocsr()
+        return x_data if x_data.dtype == dtype else x_data.astype(dtype)
+    return np.asarray(x_data, dtype=dtype)
+
+
+def _matmul_transposed(activations, weights, out=None):
+    """
+    Computes `activations @ weights.T`. Sparse activations (input data) are multiplied with SciPy's sparse-dense
+    multiplication, which only touches the nonzero values, and returns a new dense array, so `out` is not used.
+    """
+    if _is_sparse(activations):
+        return np.asarray(activations @ weights.T)
+    return np.matmul(activations, weights.T, out=out)
+
+
+def _split_data_in_train_val(x_data, y_data, n_val=10000, seed=57, lazy=False):
     """
     Split data into train and validation.
 
@@ -12,6 +174,9 @@ def _split_data_in_train_val(x_data, y_data, n_val=10000, seed=57):
         y_data (np.array): [n] Array of the targets corresponding to `x_data`.
         n_val (int, optional): The amount of datapoints to use for the validation dataset.
         seed (int, optional): Random seed. Defaults to 57.
+        lazy (bool, optional): If True, the x-splits are `IndexedArray`s holding the permutation and a reference to
+            `x_data`, and rows are only copied when they are indexed. The targets are always copied, since they are
+            small. Defaults to False.
 
 
     Returns:
@@ -27,8 +192,12 @@ def _split_data_in_train_val(x_data, y_data, n_val=10000, seed=57):
     train_indices = random_indices[:n_train]
     val_indices = random_indices[n_train:]
 
-    x_train = x_data[train_indices]
-    x_val = x_data[val_indices]
+    if lazy:
+        x_train = IndexedArray(x_data, train_indices)
+        x_val = IndexedArray(x_data, val_indices)
+    else:
+        x_train = x_data[train_indices]
+        x_val = x_data[val_indices]
 
     y_train = y_data[train_indices]
     y_val = y_data[val_indices]
@@ -43,38 +212,187 @@ def _split_data_in_train_val(x_data, y_data, n_val=10000, seed=57):
     return all_data
 
 
-def load_mnist_data(scale_x_data=True):
+class ScaledArray:
     """
-    Loads and returns the MNIST dataset, splitted in train, validation and test sets.
+    Read-only view of an integer array that is cast and divided by a constant when indexed.
+    Only the rows that are indexed are converted, so a memory-mapped uint8 array stays on disk
+    until the rows are actually needed. Use `np.asarray()` to convert the whole array at once.
+
+    Args:
+        data (np.array): [n x p]-shaped array (or memmap) of unscaled values.
+        divisor (float): Value to divide the data with.
+        dtype (np.dtype): Dtype of the scaled values.
+    """
+
+    def __init__(self, data, divisor=255, dtype=np.float32):
+        self.data = data
+        self.divisor = divisor
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, key):
+        return np.divide(self.data[key], self.divisor, dtype=self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        scaled = self[...]
+        if dtype is not None:
+            scaled = scaled.astype(dtype, copy=False)
+        return scaled
+
+
+def _get_mnist_cache_dir(cache_dir=None):
+    """
+    Finds the directory used for caching datasets. The environment variable `IN1160_CACHE_DIR` is used
+    if it is set, if not `~/.cache/in1160`.
+
+    Args:
+        cache_dir (str, optional): If not None, this directory is used.
 
     Returns:
-        dict: The dictionary of the datasplits.
-        scale_x_data (bool): Whether or not to scale the x-data, which is done by dividing by 255.
+        str: Path to the cache directory.
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get("IN1160_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "in1160"))
+    return cache_dir
+
+
+def _mnist_cache_key(dataset_id, n_val, seed):
+    """
+    Makes the content address of a cached MNIST split. Everything that changes the arrays on disk is part of the key.
+
+    Args:
+        dataset_id (int): The OpenML dataset id.
+        n_val (int): The amount of datapoints in the validation set.
+        seed (int): Random seed for the train and validation split.
+
+    Returns:
+        str: Hex digest identifying the split.
+    """
+    key_data = {"dataset_id": dataset_id, "n_val": n_val, "seed": seed, "version": _MNIST_CACHE_VERSION}
+    key_string = json.dumps(key_data, sort_keys=True)
+    return hashlib.sha256(key_string.encode("utf-8")).hexdigest()[:16]
+
+
+def _download_mnist_splits(dataset_id, n_val, seed):
+    """
+    Downloads MNIST from OpenML and splits it into train, validation and test sets.
+    The pixels are stored as uint8 and the targets as int64.
+
+    Args:
+        dataset_id (int): The OpenML dataset id.
+        n_val (int): The amount of datapoints in the validation set.
+        seed (int): Random seed for the train and validation split.
+
+    Returns:
+        dict: Dictionary of the data splits.
     """
-    mnist = get_dataset(554)
+    mnist = get_dataset(dataset_id)
     x_data, y_data, _, _ = mnist.get_data(dataset_format="dataframe", target="class")
-    x_data = x_data.to_numpy()
-    y_data = y_data.to_numpy()
+    x_data = x_data.to_numpy().astype(np.uint8)
+    y_data = y_data.to_numpy().astype(np.int64)
 
     x_main = x_data[:60000]
-    y_main = y_data[:60000].astype(int)
+    y_main = y_data[:60000]
     x_test = x_data[60000:]
-    y_test = y_data[60000:].astype(int)
+    y_test = y_data[60000:]
 
-    all_data = _split_data_in_train_val(x_data=x_main, y_data=y_main)
+    all_data = _split_data_in_train_val(x_data=x_main, y_data=y_main, n_val=n_val, seed=seed)
 
     all_data["x_test"] = x_test
-    all_data["y_test"] = y_test.astype(int)
+    all_data["y_test"] = y_test
+
+    return all_data
+
+
+def _load_cached_mnist_splits(dataset_id, n_val, seed, cache_dir):
+    """
+    Loads MNIST splits from the cache, and downloads and stores them if they are not there.
+    The arrays are opened as read-only memmaps, so loading only costs opening the files.
+
+    Args:
+        dataset_id (int): The OpenML dataset id.
+        n_val (int): The amount of datapoints in the validation set.
+        seed (int): Random seed for the train and validation split.
+        cache_dir (str): Directory to store the cache in.
+
+    Returns:
+        dict: Dictionary of the data splits.
+    """
+    split_dir = os.path.join(cache_dir, "mnist", _mnist_cache_key(dataset_id=dataset_id, n_val=n_val, seed=seed))
+    names = ["x_train", "x_val", "x_test", "y_train", "y_val", "y_test"]
+
+    if not os.path.isdir(split_dir):
+        all_data = _download_mnist_splits(dataset_id=dataset_id, n_val=n_val, seed=seed)
+
+        # Write to a temporary directory first, so a crash or a parallel job never leaves a half written cache
+        tmp_dir = f"{split_dir}.tmp-{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name in names:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), all_data[name])
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as outfile:
+            manifest = {"dataset_id": dataset_id, "n_val": n_val, "seed": seed, "version": _MNIST_CACHE_VERSION}
+            json.dump(manifest, outfile, indent=2)
+        try:
+            os.replace(tmp_dir, split_dir)
+        except OSError:  # Another process finished first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {name: np.load(os.path.join(split_dir, f"{name}.npy"), mmap_mode="r") for name in names}
+
+
+def load_mnist_data(scale_x_data=True, n_val=10000, seed=57, use_cache=True, cache_dir=None, lazy=False):
+    """
+    Loads and returns the MNIST dataset, splitted in train, validation and test sets.
+
+    The splits are cached on disk as uint8 `.npy` files the first time they are made, and later calls memory-map
+    them instead of downloading and parsing the dataset again. The cache is keyed on the dataset id, `n_val` and
+    `seed`. The splits are returned as arrays read from the memory-mapped files, with the x-data as float32 divided
+    by 255 if `scale_x_data` is True.
+
+    With `lazy=True`, nothing is read up front: the splits are the read-only memmaps themselves, and if
+    `scale_x_data` is True the x-data is returned as `ScaledArray`s, which divide by 255 and cast to float32 only
+    for the rows that are indexed. Use `np.asarray()` to get a whole array.
+
+    Arguments:
+        scale_x_data (bool): Whether or not to scale the x-data, which is done by dividing by 255.
+        n_val (int, optional): The amount of datapoints to use for the validation dataset.
+        seed (int, optional): Random seed for the train and validation split. Defaults to 57.
+        use_cache (bool, optional): If False, always downloads the dataset and does not write to the cache.
+        cache_dir (str, optional): Directory for the cache. See `_get_mnist_cache_dir()` for the default.
+        lazy (bool, optional): If True, returns lazy views of the cached arrays instead of arrays. Defaults to False.
+
+    Returns:
+        dict: The dictionary of the datasplits.
+    """
+    if use_cache:
+        all_data = _load_cached_mnist_splits(
+            dataset_id=MNIST_DATASET_ID, n_val=n_val, seed=seed, cache_dir=_get_mnist_cache_dir(cache_dir)
+        )
+    else:
+        all_data = _download_mnist_splits(dataset_id=MNIST_DATASET_ID, n_val=n_val, seed=seed)
 
     if scale_x_data is True:
-        all_data["x_train"] = all_data["x_train"].astype(np.float32) / 255
-        all_data["x_val"] = all_data["x_val"].astype(np.float32) / 255
-        all_data["x_test"] = all_data["x_test"].astype(np.float32) / 255
+        for name in ["x_train", "x_val", "x_test"]:
+            all_data[name] = ScaledArray(all_data[name], divisor=255, dtype=np.float32)
+    if not lazy:
+        for name, data in all_data.items():
+            # A converted `ScaledArray` is already a new array, the memmaps are copied into memory
+            all_data[name] = np.asarray(data) if isinstance(data, ScaledArray) else np.array(data)
 
     return all_data
 
 
-def integer_one_hot_encode(x_array, max_int=None):
+def integer_one_hot_encode(x_array, max_int=None, dtype=np.uint8):
     """
     One hot encodes x_array.
     This assumes that x_arrays only has integer, and that the max element + 1 is the amount of class.
@@ -83,15 +401,15 @@ def integer_one_hot_encode(x_array, max_int=None):
     Arguments:
         x_array (np.array): (n) array of values to be one-hot-encoded.
         max_int (int): Max int of class.
+        dtype (np.dtype): Dtype of the returned array. Defaults to uint8.
 
     Returns:
         one_hot_array (np.array): (n x c) array of one-hot-encoded data.
     """
     if max_int is None:
         max_int = x_array.max()
-    one_hot_array = np.zeros((x_array.shape[0], max_int + 1))  # Initialize empty array
+    one_hot_array = np.zeros((x_array.shape[0], max_int + 1), dtype=dtype)  # Initialize empty array
     one_hot_array[np.arange(x_array.shape[0]), x_array] = 1  # Index rows (arange) and columns (x_array)
-    one_hot_array = one_hot_array.astype(np.uint8)
     return one_hot_array
 
 
@@ -107,10 +425,50 @@ def softmax(x_data):
         np.array: [n x c]-shaped array with softmax applied to `x_data`.
     """
     shifted_x = x_data - np.max(x_data, axis=1, keepdims=True)
-    softmaxes = np.exp(shifted_x) / np.sum(np.exp(shifted_x), axis=1, keepdims=True)
+    in_place = np.issubdtype(shifted_x.dtype, np.floating)
+    softmaxes = np.exp(shifted_x, out=shifted_x if in_place else None)  # Only one exp, into the shifted array
+    softmaxes /= np.sum(softmaxes, axis=1, keepdims=True)
     return softmaxes
 
 
+def softmax_cross_entropy(logits, targets, return_grad=False, out=None):
+    """
+    Computes the multiclass cross entropy of the softmax of `logits` without computing the probabilities first.
+    Uses log-sum-exp, loss_i = log(sum_j exp(z_ij - m_i)) - (z_i,y_i - m_i) where m_i is the largest logit of row i,
+    so large logits do not overflow, and no log is taken of probabilities that have rounded to zero. The logit of the
+    true class is gathered by integer indexing, so no one-hot matrix is made.
+
+    Arguments:
+        logits (np.array): [n x c]-shaped array of logits (not softmaxed).
+        targets (np.array): [n]-shaped array of true targets as integers (not one-hot encoded).
+        return_grad (bool): If True, also returns the gradient of the loss of each row with respect to its logits,
+            softmax(z) - one-hot(y). This is not divided by n.
+        out (np.array, optional): [n x c]-shaped float array to compute into. The gradient is returned in it if
+            `return_grad` is True. Can be `logits` itself, which is then overwritten.
+
+    Returns:
+        float: The mean cross entropy.
+        np.array: [n x c]-shaped gradient, only if `return_grad` is True.
+    """
+    rows = np.arange(logits.shape[0])
+    max_logits = np.max(logits, axis=1, keepdims=True)
+    if out is None:
+        out = np.subtract(logits, max_logits, dtype=np.result_type(logits.dtype, np.float32))
+    else:
+        np.subtract(logits, max_logits, out=out)
+
+    true_logits = out[rows, targets]  # Gathered before `out` is overwritten
+    np.exp(out, out=out)
+    sums = np.sum(out, axis=1, keepdims=True)
+    loss = float(np.mean(np.log(sums[:, 0]) - true_logits))
+    if not return_grad:
+        return loss
+
+    out /= sums
+    out[rows, targets] -= 1
+    return loss, out
+
+
 def calculate_multiclass_cross_entropy(targets, predictions):
     """
     Returns multiclass cross entropy loss, also called the log loss.
@@ -141,12 +499,221 @@ def calculate_accuracy(predictions, targets):
     pass
 
 
+def _check_integer_targets(y_data, n_classes):
+    """
+    Checks that `y_data` is a [n]-shaped array of integer class labels in [0, n_classes).
+
+    Raises:
+        ValueError: If it is not.
+    """
+    y_data = np.asarray(y_data)
+    if y_data.ndim != 1 or not np.issubdtype(y_data.dtype, np.integer):
+        message = "The targets must be a [n]-shaped array of integers. "
+        message += f"Was shape {y_data.shape} with dtype {y_data.dtype}. "
+        raise ValueError(message)
+    if y_data.size > 0 and (y_data.min() < 0 or y_data.max() >= n_classes):
+        message = f"The targets must be in [0, {n_classes}), the amount of nodes in the last layer. "
+        message += f"Was in [{y_data.min()}, {y_data.max()}]. "
+        raise ValueError(message)
+
+
+class MinibatchIterator:
+    """
+    Iterates over minibatches `(x_batch, y_batch)` of a dataset, once per call to `iter()`.
+
+    If `shuffle` is True, a new permutation is drawn from a seeded `np.random.Generator` every epoch, so the epochs
+    are different but the whole training run is reproducible. The last batch is smaller than `batch_size` if
+    `batch_size` does not divide the amount of datapoints, unless `drop_last` is True.
+    If `prefetch` is True, the next batch is gathered in a background thread while the current batch is used,
+    so the row gathers overlap with the matrix multiplications in the training loop.
+
+    Args:
+        x_data (np.array): [n x p]-shaped input data. Can be anything that supports row indexing, like a memmap or
+            an `IndexedArray`.
+        y_data (np.array): [n x ...]-shaped targets corresponding to `x_data`.
+        batch_size (int): The amount of datapoints in each batch.
+        shuffle (bool): If True, the data is iterated in a new random order every epoch.
+        drop_last (bool): If True, the last batch is skipped if it is smaller than `batch_size`.
+        prefetch (bool): If True, gathers the next batch in a background thread.
+        seed (int): Random seed for the permutations.
+    """
+
+    def __init__(self, x_data, y_data, batch_size, shuffle=True, drop_last=False, prefetch=True, seed=57):
+        if batch_size < 1:
+            raise ValueError(f"Argument `batch_size` must be a positive integer. Was {batch_size}. ")
+        self.x_data = x_data
+        self.y_data = y_data
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.prefetch = prefetch
+        self.rng = np.random.default_rng(seed=seed)
+
+    def __len__(self):
+        n = self.x_data.shape[0]
+        if self.drop_last:
+            return n // self.batch_size
+        return int(np.ceil(n / self.batch_size))
+
+    def _batch_keys(self):
+        """
+        Makes the row indices (or slices when not shuffling) of every batch in one epoch.
+
+        Returns:
+            list: List of the keys to index the batches with.
+        """
+        n = self.x_data.shape[0]
+        b = self.batch_size
+        starts = range(0, b * len(self), b)
+        if not self.shuffle:
+            return [slice(start, min(start + b, n)) for start in starts]
+
+        order = self.rng.permutation(n)
+        # The order inside a batch does not change the gradient, and sorted rows are gathered with better locality
+        return [np.sort(order[start : start + b]) for start in starts]
+
+    def _gather(self, key):
+        return self.x_data[key], self.y_data[key]
+
+    def __iter__(self):
+        keys = self._batch_keys()
+        if not self.prefetch or len(keys) < 2:
+            for key in keys:
+                yield self._gather(key)
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_batch = executor.submit(self._gather, keys[0])
+            for key in keys[1:]:
+                batch = next_batch.result()
+                next_batch = executor.submit(self._gather, key)
+                yield batch
+            yield next_batch.result()
+
+
 class IdentityActivation:
     def __call__(self, x_data):
         return x_data
 
-    def diff(self, x_data):
-        return np.ones(x_data.shape)
+    def diff(self, x_data, out=None):
+        if out is None:
+            return np.ones(x_data.shape, dtype=x_data.dtype)
+        out.fill(1)
+        return out
+
+
+def _accepts_out(function):
+    """
+    Checks if `function` takes an `out` argument to write its result into, like NumPy ufuncs.
+
+    Arguments:
+        function (callable): Function to check, for example an activation function or its `diff` method.
+
+    Returns:
+        bool: True if `function` can be called as `function(x_data, out=out)`.
+    """
+    try:
+        return "out" in inspect.signature(function).parameters
+    except (TypeError, ValueError):  # Builtins without signature
+        return False
+
+
+class _Workspace:
+    """
+    Buffers for the forward pass and backpropagation, allocated once for a maximum batch size.
+    Batches that are smaller than `batch_size` use the first rows of the buffers.
+
+    Activation functions are called with `out=` when they take it (see `_accepts_out()`), otherwise their returned
+    arrays are used as they are.
+
+    Arguments:
+        layer_sizes (list of int): List of the amount of nodes in each layer.
+        activation_functions (list of callable): The activation functions of the network.
+        batch_size (int): The largest batch that fits in the buffers.
+        dtype (np.dtype): Dtype of the buffers.
+        inference_only (bool): If True, only allocates the buffers for the forward pass.
+    """
+
+    def __init__(self, layer_sizes, activation_functions, batch_size, dtype, inference_only=False):
+        self.batch_size = batch_size
+        self.activation_functions = activation_functions
+        sizes = list(zip(layer_sizes[:-1], layer_sizes[1:]))  # (n(l-1), n(l)) for every layer after the input
+        self.weighted_sums = [np.empty((batch_size, n_out), dtype=dtype) for _, n_out in sizes]
+        if not inference_only:
+            self.deltas = [np.empty((batch_size, n_out), dtype=dtype) for _, n_out in sizes]
+
+        # Only allocate buffers for the activation functions that can write to them
+        self.activations = []
+        self.derivatives = []
+        for function, (_, n_out) in zip(activation_functions, sizes):
+            call_out = _accepts_out(function)
+            diff_out = _accepts_out(function.diff)
+            self.activations.append(np.empty((batch_size, n_out), dtype=dtype) if call_out else None)
+            self.derivatives.append(np.empty((batch_size, n_out), dtype=dtype) if diff_out else None)
+
+    def fits(self, n_data):
+        return n_data <= self.batch_size
+
+    @property
+    def nbytes(self):
+        buffers = self.weighted_sums + getattr(self, "deltas", []) + self.activations + self.derivatives
+        return sum(buffer.nbytes for buffer in buffers if buffer is not None)
+
+    def activate(self, index, weighted_sum):
+        out = self.activations[index]
+        if out is None:
+            return self.activation_functions[index](weighted_sum)
+        return self.activation_functions[index](weighted_sum, out=out[: weighted_sum.shape[0]])
+
+    def diff(self, index, weighted_sum):
+        out = self.derivatives[index]
+        if out is None:
+            return self.activation_functions[index].diff(weighted_sum)
+        return self.activation_functions[index].diff(weighted_sum, out=out[: weighted_sum.shape[0]])
+
+
+def _training_bytes_per_datapoint(layer_sizes, dtype):
+    """
+    Estimates the memory used per datapoint in a minibatch when training: the input row, and the weighted sums,
+    activations, derivatives and deltas of every layer after the input layer (see `_Workspace`).
+
+    Arguments:
+        layer_sizes (list of int): List of the amount of nodes in each layer.
+        dtype (np.dtype): Dtype of the network.
+
+    Returns:
+        int: The estimated amount of bytes.
+    """
+    return np.dtype(dtype).itemsize * (layer_sizes[0] + 4 * sum(layer_sizes[1:]))
+
+
+def _split_parameters(values, layer_sizes):
+    """
+    Makes weight and bias views into a flat array of parameters. All the weights come first, layer by layer in
+    row-major order, and then all the biases.
+
+    Arguments:
+        values (np.array): [k]-shaped array with all the parameters.
+        layer_sizes (list of int): List of the amount of nodes in each layer.
+
+    Returns:
+        weights (list): List of [n(l) x n(l-1)]-shaped views into `values`.
+        biases (list): List of [1 x n(l)]-shaped views into `values`.
+    """
+    weights = []
+    biases = []
+    offset = 0
+    for n_in, n_out in zip(layer_sizes[:-1], layer_sizes[1:]):
+        weights.append(values[offset : offset + n_out * n_in].reshape(n_out, n_in))
+        offset += n_out * n_in
+    for n_out in layer_sizes[1:]:
+        biases.append(values[offset : offset + n_out].reshape(1, n_out))
+        offset += n_out
+    return weights, biases
+
+
+def _count_parameters(layer_sizes):
+    return sum(n_out * n_in + n_out for n_in, n_out in zip(layer_sizes[:-1], layer_sizes[1:]))
 
 
 class NeuralNetwork:
@@ -204,7 +771,7 @@ class NeuralNetwork:
     dC/dw(l) [n(l) x n(l-1)] = del(l).T [n(l) x n] @ a(l-1) [n x n(l-1)]
     """
 
-    def __init__(self, layer_sizes, activation_functions, initialization_method="normal", seed=57):
+    def __init__(self, layer_sizes, activation_functions, initialization_method="normal", seed=57, dtype=np.float64):
         """
         Sets class variables for layer sizes, the amount of layers and the activation functions.
 
@@ -217,17 +784,35 @@ class NeuralNetwork:
             initialization_method (str): How the weights should be initialize. Please see the doc-string for
                 `_initialize_weights()` for more information.
             seed (int): Random seed to make results reproducible.
+            dtype (np.dtype): Floating point dtype of the weights, biases, activations, deltas and targets. With
+                `np.float32`, inputs are cast to float32 in `forward()` and nothing is promoted to float64 during
+                training, which halves the memory traffic. Defaults to `np.float64`.
         """
         np.random.seed(seed=seed)
+        self.seed = seed
+        self.dtype = np.dtype(dtype)
         self.n_layers = len(layer_sizes)
         self.layer_sizes = layer_sizes
         self.activation_functions = activation_functions
+        self.workspace = None
+        self.loss_gradient = "squared_error"  # See `train()`
+        self.optimizer = None
+        self.micro_batch_size = None  # See `train()`
+        self.checkpoint_every = None  # See `train()`
+        self.n_epochs_trained = 0  # Over all calls to `train()`, see `_shuffle_seed()`
+        self.stop_training = False  # Set to True by a callback to stop `train()` after the current epoch
         self._initialize_weights(layer_sizes=layer_sizes, initialization_method=initialization_method)
 
     def _initialize_weights(self, layer_sizes, initialization_method):
         """
         Initializes weights based on the `initialization_method` argument. Biases are set to zero.
 
+        All weights and biases are views into one contiguous array, `self.parameters` (see `_split_parameters()`),
+        and the gradients are computed into views of a matching array, `self.gradients`. An update of all the
+        parameters is then one vectorised operation on `self.parameters`. Update the weights and biases in place
+        (for example with `-=`), since assigning new arrays to `self.weights[i]` would disconnect them from
+        `self.parameters`.
+
         Methods:
             "zeros": Sets all weights to zeros. Used for debugging, not good for training models.
             "ones": Sets all weights to ones. Used for debugging, not good for training models.
@@ -237,53 +822,350 @@ class NeuralNetwork:
             layers_sizes (list): List of int of nodes in each layer.
             initialization_method (str): Method to use, see above.
         """
-        self.biases = [np.zeros((1, layer_sizes[i])) for i in range(1, len(layer_sizes))]
-
         method = initialization_method.lower().strip()
-        self.weights = []
+        if method not in ["zeros", "ones", "normal"]:
+            message = 'Argument `method` must be in ["zeros", "ones", "normal"]. '
+            message += f"Was {method}. "
+            raise ValueError(message)
 
-        if method == "zeros":
-            for i in range(len(layer_sizes) - 1):
-                self.weights.append(np.zeros((layer_sizes[i + 1], layer_sizes[i])))
+        self._set_parameters(np.zeros(_count_parameters(layer_sizes), dtype=self.dtype))
 
-        elif method == "ones":
-            for i in range(len(layer_sizes) - 1):
-                self.weights.append(np.ones((layer_sizes[i + 1], layer_sizes[i])))
+        if method == "ones":
+            for weights in self.weights:
+                weights.fill(1)
 
         elif method == "normal":
-            for i in range(len(layer_sizes) - 1):
+            for i, weights in enumerate(self.weights):
                 std = 1 / np.sqrt(layer_sizes[i])
-                self.weights.append(np.random.randn(layer_sizes[i + 1], layer_sizes[i]) * std)
+                # Drawn in float64 for all dtypes, so the initial values are the same
+                weights[...] = np.random.randn(layer_sizes[i + 1], layer_sizes[i]) * std
 
-        else:
-            message = 'Argument `method` must be in ["zeros", "ones", "normal"]. '
-            message += f"Was {method}. "
+    def _set_parameters(self, values):
+        """
+        Makes `values` the storage of the weights and biases, and allocates a matching gradient array.
+
+        Arguments:
+            values (np.array): [k]-shaped array with all the parameters, laid out as in `_split_parameters()`.
+        """
+        self.parameters = values
+        self.weights, self.biases = _split_parameters(values, self.layer_sizes)
+        self.gradients = np.zeros(values.shape[0], dtype=self.dtype)
+        self.d_weights, self.d_biases = _split_parameters(self.gradients, self.layer_sizes)
+
+    def count_parameters(self):
+        """
+        Counts the amount of trainable parameters in the model, which is the amount of weights plus biases.
+
+        Returns:
+            int: The amount of trainable parameters in the model.
+        """
+        return int(self.parameters.size)
+
+    def save(self, path):
+        """
+        Saves the network to a single file, that can be memory-mapped by `NeuralNetwork.load()`.
+
+        The file starts with `_NETWORK_FILE_MAGIC`, then the length of a JSON header as a little-endian uint64, then
+        the JSON header, padded to a multiple of `_NETWORK_FILE_ALIGNMENT` bytes. The header has the layer sizes,
+        dtype, seed, amount of epochs trained, the class names of the activation functions and the shape and offset of
+        every parameter.
+        After the header, `self.parameters` is stored as one contiguous little-endian array.
+
+        Arguments:
+            path (str): Path to write the file to.
+        """
+        parameters = self.weights + self.biases
+        names = [f"weights_{i}" for i in range(len(self.weights))] + [f"biases_{i}" for i in range(len(self.biases))]
+        file_dtype = self.dtype.newbyteorder("<")
+
+        offset = 0
+        parameter_info = []
+        for name, parameter in zip(names, parameters):
+            parameter_info.append({"name": name, "shape": list(parameter.shape), "offset": offset})
+            offset += parameter.size
+
+        header = {
+            "format_version": _NETWORK_FILE_VERSION,
+            "layer_sizes": [int(size) for size in self.layer_sizes],
+            "dtype": file_dtype.str,
+            "seed": None if self.seed is None else int(self.seed),  # Also NumPy integers, which JSON does not take
+            "n_epochs_trained": int(self.n_epochs_trained),
+            "activation_functions": [type(function).__name__ for function in self.activation_functions],
+            "parameters": parameter_info,
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        prefix_length = len(_NETWORK_FILE_MAGIC) + 8 + len(header_bytes)
+        header_bytes += b" " * (-prefix_length % _NETWORK_FILE_ALIGNMENT)
+
+        with open(path, "wb") as outfile:
+            outfile.write(_NETWORK_FILE_MAGIC)
+            outfile.write(len(header_bytes).to_bytes(8, "little"))
+            outfile.write(header_bytes)
+            outfile.write(np.ascontiguousarray(self.parameters, dtype=file_dtype).tobytes())
+
+    @classmethod
+    def load(cls, path, activation_functions=None, activation_classes=None, mmap_mode="c"):
+        """
+        Loads a network saved with `save()`.
+
+        By default the parameters are memory-mapped, so loading costs opening the file, and processes that load the
+        same file share the pages. `self.parameters` is then the memmap, and the weights and biases are views into it.
+
+        Arguments:
+            path (str): Path to the file.
+            activation_functions (list of callable, optional): Activation functions to use. If None, they are made
+                from the class names in the file, see `activation_classes`.
+            activation_classes (dict, optional): Dictionary from class name to activation function class, for the
+                classes that are not in this module, for example `{"ReLU": ReLU, "Sigmoid": Sigmoid}`. The classes
+                are called without arguments.
+            mmap_mode (str, optional): Mode for `np.memmap`. "c" (copy-on-write) shares the pages until the
+                parameters are changed, for example by training, "r" is read-only. If None, the parameters are read
+                into memory.
+
+        Raises:
+            ValueError: If the file is not a network file, or an activation function class is unknown.
+
+        Returns:
+            NeuralNetwork: The loaded network.
+        """
+        with open(path, "rb") as infile:
+            magic = infile.read(len(_NETWORK_FILE_MAGIC))
+            if magic != _NETWORK_FILE_MAGIC:
+                raise ValueError(f"File {path} is not a network saved with `NeuralNetwork.save()`. ")
+            header_length = int.from_bytes(infile.read(8), "little")
+            header = json.loads(infile.read(header_length).decode("utf-8"))
+        if header["format_version"] != _NETWORK_FILE_VERSION:
+            message = f"Network file format version {header['format_version']} is not supported. "
+            message += f"Expected {_NETWORK_FILE_VERSION}. "
             raise ValueError(message)
 
+        if activation_functions is None:
+            known_classes = {"IdentityActivation": IdentityActivation}
+            known_classes.update(activation_classes or {})
+            unknown = [name for name in header["activation_functions"] if name not in known_classes]
+            if unknown:
+                message = f"Activation function classes {unknown} are unknown. "
+                message += "Pass them in `activation_classes`, for example `activation_classes={'ReLU': ReLU}`. "
+                raise ValueError(message)
+            activation_functions = [known_classes[name]() for name in header["activation_functions"]]
+
+        dtype = np.dtype(header["dtype"])
+        data_offset = len(_NETWORK_FILE_MAGIC) + 8 + header_length
+        n_values = sum(int(np.prod(info["shape"])) for info in header["parameters"])
+        if mmap_mode is None:
+            values = np.fromfile(path, dtype=dtype, count=n_values, offset=data_offset)
+        else:
+            values = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=data_offset, shape=(n_values,))
+
+        network = cls(
+            layer_sizes=header["layer_sizes"],
+            activation_functions=activation_functions,
+            initialization_method="zeros",
+            seed=header["seed"],
+            dtype=dtype.newbyteorder("="),
+        )
+        network._set_parameters(values)  # The layout in the file is the same as `self.parameters`
+        network.n_epochs_trained = header.get("n_epochs_trained", 0)  # Not in files saved by older versions
+        return network
+
+    def _shuffle_seed(self):
+        """
+        Returns the seed of the minibatch order for the next call to `train()`. The first call uses `self.seed`, and
+        later calls are offset by the amount of epochs already trained, so continuing training (for example after
+        early stopping, or in a sweep) does not repeat the permutations of the first call. Stays reproducible, and is
+        kept across `save()` and `load()`.
+        """
+        if self.n_epochs_trained == 0 or self.seed is None:
+            return self.seed
+        return [int(self.seed), int(self.n_epochs_trained)]
+
+    def allocate_workspace(self, batch_size):
+        """
+        Allocates buffers for the forward pass, backpropagation and parameter updates for batches of up to
+        `batch_size` datapoints. While the workspace is allocated, `forward()`, `_backprop()` and `_sgd()` write into
+        these buffers instead of allocating new arrays for every minibatch. Note that `self.weighted_sums` and
+        `self.activations` are then views into the buffers, which are overwritten by the next call to `forward()`.
+
+        Arguments:
+            batch_size (int): The largest amount of datapoints that will be forwarded at once.
+        """
+        self.workspace = _Workspace(
+            layer_sizes=self.layer_sizes,
+            activation_functions=self.activation_functions,
+            batch_size=batch_size,
+            dtype=self.dtype,
+        )
+
+    def release_workspace(self):
+        """
+        Frees the buffers from `allocate_workspace()`. Arrays are allocated for every call again after this.
+        """
+        self.workspace = None
+
+    def _get_workspace(self, n_data):
+        """
+        Returns the workspace if it is allocated and large enough for `n_data` datapoints, else None.
+        """
+        if self.workspace is not None and self.workspace.fits(n_data):
+            return self.workspace
+        return None
+
     def forward(self, x_data):
         """
         Feeds the data forward. Do not discretize the output (give logits values).
         For each layer, calculates the activations, and feeds forward.
 
         Arguments:
-            x_data (np.array): [n x m] data to forward.
+            x_data (np.array or scipy.sparse matrix): [n x m] data to forward. Sparse data is kept sparse, and
+                multiplied with sparse-dense multiplication in the first layer.
 
         Returns:
             activations (np.array): [n x c] array over logits outputs (activations of last layer).
         """
-        pass
+        x_data = _as_input(x_data, self.dtype)  # Cast once here, so the matrix multiplications are not promoted
+        n_data = x_data.shape[0]
+        workspace = self._get_workspace(n_data)
+        self.weighted_sums = []
+        self.activations = [x_data]  # The activations of the input layer is the input
+
+        activations = x_data
+        for i in range(self.n_layers - 1):
+            # z(l) [n x n(l)] = a(l-1) [n x n(l-1)] @ w(l).T [n(l-1) x n(l)] + b(l) [1 x n(l)]
+            out = None if workspace is None else workspace.weighted_sums[i][:n_data]
+            weighted_sum = _matmul_transposed(activations, self.weights[i], out=out)
+            weighted_sum += self.biases[i]
+            self.weighted_sums.append(weighted_sum)
+
+            if workspace is None:
+                activations = self.activation_functions[i](weighted_sum)
+            else:
+                activations = workspace.activate(i, weighted_sum)
+            self.activations.append(activations)
 
-    def predict(self, x_data):
+        return activations
+
+    def _forward_stateless(self, x_data, workspace):
+        """
+        Feeds one batch forward with the buffers in `workspace`, without storing anything on `self`.
+
+        Arguments:
+            x_data (np.array): [b x m] data to forward, with b at most `workspace.batch_size`.
+            workspace (_Workspace): Buffers to write the weighted sums (and activations, if possible) into.
+
+        Returns:
+            np.array: [b x c] array over logits outputs. May be a view into `workspace`.
+        """
+        n_data = x_data.shape[0]
+        activations = _as_input(x_data, self.dtype)
+        for i in range(self.n_layers - 1):
+            weighted_sum = _matmul_transposed(activations, self.weights[i], out=workspace.weighted_sums[i][:n_data])
+            weighted_sum += self.biases[i]
+            activations = workspace.activate(i, weighted_sum)
+        return activations
+
+    def iter_logits(self, x_data, batch_size=1024):
+        """
+        Feeds the data forward in chunks of `batch_size` datapoints, and yields the logits of each chunk.
+        Nothing is stored on `self`, and the same buffers are reused for every chunk, so the memory used is
+        proportional to `batch_size` and not to the amount of data.
+
+        Note that the yielded arrays are overwritten by the next chunk, so copy them to keep them.
+
+        Arguments:
+            x_data (np.array or iterable): [n x m] data to forward. Can be an array, a memmap, or anything else that
+                supports `shape` and row slicing. Anything else is treated as an iterable (for example a generator)
+                of [b x m]-shaped batches.
+            batch_size (int, optional): The amount of datapoints to forward at once. If None, an array is forwarded
+                all at once, and batches from an iterable are forwarded as they are.
+
+        Yields:
+            np.array: [b x c] array over logits outputs for each chunk.
+        """
+        workspace = None
+        for batch in _iter_row_chunks(x_data, batch_size):
+            n_data = batch.shape[0]
+            if workspace is None or not workspace.fits(n_data):
+                workspace = _Workspace(
+                    layer_sizes=self.layer_sizes,
+                    activation_functions=self.activation_functions,
+                    batch_size=n_data,
+                    dtype=self.dtype,
+                    inference_only=True,
+                )
+            yield self._forward_stateless(batch, workspace)
+
+    def _collect_outputs(self, x_data, batch_size, transform):
+        """
+        Runs `iter_logits()` and collects `transform(logits)` for every chunk in one array.
+
+        Arguments:
+            x_data (np.array or iterable): Data to forward, see `iter_logits()`.
+            batch_size (int, optional): The amount of datapoints to forward at once, see `iter_logits()`.
+            transform (callable): Function from [b x c] logits to a [b x ...] array.
+
+        Returns:
+            np.array: [n x ...] array of the transformed outputs.
+        """
+        n_data = x_data.shape[0] if hasattr(x_data, "shape") else None
+        outputs = None  # Allocated when the dtype and shape of the outputs are known
+        chunks = []  # Only used for iterables, where the amount of data is not known
+        start = 0
+        for logits in self.iter_logits(x_data, batch_size=batch_size):
+            result = transform(logits)
+            if n_data is None:
+                chunks.append(np.array(result))  # Copy, since the logits buffer is reused
+            else:
+                if outputs is None:
+                    outputs = np.empty((n_data,) + result.shape[1:], dtype=result.dtype)
+                outputs[start : start + result.shape[0]] = result
+            start += result.shape[0]
+
+        if n_data is None and chunks:
+            return np.concatenate(chunks)
+        if outputs is None:  # No data
+            return transform(np.empty((0, self.layer_sizes[-1]), dtype=self.dtype))
+        return outputs
+
+    def predict_logits(self, x_data, batch_size=1024):
+        """
+        Returns the logits of the data, forwarded in chunks without storing any activations (see `iter_logits()`).
+
+        Arguments:
+            x_data (np.array or iterable): [n x m] data to predict on, see `iter_logits()`.
+            batch_size (int, optional): The amount of datapoints to forward at once. Defaults to 1024.
+
+        Returns:
+            np.array: [n x c]-shaped array of logits.
+        """
+        return self._collect_outputs(x_data, batch_size=batch_size, transform=lambda logits: logits)
+
+    def predict_proba(self, x_data, batch_size=1024):
+        """
+        Returns the softmax probabilities of each class, forwarded in chunks without storing any activations
+        (see `iter_logits()`).
+
+        Arguments:
+            x_data (np.array or iterable): [n x m] data to predict on, see `iter_logits()`.
+            batch_size (int, optional): The amount of datapoints to forward at once. Defaults to 1024.
+
+        Returns:
+            np.array: [n x c]-shaped array of probabilities.
+        """
+        return self._collect_outputs(x_data, batch_size=batch_size, transform=softmax)
+
+    def predict(self, x_data, batch_size=1024):
         """
         Predicts on data, outputs the classes predicted.
+        The data is forwarded in chunks without storing any activations (see `iter_logits()`).
 
         Arguments:
-            x_data (np.array): [n x p]-shaped data to predict on.
+            x_data (np.array or iterable): [n x p]-shaped data to predict on, see `iter_logits()`.
+            batch_size (int, optional): The amount of datapoints to forward at once. Defaults to 1024.
 
         Returns:
             preds (np.array): [n]-shaped array of predicted classes (not one-hot-encoded).
         """
-        pass
+        return self._collect_outputs(x_data, batch_size=batch_size, transform=lambda logits: np.argmax(logits, axis=1))
 
     def _backprop(self, preds, targets):
         """
@@ -291,24 +1173,155 @@ class NeuralNetwork:
 
         Arguments:
             preds (np.array): [b x c] predictied logits values.
-            targets (np.array): [b x c] true target-values.
+            targets (np.array): [b] true targets as integers, or [b x c] one-hot-encoded true targets.
 
         Returns:
             deltas (list): List of deltas for each layer (except input layer).
         """
-        deltas = []  # Add deltas to list backwards (insert at 0 when adding)
+        n_data = preds.shape[0]
+        workspace = self._get_workspace(n_data)
+        deltas = [None] * (self.n_layers - 1)  # Filled in backwards
+
         # del(L) [n x c] = dC/dp [n x c] * s'(z(L)) [n x c]
-        delta_L = preds - targets
-        deltas.append(delta_L)
-        for i in range(1, self.n_layers - 1):
-            index = self.n_layers - i - 1
-            prev_delta = deltas[0]  # First element is the previous layers delta
+        out = None if workspace is None else workspace.deltas[-1][:n_data]
+        deltas[-1] = self._output_delta(preds, targets, out=out)
+        for index in range(self.n_layers - 2, 0, -1):
             # del(l) [n x n(l)] = (del(l+1) [n x n(l+1)] @ w(l+1) [n(l+1) x n(l)]) [n x n(l)] * s'(z(l)) [n x n(l)]
-            delta = prev_delta @ self.weights[index]
-            delta = delta * self.activation_functions[-(i + 1)].diff(self.weighted_sums[index - 1])
-            deltas.insert(0, delta)
+            out = None if workspace is None else workspace.deltas[index - 1][:n_data]
+            delta = np.matmul(deltas[index], self.weights[index], out=out)
+            if workspace is None:
+                delta *= self.activation_functions[index - 1].diff(self.weighted_sums[index - 1])
+            else:
+                delta *= workspace.diff(index - 1, self.weighted_sums[index - 1])
+            deltas[index - 1] = delta
         return deltas
 
+    def _output_delta(self, preds, targets, out=None):
+        """
+        Computes the delta of the last layer, del(L), from the gradient in `self.loss_gradient`.
+
+        Arguments:
+            preds (np.array): [b x c] predictied logits values.
+            targets (np.array): [b] true targets as integers, or [b x c] one-hot-encoded true targets.
+            out (np.array, optional): [b x c] array to write the delta into.
+
+        Returns:
+            np.array: [b x c] delta of the last layer.
+        """
+        if targets.ndim == 2:  # One-hot-encoded targets
+            if self.loss_gradient == "cross_entropy":
+                preds = softmax(preds)
+            return np.subtract(preds, targets, out=out)
+        if self.loss_gradient == "cross_entropy":  # del(L) = softmax(z(L)) - y, with identity in the last layer
+            out = np.empty(preds.shape, dtype=self.dtype) if out is None else out
+            _, delta = softmax_cross_entropy(preds, targets, return_grad=True, out=out)
+            return delta
+        # del(L) = z(L) - y, subtracting 1 at the true class instead of making the one-hot matrix
+        if out is None:
+            out = preds.copy()
+        else:
+            out[...] = preds
+        out[np.arange(preds.shape[0]), targets] -= 1
+        return out
+
+    def _compute_layer_gradients(self, index, delta, activations):
+        """
+        Computes the summed (not averaged) gradients of one layer into `self.d_biases[index]` and
+        `self.d_weights[index]`.
+
+        Arguments:
+            index (int): The index of the layer in `self.weights`.
+            delta (np.array): [n x n(l)] delta of the layer.
+            activations (np.array): [n x n(l-1)] activations of the layer before, the inputs of the layer.
+        """
+        # dC/db(l) [n(l)] = del(l) [n x n(l)].sum(axis=0)
+        np.sum(delta, axis=0, keepdims=True, out=self.d_biases[index])
+
+        # dC/dw(l) [n(l) x n(l-1)] = del(l).T [n(l) x n] @ a(l-1) [n x n(l-1)]
+        if _is_sparse(activations):  # Sparse input data, only touches the nonzero values
+            self.d_weights[index][...] = delta.T @ activations
+        else:
+            np.matmul(delta.T, activations, out=self.d_weights[index])
+
+    def _compute_gradients(self, deltas, n_data):
+        """
+        Computes the gradients of the loss with respect to the weights and biases, averaged over the minibatch.
+        The gradients are written into `self.gradients`, through the views `self.d_weights` and `self.d_biases`.
+
+        Arguments:
+            deltas (list): The delta values returned from _backprop.
+            n_data (int): Amount of datapoints used in minibatch
+        """
+        for i in range(self.n_layers - 1):
+            self._compute_layer_gradients(i, deltas[i], self.activations[i])
+        self.gradients /= n_data
+
+    def _forward_checkpointed(self, x_data):
+        """
+        Feeds the data forward for gradient checkpointing, see `train(..., checkpoint_every=k)`. Only keeps the
+        checkpoints: the input, and the weighted sums z(l) of every k-th layer, which start the segments that
+        `_checkpointed_gradients()` recomputes. Nothing is stored on `self`.
+
+        Arguments:
+            x_data (np.array or scipy.sparse matrix): [n x m] data to forward.
+
+        Returns:
+            np.array: [n x c] array over logits outputs.
+            dict: The checkpoints, from the index of the first layer of each segment to the input (for 0), or the
+                weighted sums of the layer before.
+        """
+        activations = _as_input(x_data, self.dtype)
+        checkpoints = {0: activations}
+        for i in range(self.n_layers - 1):
+            weighted_sum = _matmul_transposed(activations, self.weights[i])
+            weighted_sum += self.biases[i]
+            if (i + 1) % self.checkpoint_every == 0 and i + 1 < self.n_layers - 1:
+                checkpoints[i + 1] = weighted_sum
+            activations = self.activation_functions[i](weighted_sum)
+        return activations, checkpoints
+
+    def _checkpointed_gradients(self, x_data, targets, n_data):
+        """
+        Computes the gradients into `self.gradients` with gradient checkpointing (activation recomputation).
+        Forwards with `_forward_checkpointed()`, and then backpropagates one segment of layers at a time, from the
+        last segment to the first. The weighted sums and activations of each segment are recomputed from its
+        checkpoint, used for the deltas and gradients of the segment, and freed before the next segment.
+
+        With L layers and segments of k layers, this stores about L / k checkpoints and the activations of k layers
+        at a time instead of all L layers, at the cost of about one extra forward pass. k = sqrt(L) gives memory
+        proportional to sqrt(L).
+
+        Arguments:
+            x_data (np.array or scipy.sparse matrix): [b x p]-shaped input data.
+            targets (np.array): [b] true targets as integers, or [b x c] one-hot-encoded true targets.
+            n_data (int): The amount of datapoints to average the gradients over.
+        """
+        preds, checkpoints = self._forward_checkpointed(x_data)
+        delta = self._output_delta(preds, targets)
+        starts = sorted(checkpoints)
+        stops = starts[1:] + [self.n_layers - 1]
+        for start, stop in reversed(list(zip(starts, stops))):
+            # Recompute the segment. z(stop - 1) is not needed, since its delta is already known
+            if start == 0:
+                activations = [checkpoints[0]]
+            else:
+                activations = [self.activation_functions[start - 1](checkpoints[start])]
+            weighted_sums = []
+            for i in range(start, stop - 1):
+                weighted_sum = _matmul_transposed(activations[-1], self.weights[i])
+                weighted_sum += self.biases[i]
+                weighted_sums.append(weighted_sum)
+                activations.append(self.activation_functions[i](weighted_sum))
+
+            for i in range(stop - 1, start - 1, -1):
+                self._compute_layer_gradients(i, delta, activations[i - start])
+                if i > 0:
+                    # del(l) = (del(l+1) @ w(l+1)) * s'(z(l)), with z(l) from the checkpoint at the segment start
+                    weighted_sum = weighted_sums[i - 1 - start] if i > start else checkpoints[start]
+                    delta = np.matmul(delta, self.weights[i])
+                    delta *= self.activation_functions[i - 1].diff(weighted_sum)
+        self.gradients /= n_data
+
     def _sgd(self, deltas, eta, n_data):
         """
         Uses vanilla Stochastic Gradient Descent (SGD) to update parameters.
@@ -318,39 +1331,177 @@ class NeuralNetwork:
             eta (float): Learning rate of the optimizer.
             n_data (int): Amount of datapoints used in minibatch
         """
-        for i in range(self.n_layers - 1):
-            # dC/db(l) [n(l)] = del(l) [n x n(l)].sum(axis=0)
-            d_biases = deltas[i].sum(axis=0)  # Normal update term
-            self.biases[i] -= (eta / n_data) * d_biases
+        self._compute_gradients(deltas, n_data)
+        self.gradients *= eta  # The gradient array is scratch space, so the update term is made in place
+        self.parameters -= self.gradients
 
-            # dC/dw(l) [n(l) x n(l-1)] = del(l).T [n(l) x n] @ a(l-1) [n x n(l-1)]
-            d_weights = deltas[i].T @ self.activations[i]  # Normal update term
-            self.weights[i] -= (eta / n_data) * d_weights
+    def _apply_gradients(self, eta):
+        """
+        Updates the parameters from the gradients already in `self.gradients`, with `self.optimizer`, or with a
+        vanilla SGD step if no optimizer is set. Used when the gradients are computed elsewhere, see `parallel.py`.
 
-    def _run_single_epoch(self, x_train, y_train, minibatch_size, eta):
+        Arguments:
+            eta (float): Learning rate of the optimizer.
+        """
+        if self.optimizer is None:
+            self.gradients *= eta
+            self.parameters -= self.gradients
+            return
+        self.optimizer.step([self.parameters], [self.gradients], eta)
+
+    def _update_parameters(self, deltas, eta, n_data):
+        """
+        Updates the parameters with `self.optimizer`, or with `_sgd()` if no optimizer is set.
+
+        Arguments:
+            deltas (list): The delta values returned from _backprop.
+            eta (float): Learning rate of the optimizer.
+            n_data (int): Amount of datapoints used in minibatch
+        """
+        if self.optimizer is None:
+            self._sgd(deltas, eta, n_data)
+            return
+        self._compute_gradients(deltas, n_data)
+        self._apply_gradients(eta)
+
+    def _accumulate_and_update(self, batch, targets, eta, profiler=None):
+        """
+        Gradient accumulation. Splits a minibatch into micro-batches of `self.micro_batch_size` datapoints, sums
+        their gradients into `self.gradient_sum` and updates the parameters once, with the same result as forwarding
+        the whole minibatch at once. Only the activations of one micro-batch are held in memory at a time.
+
+        Arguments:
+            batch (np.array): [b x p]-shaped input data.
+            targets (np.array): [b] true targets as integers, or [b x c] one-hot-encoded true targets.
+            eta (float): Learning rate.
+            profiler (TrainingProfiler, optional): If not None, times the forward pass, backpropagation and update.
+        """
+        n_data = batch.shape[0]
+        for start in range(0, n_data, self.micro_batch_size):
+            stop = start + self.micro_batch_size
+            start_time = time.perf_counter()
+            # The gradients are divided by the whole minibatch size, so the sum is the mean
+            if self.checkpoint_every is not None:
+                after_forward = start_time  # The forward pass is part of the recomputation, timed as backprop
+                self._checkpointed_gradients(batch[start:stop], targets[start:stop], n_data)
+                after_backprop = time.perf_counter()
+            else:
+                preds = self.forward(batch[start:stop])
+                after_forward = time.perf_counter()
+                deltas = self._backprop(preds, targets[start:stop])
+                after_backprop = time.perf_counter()
+                self._compute_gradients(deltas, n_data)
+            if start == 0:
+                self.gradient_sum[...] = self.gradients
+            else:
+                self.gradient_sum += self.gradients
+            if profiler is not None:
+                profiler.record("forward", start_time, after_forward)
+                profiler.record("backprop", after_forward, after_backprop)
+                profiler.record("update", after_backprop, time.perf_counter())
+
+        start_time = time.perf_counter()
+        self.gradients[...] = self.gradient_sum
+        self._apply_gradients(eta)
+        if profiler is not None:
+            profiler.record("update", start_time, time.perf_counter())
+
+    def _run_single_epoch(self, batches, eta, profiler=None, callbacks=()):
         """
         Perform one epoch of training.
 
         Arguments:
-            x_train (np.array): [n x p]-shaped input data of n inputs and p features.
-            y_train (np.array): [n x c]-shaped array of one-hot-encoded true targets.
+            batches (iterable): Iterable of `(x_batch, y_batch)` tuples, where `x_batch` is [b x p]-shaped input data
+                and `y_batch` is [b]-shaped true targets as integers, or [b x c]-shaped one-hot-encoded true targets.
+                See `MinibatchIterator`.
             eta (float): Learning rate.
-            minibatch_size (int): Size of mini-batch for stocastich gradient descent (SGD).
+            profiler (TrainingProfiler, optional): If not None, times each phase of every minibatch, see
+                `profiling.py`.
+            callbacks (list of Callback): Callbacks whose `on_batch_end()` is called after every minibatch.
         """
-        b = minibatch_size
-        n = x_train.shape[0]
-        for i in range(int(n / b)):  # Loop over all the minibatches for SGD
-            upper_index = np.min((n, (i + 1) * b))  # Round of in case batch-size does not match up with n.
-            n_data = upper_index - i * b  # Should be b unless last iteration
-            batch = x_train[i * b : upper_index]  # Index batch
-            targets = y_train[i * b : upper_index]  # Index targets
-            preds = self.forward(batch)  # Get logits (ouput-nodes) values, and save other values
-            deltas = self._backprop(preds, targets)  # Get delta-error terms from backprop
-            self._sgd(deltas, eta, n_data)  # Update parameters
+        if profiler is not None:
+            self._run_single_epoch_profiled(batches, eta, profiler, callbacks)
+            return
+
+        for n_batch, (batch, targets) in enumerate(batches):  # Loop over all the minibatches for SGD
+            n_data = batch.shape[0]  # Should be b unless last iteration
+            if self.micro_batch_size is not None and n_data > self.micro_batch_size:
+                self._accumulate_and_update(batch, targets, eta)
+            elif self.checkpoint_every is not None:
+                self._checkpointed_gradients(batch, targets, n_data)
+                self._apply_gradients(eta)
+            else:
+                preds = self.forward(batch)  # Get logits (ouput-nodes) values, and save other values
+                deltas = self._backprop(preds, targets)  # Get delta-error terms from backprop
+                self._update_parameters(deltas, eta, n_data)  # Update parameters
+            for callback in callbacks:
+                callback.on_batch_end(self, n_batch, n_data)
+
+    def _run_single_epoch_profiled(self, batches, eta, profiler, callbacks=()):
+        """
+        Same as `_run_single_epoch()`, recording the time of each phase in `profiler`.
+        """
+        batches = iter(batches)
+        n_batch = 0
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                return
+            batch, targets = batch
+            n_data = batch.shape[0]
+            after_batch = time.perf_counter()
+            profiler.record("batch", start, after_batch)
+            if self.micro_batch_size is not None and n_data > self.micro_batch_size:
+                self._accumulate_and_update(batch, targets, eta, profiler=profiler)
+            elif self.checkpoint_every is not None:
+                self._checkpointed_gradients(batch, targets, n_data)
+                after_backprop = time.perf_counter()
+                self._apply_gradients(eta)
+                profiler.record("backprop", after_batch, after_backprop)  # Includes the forward pass
+                profiler.record("update", after_backprop, time.perf_counter())
+            else:
+                preds = self.forward(batch)
+                after_forward = time.perf_counter()
+                deltas = self._backprop(preds, targets)
+                after_backprop = time.perf_counter()
+                self._update_parameters(deltas, eta, n_data)
+                after_update = time.perf_counter()
+                profiler.record("forward", after_batch, after_forward)
+                profiler.record("backprop", after_forward, after_backprop)
+                profiler.record("update", after_backprop, after_update)
+            profiler.record_step(n_data)
+            for callback in callbacks:
+                callback.on_batch_end(self, n_batch, n_data)
+            n_batch += 1
+
+    def _evaluate(self, x_data, y_data, loss_func, accuracy_func, batch_size=None):
+        """
+        Calculates loss and accuracy from a single forward pass, see `iter_logits()`.
+
+        Arguments:
+            x_data (np.array): [n x p]-shaped input data of n inputs and p features.
+            y_data (np.array): [n]-shaped array of true targets as integers.
+            loss_func (callable): Used for calculating loss.
+            accuracy_func (callable): Used for calculating accuracy.
+            batch_size (int, optional): The amount of datapoints to forward at once. If None, forwards all at once.
 
-    def _perform_evaluation(self, x_train, y_train, n_epoch, loss_func, accuracy_func, eval_set=None):
+        Returns:
+            float: The loss.
+            float: The accuracy.
+        """
+        logits = self.predict_logits(x_data, batch_size=batch_size)
+        loss = loss_func(y_data, logits)
+        accuracy = accuracy_func(y_data, np.argmax(logits, axis=1))  # Same as `predict()`, without forwarding again
+        return loss, accuracy
+
+    def _perform_evaluation(
+        self, x_train, y_train, n_epoch, loss_func, accuracy_func, eval_set=None, eval_batch_size=None
+    ):
         """
-        Perform evaluation of loss and optinal accuracy, on both train set and optinal evaluation.
+        Perform evaluation of loss and optinal accuracy, on both train set and optinal evaluation, and writes them
+        into `self.history`. Each set is forwarded once, in chunks of `eval_batch_size`, and the training caches in
+        `self.activations` and `self.weighted_sums` are not overwritten. Prints nothing, see `callbacks.ConsoleLogger`.
 
         Arguments:
             x_train (np.array): [n x p]-shaped input data of n inputs and p features.
@@ -361,30 +1512,83 @@ class NeuralNetwork:
             eval_set (tuple, optional): If not None, will calculate validation loss and accuracy after each epoch.
                 Should be on the format `eval_set = (x_val, y_val)`, where `x_val` and `y_val` corresponds
                 to `x_train` and `y_train`.
+            eval_batch_size (int, optional): The amount of datapoints to forward at once. If None, forwards each set
+                at once.
         """
-        train_logits = self.forward(x_train)
-        self.train_losses[n_epoch] = loss_func(y_train, train_logits)
-        train_preds = self.predict(x_train)
-        self.train_accuracies[n_epoch] = accuracy_func(y_train, train_preds)
+        train_loss, train_accuracy = self._evaluate(
+            x_train, y_train, loss_func=loss_func, accuracy_func=accuracy_func, batch_size=eval_batch_size
+        )
+        self.train_losses[n_epoch] = train_loss
+        self.train_accuracies[n_epoch] = train_accuracy
 
         if eval_set is not None:  # Stats for validation set
             x_val, y_val = eval_set
-            val_logits = self.forward(x_val)
-            self.val_losses[n_epoch] = loss_func(y_val, val_logits)
-            val_preds = self.predict(x_val)
-            self.val_accuracies[n_epoch] = accuracy_func(y_val, val_preds)
+            val_loss, val_accuracy = self._evaluate(
+                x_val, y_val, loss_func=loss_func, accuracy_func=accuracy_func, batch_size=eval_batch_size
+            )
+            self.val_losses[n_epoch] = val_loss
+            self.val_accuracies[n_epoch] = val_accuracy
 
-            print(f"Train-loss: {self.train_losses[n_epoch]:.5f}, ", end="")
-            print(f"Validation-loss: {self.val_losses[n_epoch]:.5f}. ", end="")
-            print(f"Train-accuracy: {self.train_accuracies[n_epoch]:.5f}, ", end="")
-            print(f"Validation-accuracy: {self.val_accuracies[n_epoch]:.5f}")
+    def _allocate_history(self, n_epochs, use_val):
+        """
+        Allocates `self.history`, a structured array with one row of `HISTORY_DTYPE` per epoch, where everything
+        except the epoch numbers is NaN until it is recorded. `self.train_losses`, `self.train_accuracies`,
+        `self.epoch_times` and, if `use_val` is True, `self.val_losses` and `self.val_accuracies` are set to views of
+        its fields.
 
-    def train(self, x_train, y_train, eta, n_epochs, loss_func, accuracy_func, minibatch_size=64, eval_set=None):
+        Arguments:
+            n_epochs (int): The amount of epochs to allocate for.
+            use_val (bool): If there is an eval set.
+        """
+        self.history = np.zeros(n_epochs, dtype=HISTORY_DTYPE)
+        self.history["epoch"] = np.arange(n_epochs)
+        for name in HISTORY_DTYPE.names[1:]:
+            self.history[name] = np.nan
+        self.train_losses = self.history["train_loss"]
+        self.train_accuracies = self.history["train_accuracy"]
+        self.epoch_times = self.history["seconds"]
+        if use_val:
+            self.val_losses = self.history["val_loss"]
+            self.val_accuracies = self.history["val_accuracy"]
+
+    def train(
+        self,
+        x_train,
+        y_train,
+        eta,
+        n_epochs,
+        loss_func,
+        accuracy_func,
+        minibatch_size=64,
+        eval_set=None,
+        shuffle=True,
+        drop_last=False,
+        prefetch=True,
+        batch_iterator=None,
+        use_workspace=True,
+        optimizer=None,
+        eval_every=1,
+        eval_subsample=None,
+        eval_batch_size=4096,
+        patience=None,
+        monitor="val_loss",
+        min_delta=0.0,
+        restore_best=False,
+        max_seconds=None,
+        loss_gradient="squared_error",
+        profiler=None,
+        callbacks=None,
+        micro_batch_size=None,
+        max_memory_bytes=None,
+        checkpoint_every=None,
+    ):
         """
         Trains network.
 
         Arguments:
-            x_train (np.array): [n x p]-shaped input data of n inputs and p features.
+            x_train (np.array): [n x p]-shaped input data of n inputs and p features. Can also be a `scipy.sparse`
+                matrix, for example bag-of-words features, which is kept sparse (as CSR) in the minibatches, the first
+                layer and its weight gradients, so the memory used is proportional to the amount of nonzero values.
             y_train (np.array): [n]-shaped array of true targets as integers.
             eta (float): Learning rate.
             n_epochs (int): The amount of epochs (iterations over all data) to train for.
@@ -394,23 +1598,225 @@ class NeuralNetwork:
             eval_set (tuple, optional): If not None, will calculate validation loss and accuracy after each epoch.
                 Should be on the format `eval_set = (x_val, y_val)`, where `x_val` and `y_val` corresponds
                 to `x_train` and `y_train`.
+            shuffle (bool): If True, the training data is iterated in a new random order every epoch.
+            drop_last (bool): If True, the last minibatch is skipped if it is smaller than `minibatch_size`.
+            prefetch (bool): If True, the next minibatch is gathered in a background thread.
+            batch_iterator (iterable, optional): If not None, used instead of the default `MinibatchIterator`. Is
+                iterated once per epoch, and should yield `(x_batch, y_batch)` with `y_batch` as integers or one-hot
+                encoded.
+                `minibatch_size`, `shuffle`, `drop_last` and `prefetch` are then ignored.
+            use_workspace (bool): If True, allocates the buffers for one minibatch once (see `allocate_workspace()`)
+                and reuses them for every minibatch, instead of allocating new arrays for every minibatch.
+            optimizer (str or Optimizer, optional): Optimizer to update the parameters with, either an instance from
+                `optimizers.py` or one of the names "sgd", "momentum", "nesterov", "rmsprop", "adam" and "adamw".
+                Uses `eta` as the learning rate. If None, uses vanilla SGD through `_sgd()`. The optimizer is kept in
+                `self.optimizer`. Pass it to `train()` again to continue training with the same optimizer state.
+            eval_every (int): Evaluate every `eval_every` epochs, and after the last epoch. The losses and accuracies
+                of the epochs in between are NaN.
+            eval_subsample (int, optional): If not None, evaluates on a random subsample of at most this many
+                datapoints from the train set and from the eval set. The subsample is drawn once, so the epochs are
+                comparable.
+            eval_batch_size (int, optional): The amount of datapoints to forward at once when evaluating, which
+                bounds the memory used. If None, forwards each set at once.
+            patience (int, optional): If not None, stops training when `monitor` has not improved for this many
+                evaluations in a row.
+            monitor (str): The metric used by `patience` and `restore_best`. One of "val_loss", "val_accuracy",
+                "train_loss" and "train_accuracy". Losses improve by decreasing, and accuracies by increasing.
+            min_delta (float): The smallest change in `monitor` that counts as an improvement.
+            restore_best (bool): If True, keeps a copy of the parameters from the evaluation where `monitor` was best,
+                and restores them when training ends.
+            max_seconds (float, optional): If not None, stops training after the first epoch that ends more than this
+                many seconds after training started.
+            loss_gradient (str): The loss whose gradient is backpropagated, one of `LOSS_GRADIENTS`.
+                "squared_error" uses z(L) - y as the delta of the last layer. "cross_entropy" uses softmax(z(L)) - y,
+                the gradient of `softmax_cross_entropy()`, computed without one-hot targets or extra temporaries.
+                The last activation function should then be `IdentityActivation`. Kept in `self.loss_gradient`.
+            profiler (TrainingProfiler, optional): If not None, records the time of each phase, the throughput and
+                FLOP estimates of every epoch in `profiler.history`, see `profiling.py`.
+            callbacks (list of Callback, optional): Callbacks that are called at the start and end of training and
+                after every minibatch and epoch, see `callbacks.py`. Training prints nothing by default, pass
+                `[ConsoleLogger()]` to print the progress.
+            micro_batch_size (int, optional): If not None, minibatches with more datapoints than this are split into
+                micro-batches, whose gradients are summed before one parameter update (gradient accumulation). The
+                update is the same as for the whole minibatch, but only the activations of one micro-batch are held
+                in memory, so large minibatches can be trained with little memory. Kept in `self.micro_batch_size`.
+            max_memory_bytes (int, optional): If not None, sets `micro_batch_size` to the largest micro-batch whose
+                activations, deltas and input rows are estimated to fit in this many bytes (see
+                `_training_bytes_per_datapoint()`). If both are given, the smaller micro-batch is used.
+            checkpoint_every (int or str, optional): If not None, trains with gradient checkpointing: the forward
+                pass only keeps the weighted sums of every `checkpoint_every`-th layer, and backpropagation recomputes
+                the layers in between one segment at a time (see `_checkpointed_gradients()`). Trades about one extra
+                forward pass for activation memory, for deep networks. "sqrt" uses sqrt(L) layers per segment for L
+                weight layers. The workspace is not used. Kept in `self.checkpoint_every`.
+
+        The metrics are recorded in `self.history`, a structured array with one row per epoch (see
+        `_allocate_history()`), with `self.train_losses`, `self.val_losses`, `self.epoch_times` (the seconds spent
+        training in each epoch, without evaluation) and so on as views of its fields. The losses and accuracies of
+        epochs that are not evaluated or not run stay NaN. Also sets `self.n_epochs_run`, the amount of epochs run,
+        `self.stop_reason`, which is None, "patience", "callback" (a callback set `self.stop_training` to True in
+        `on_epoch_end()`) or "time", and `self.best_epoch`, the epoch where `monitor` was best (None if neither
+        `patience` nor `restore_best` is used).
         """
-        # Initialize losses and accuracies
-        self.train_losses = np.zeros(n_epochs)
-        self.train_accuracies = np.zeros(n_epochs)
+        if loss_gradient not in LOSS_GRADIENTS:
+            message = f"Argument `loss_gradient` must be in {LOSS_GRADIENTS}. "
+            message += f"Was {loss_gradient}. "
+            raise ValueError(message)
+        self.loss_gradient = loss_gradient
+        if not _is_positive_integer(eval_every):
+            raise ValueError(f"Argument `eval_every` must be a positive integer. Was {eval_every}. ")
+
+        if max_memory_bytes is not None:
+            bytes_per_datapoint = _training_bytes_per_datapoint(self.layer_sizes, self.dtype)
+            if max_memory_bytes < bytes_per_datapoint:
+                message = f"Argument `max_memory_bytes` must fit at least one datapoint ({bytes_per_datapoint} bytes). "
+                message += f"Was {max_memory_bytes}. "
+                raise ValueError(message)
+            memory_batch_size = int(max_memory_bytes // bytes_per_datapoint)
+            if micro_batch_size is None or memory_batch_size < micro_batch_size:
+                micro_batch_size = memory_batch_size
+        if micro_batch_size is not None and not _is_positive_integer(micro_batch_size):
+            raise ValueError(f"Argument `micro_batch_size` must be a positive integer. Was {micro_batch_size}. ")
+        self.micro_batch_size = micro_batch_size
+        if micro_batch_size is not None:
+            self.gradient_sum = np.zeros_like(self.gradients)
+
+        if checkpoint_every == "sqrt":
+            checkpoint_every = max(1, int(round(np.sqrt(self.n_layers - 1))))
+        if checkpoint_every is not None and not _is_positive_integer(checkpoint_every):
+            message = "Argument `checkpoint_every` must be a positive integer or \"sqrt\". "
+            message += f"Was {checkpoint_every}. "
+            raise ValueError(message)
+        self.checkpoint_every = checkpoint_every
+
+        # Initialize losses and accuracies. Epochs that are not evaluated stay NaN
+        self._allocate_history(n_epochs, use_val=eval_set is not None)
+        callbacks = [] if callbacks is None else list(callbacks)
+
+        if _is_sparse(x_train):  # Minibatches are gathered by rows, which needs CSR
+            x_train = x_train.tocsr()
+        if eval_set is not None and _is_sparse(eval_set[0]):
+            eval_set = (eval_set[0].tocsr(), eval_set[1])
+
+        # Draw the evaluation subsamples once
+        rng = np.random.default_rng(seed=self.seed)
+        x_train_eval, y_train_eval = _subsample_rows(x_train, y_train, n_samples=eval_subsample, rng=rng)
         if eval_set is not None:
-            self.val_losses = np.zeros(n_epochs)
-            self.val_accuracies = np.zeros(n_epochs)
-
-        y_train_one_hot = integer_one_hot_encode(y_train, max_int=9)
-        for n_epoch in range(n_epochs):
-            print(f"Epoch number [{n_epoch + 1} / {n_epochs}]")
-            self._run_single_epoch(x_train=x_train, y_train=y_train_one_hot, minibatch_size=minibatch_size, eta=eta)
-            self._perform_evaluation(
-                x_train=x_train,
-                y_train=y_train,
-                loss_func=loss_func,
-                accuracy_func=accuracy_func,
-                n_epoch=n_epoch,
-                eval_set=eval_set,
+            eval_set = _subsample_rows(*eval_set, n_samples=eval_subsample, rng=rng)
+
+        if batch_iterator is None:
+            # The integer targets are used directly, see `_backprop()`
+            _check_integer_targets(y_train, n_classes=self.layer_sizes[-1])
+            batch_iterator = MinibatchIterator(
+                x_data=x_train,
+                y_data=y_train,
+                batch_size=minibatch_size,
+                shuffle=shuffle,
+                drop_last=drop_last,
+                prefetch=prefetch,
+                seed=self._shuffle_seed(),
             )
+
+        self.optimizer = None if optimizer is None else get_optimizer(optimizer)
+        if self.optimizer is not None:
+            self.optimizer.initialize([self.parameters])
+
+        batch_size = getattr(batch_iterator, "batch_size", None)
+        if batch_size is not None and micro_batch_size is not None:
+            batch_size = min(batch_size, micro_batch_size)  # Only one micro-batch is forwarded at a time
+        if use_workspace and batch_size is not None and checkpoint_every is None:
+            self.allocate_workspace(batch_size)
+
+        monitoring = patience is not None or restore_best
+        if monitoring:
+            history, sign = self._get_monitored_history(monitor, use_val=eval_set is not None)
+            best_score = np.inf
+            n_bad_evaluations = 0
+            best_parameters = self.parameters.copy() if restore_best else None
+        self.best_epoch = None
+
+        self.n_epochs_run = 0
+        self.stop_reason = None
+        self.stop_training = False
+        if profiler is not None:
+            profiler.start(self, n_epochs)
+        for callback in callbacks:
+            callback.on_train_begin(self, n_epochs)
+        train_start_time = time.perf_counter()
+        try:
+            for n_epoch in range(n_epochs):
+                if profiler is not None:
+                    profiler.start_epoch(n_epoch)
+                start_time = time.perf_counter()
+                self._run_single_epoch(batches=batch_iterator, eta=eta, profiler=profiler, callbacks=callbacks)
+                self.epoch_times[n_epoch] = time.perf_counter() - start_time
+                self.n_epochs_run = n_epoch + 1
+                self.n_epochs_trained += 1
+                if profiler is not None:
+                    profiler.end_epoch()
+
+                out_of_time = max_seconds is not None and time.perf_counter() - train_start_time > max_seconds
+                if (n_epoch + 1) % eval_every == 0 or n_epoch == n_epochs - 1 or out_of_time:
+                    eval_start_time = time.perf_counter()
+                    self._perform_evaluation(
+                        x_train=x_train_eval,
+                        y_train=y_train_eval,
+                        loss_func=loss_func,
+                        accuracy_func=accuracy_func,
+                        n_epoch=n_epoch,
+                        eval_set=eval_set,
+                        eval_batch_size=eval_batch_size,
+                    )
+                    if profiler is not None:
+                        profiler.record("evaluation", eval_start_time, time.perf_counter())
+
+                    if monitoring:
+                        score = sign * history[n_epoch]  # Lower is better
+                        if score < best_score - min_delta:
+                            best_score = score
+                            n_bad_evaluations = 0
+                            self.best_epoch = n_epoch
+                            if restore_best:
+                                best_parameters[...] = self.parameters
+                        else:
+                            n_bad_evaluations += 1
+                        if patience is not None and n_bad_evaluations >= patience:
+                            self.stop_reason = "patience"
+
+                for callback in callbacks:
+                    callback.on_epoch_end(self, n_epoch, self.history[n_epoch])
+                if self.stop_reason is None and self.stop_training:
+                    self.stop_reason = "callback"
+                if self.stop_reason is None and out_of_time:
+                    self.stop_reason = "time"
+                if self.stop_reason is not None:
+                    break
+        finally:
+            self.release_workspace()  # Outputs of `forward()` after training should not be overwritten
+
+        if restore_best and self.best_epoch is not None:
+            self.parameters[...] = best_parameters
+        for callback in callbacks:
+            callback.on_train_end(self)
+
+    def _get_monitored_history(self, monitor, use_val):
+        """
+        Finds the history array of a metric, for early stopping.
+
+        Arguments:
+            monitor (str): One of "val_loss", "val_accuracy", "train_loss" and "train_accuracy".
+            use_val (bool): If the validation metrics are recorded, that is, if `train()` has an `eval_set`.
+
+        Returns:
+            np.array: The history array, like `self.val_losses`.
+            int: 1 if lower values are better, -1 if higher values are better.
+        """
+        histories = {"train_loss": "train_losses", "train_accuracy": "train_accuracies"}
+        if use_val:
+            histories.update(val_loss="val_losses", val_accuracy="val_accuracies")
+        if monitor not in histories:
+            message = f"Argument `monitor` must be in {list(histories)}. "
+            message += f"Was {monitor}. "
+            if monitor.startswith("val_"):
+                message += "Validation metrics need `eval_set`. "
+            raise ValueError(message)
+        return getattr(self, histories[monitor]), 1 if monitor.endswith("loss") else -1